@@ -0,0 +1,113 @@
+"""
+청킹 방식 벤치마크
+글자 수 기준 청킹(chunk_size=1000) 대비 토큰 기준 청킹(모델 입력 창 크기)의 낭비 토큰 비교
+낭비 토큰: 토크나이즈했지만 max_seq_length를 넘어 잘려서 인코딩되지 않는 토큰
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+
+from langchain.schema import Document
+from preprocessing.text_chunker import KoreanTextChunker
+from rag.embedding_engine import KoreanEmbeddingEngine
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+PDF_DIRS = ["도로설계요령(2020)", "실무지침(2020)"]
+
+
+def load_pages(args) -> list:
+    """벤치마크용 페이지 (PDF 폴더의 앞쪽 페이지 또는 합성 텍스트)"""
+    pdf_files = sorted(
+        os.path.join(directory, name)
+        for directory in PDF_DIRS if os.path.exists(directory)
+        for name in os.listdir(directory) if name.endswith('.pdf')
+    )
+    if pdf_files:
+        from preprocessing.document_loader import DocumentLoader
+        loader = DocumentLoader()
+        pages = []
+        for file_path in pdf_files:
+            for page in loader.iter_pdf(file_path):
+                pages.append(page)
+                if len(pages) >= args.max_pages:
+                    return pages
+        return pages
+
+    rng = np.random.default_rng(args.seed)
+    words = ["도로", "설계속도", "차로폭", "곡선반경", "편경사", "정지시거", "교차로", "길어깨",
+             "중앙분리대", "종단경사", "배수시설", "포장", "교량", "터널", "은", "는", "을",
+             "고려하여", "결정한다", "이상으로", "한다", "적용한다", "다만", "경우에는"]
+    pages = []
+    for i in range(args.max_pages):
+        paragraphs = ["\n".join(" ".join(rng.choice(words, int(rng.integers(8, 30)))) + "."
+                                for _ in range(int(rng.integers(2, 6))))
+                      for _ in range(int(rng.integers(2, 5)))]
+        pages.append(Document(page_content="\n\n".join(paragraphs),
+                              metadata={'file_name': 'synthetic.pdf', 'page': i}))
+    return pages
+
+
+def measure(name: str, chunker: KoreanTextChunker, pages: list, count_tokens, window: int) -> dict:
+    """청크별 토큰 수로 낭비 토큰 / 입력 창 사용률 계산"""
+    start = time.perf_counter()
+    chunks = chunker.chunk_documents(pages)
+    seconds = time.perf_counter() - start
+
+    tokens = np.array([count_tokens(chunk.page_content) for chunk in chunks], dtype=np.int64)
+    encoded = np.minimum(tokens, window)
+    return {
+        'name': name,
+        'chunks': len(chunks),
+        'tokens': int(tokens.sum()),
+        'wasted': int((tokens - encoded).sum()),
+        'truncated_chunks': int(np.count_nonzero(tokens > window)),
+        'fill': float(encoded.mean() / window) if len(chunks) else 0.0,
+        'seconds': seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="청킹 방식 벤치마크 (낭비 토큰 / 입력 창 사용률)")
+    parser.add_argument('--max-pages', type=int, default=200, help='사용할 페이지 수 (PDF가 없으면 합성)')
+    parser.add_argument('--char-sizes', type=int, nargs='+', default=[1000],
+                        help='비교할 글자 수 기준 chunk_size (overlap은 20%%)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    engine = KoreanEmbeddingEngine(use_cache=False)
+    window = engine.max_chunk_tokens
+    count_tokens = engine.token_length_function()
+    print(f"페이지: {len(pages)}개, 모델 입력 창: {window}토큰 (특수 토큰 제외)")
+
+    results = [
+        measure(f"글자 {size}", KoreanTextChunker(chunk_size=size, chunk_overlap=size // 5), pages,
+                count_tokens, window)
+        for size in args.char_sizes
+    ]
+    # 측정용 캐시와 분리된 길이 함수 (청킹 시간에 측정 결과 캐시가 섞이지 않도록)
+    token_chunker = KoreanTextChunker(chunk_size=window, chunk_overlap=window // 5,
+                                      length_function=engine.token_length_function())
+    results.append(measure(f"토큰 {window}", token_chunker, pages, count_tokens, window))
+
+    print("="*86)
+    print(f"{'청킹 방식':<12} {'청크':>7} {'토큰':>10} {'낭비 토큰':>10} {'낭비율':>8} "
+          f"{'잘린 청크':>10} {'창 사용률':>9} {'청킹(초)':>9}")
+    print("-"*86)
+    for r in results:
+        ratio = r['wasted'] / r['tokens'] if r['tokens'] else 0.0
+        print(f"{r['name']:<12} {r['chunks']:>7} {r['tokens']:>10} {r['wasted']:>10} {ratio:>8.1%} "
+              f"{r['truncated_chunks']:>10} {r['fill']:>9.1%} {r['seconds']:>9.2f}")
+    print("="*86)
+    print("낭비 토큰은 토크나이즈되지만 모델 입력 창을 넘어 잘리는 토큰 (검색에 반영되지 않는 청크 뒷부분)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
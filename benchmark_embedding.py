@@ -0,0 +1,137 @@
+"""
+임베딩 배치 방식 / 추론 백엔드 벤치마크
+고정 배치(batch_size=32, 입력 순서) 대비 길이별 토큰 예산 배치의 처리량(청크/초) 측정
+--backends 지정 시 torch 대비 ONNX / int8 백엔드의 임베딩 코사인 일치도, 검색 결과 일치율, 속도 비교
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+
+from rag.embedding_engine import KoreanEmbeddingEngine
+from rag.document_store import DocumentStore
+from rag.vector_database import VectorDatabase
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def load_texts(args) -> list:
+    """벤치마크용 청크 (저장된 벡터 DB 문서 또는 제목/본문이 섞인 합성 텍스트)"""
+    store_dir = os.path.join(VectorDatabase.snapshot_dir(args.storage_dir, args.db_prefix),
+                             f"{args.db_prefix}_store")
+    if DocumentStore.exists(store_dir):
+        documents, _ = DocumentStore.open(store_dir)
+        return [documents[i] for i in range(min(args.num_texts, len(documents)))]
+
+    rng = np.random.default_rng(args.seed)
+    words = ["도로", "설계속도", "차로폭", "곡선반경", "편경사", "정지시거", "교차로", "길어깨",
+             "중앙분리대", "종단경사", "배수시설", "포장", "교량", "터널", "은", "는", "을",
+             "고려하여", "결정한다", "이상으로", "한다", "적용한다", "다만", "경우에는"]
+    texts = []
+    for _ in range(args.num_texts):
+        # 제목(짧음)과 본문 청크(최대 chunk_size 글자)가 섞인 분포
+        n_words = int(rng.integers(2, 8)) if rng.random() < args.short_ratio else int(rng.integers(100, 250))
+        text = " ".join(rng.choice(words, n_words))
+        texts.append(text[:args.chunk_size])
+    return texts
+
+
+def run(engine: KoreanEmbeddingEngine, texts: list, bucketing: bool, repeat: int):
+    """(임베딩, 청크/초) - repeat회 중 가장 빠른 실행 기준"""
+    engine.length_bucketing = bucketing
+    best = float('inf')
+    embeddings = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = engine.encode_texts(texts, show_progress=False)
+        best = min(best, time.perf_counter() - start)
+    return embeddings, len(texts) / best
+
+
+def query_latency(engine: KoreanEmbeddingEngine, queries: list) -> float:
+    """단일 질의 임베딩 지연 시간 중앙값(ms)"""
+    engine.encode_queries(queries[:1])  # 준비 실행
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        engine.encode_queries([query])
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def compare_backends(args, texts: list, reference: KoreanEmbeddingEngine):
+    """torch 백엔드 대비 코사인 일치도 / top-k 검색 결과 일치율 / 처리량 / 질의 지연"""
+    queries = texts[:args.num_queries]
+    rows = {}
+    for backend in ['torch'] + [b for b in args.backends if b != 'torch']:
+        engine = reference if backend == 'torch' else KoreanEmbeddingEngine(use_cache=False, backend=backend)
+        embeddings, rate = run(engine, texts, True, args.repeat)
+        rows[backend] = (embeddings, rate, query_latency(engine, queries))
+
+    base_embeddings, base_rate, base_latency = rows['torch']
+    k = min(args.top_k, len(texts))
+    # 앞쪽 청크를 질의로 사용해 top-k 이웃 비교
+    base_top = np.argsort(-(base_embeddings[:len(queries)] @ base_embeddings.T), axis=1)[:, :k]
+
+    print("="*78)
+    print(f"{'백엔드':<12} {'코사인 평균':>10} {'코사인 최소':>10} {f'top-{k} 일치':>10} "
+          f"{'청크/초':>9} {'향상':>7} {'질의 ms':>9}")
+    print("-"*78)
+    for backend, (embeddings, rate, latency) in rows.items():
+        cosine = np.sum(embeddings * base_embeddings, axis=1)
+        top = np.argsort(-(embeddings[:len(queries)] @ embeddings.T), axis=1)[:, :k]
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, base_top)])
+        print(f"{backend:<12} {cosine.mean():>10.5f} {cosine.min():>10.5f} {overlap:>10.1%} "
+              f"{rate:>9.1f} {rate / base_rate:>6.2f}x {latency:>9.2f}")
+    print("="*78)
+    print("코사인은 같은 청크의 torch 임베딩과의 코사인 유사도 (정규화 벡터 내적)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="임베딩 배치 방식 벤치마크 (처리량 청크/초)")
+    parser.add_argument('--storage-dir', default='./vector_store')
+    parser.add_argument('--db-prefix', default='road_design_db',
+                        help='문서를 읽을 벡터 DB (없으면 합성 텍스트 사용)')
+    parser.add_argument('--num-texts', type=int, default=2000)
+    parser.add_argument('--short-ratio', type=float, default=0.3, help='합성 텍스트 중 제목 비율')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--token-budgets', type=int, nargs='+', default=[4096, 8192, 16384])
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backends', nargs='*', default=[], choices=['torch', 'onnx', 'onnx_int8'],
+                        help='torch와 비교할 추론 백엔드 (예: --backends onnx onnx_int8)')
+    parser.add_argument('--num-queries', type=int, default=100, help='백엔드 비교용 질의 수')
+    parser.add_argument('--top-k', type=int, default=10)
+    args = parser.parse_args()
+
+    texts = load_texts(args)
+    # 캐시가 적중하면 인코딩 시간이 측정되지 않으므로 캐시 없이 실행
+    engine = KoreanEmbeddingEngine(use_cache=False)
+    lengths = engine._token_lengths(texts)
+    print(f"청크: {len(texts)}개, 토큰 수 중앙값 {int(np.median(lengths))} / 최대 {int(lengths.max())}")
+
+    baseline, baseline_rate = run(engine, texts, False, args.repeat)
+    print("="*60)
+    print(f"{'배치 방식':<22} {'청크/초':>10} {'향상':>8} {'최대 오차':>12}")
+    print("-"*60)
+    print(f"{'고정 32 (입력 순서)':<22} {baseline_rate:>10.1f} {'1.00x':>8} {'-':>12}")
+    for budget in args.token_budgets:
+        engine.batch_token_budget = budget
+        embeddings, rate = run(engine, texts, True, args.repeat)
+        error = float(np.abs(embeddings - baseline).max())
+        print(f"{f'길이별 (예산 {budget})':<22} {rate:>10.1f} {rate / baseline_rate:>7.2f}x {error:>12.2e}")
+    print("="*60)
+    print("최대 오차는 고정 배치 결과와의 임베딩 원소별 최대 차이 (패딩 차이에 의한 수치 오차)")
+
+    if args.backends:
+        engine.batch_token_budget = 8192
+        compare_backends(args, texts, engine)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
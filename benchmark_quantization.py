@@ -0,0 +1,115 @@
+"""
+벡터 저장 방식 벤치마크
+float32(flat) 대비 sq8 / sq_fp16 / ivf_pq 인덱스의 메모리 절감량과 recall 손실 측정
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import logging
+
+import faiss
+import numpy as np
+
+from rag.vector_database import VectorDatabase
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def load_vectors(args) -> np.ndarray:
+    """벤치마크용 벡터 (저장된 임베딩 .npy 또는 군집 구조의 합성 데이터)"""
+    if args.embeddings:
+        vectors = np.load(args.embeddings, mmap_mode='r')
+        return np.ascontiguousarray(vectors[:args.num_vectors], dtype='float32')
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((max(args.num_vectors // 100, 1), args.dimension))
+    labels = rng.integers(0, len(centers), args.num_vectors)
+    vectors = centers[labels] + 0.3 * rng.standard_normal((args.num_vectors, args.dimension))
+    return vectors.astype('float32')
+
+
+def build_database(ann_type: str, vectors: np.ndarray, storage_dir: str) -> VectorDatabase:
+    index_params = {}
+    if ann_type == 'ivf_pq':
+        # 서브 양자화기 수는 차원의 약수여야 함
+        index_params['pq_m'] = max(m for m in range(1, 49) if vectors.shape[1] % m == 0)
+    db = VectorDatabase(vectors.shape[1], storage_dir=storage_dir,
+                        ann_type=ann_type, index_params=index_params)
+    documents = [f"doc_{i}" for i in range(len(vectors))]
+    metadatas = [{} for _ in range(len(vectors))]
+    db.add_documents(vectors, metadatas, documents)
+    db.train_index()
+    # merge_threshold 미만의 대기 벡터는 인덱스 밖에 있으므로 메모리 측정 전에 병합
+    db._merge_pending()
+    assert db.index.ntotal == len(vectors), f"인덱스 벡터 수 불일치: {db.index.ntotal} != {len(vectors)}"
+    return db
+
+
+def run_queries(db: VectorDatabase, queries: np.ndarray, k: int):
+    """(질의별 결과 ID 리스트, 질의당 평균 지연 ms)"""
+    start = time.perf_counter()
+    results = db.search_batch(queries, k=k)
+    elapsed = (time.perf_counter() - start) * 1000 / len(queries)
+    return [[int(r['vector_id']) for r in row] for row in results], elapsed
+
+
+def recall_at_k(truth, found, k: int) -> float:
+    hits = [len(set(t[:k]) & set(f[:k])) / k for t, f in zip(truth, found)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="양자화 벡터 저장 벤치마크 (메모리 절감 / recall 손실)")
+    parser.add_argument('--embeddings', help='임베딩 .npy 파일 (없으면 합성 데이터 사용)')
+    parser.add_argument('--num-vectors', type=int, default=20000)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ann-types', nargs='+', default=['sq_fp16', 'sq8', 'ivf_pq'])
+    parser.add_argument('--rerank-factors', type=int, nargs='+', default=[0, 2, 4])
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    rng = np.random.default_rng(args.seed + 1)
+    query_ids = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = vectors[query_ids] + 0.05 * rng.standard_normal(vectors[query_ids].shape).astype('float32')
+
+    print(f"벡터: {len(vectors)}개 × {vectors.shape[1]}차원, 질의: {len(queries)}개, k={args.k}")
+    storage_dir = tempfile.mkdtemp(prefix="quant_bench_")
+    try:
+        baseline = build_database('flat', vectors, os.path.join(storage_dir, 'flat'))
+        baseline_bytes = faiss.serialize_index(baseline.index).nbytes
+        truth, baseline_ms = run_queries(baseline, queries, args.k)
+
+        print("="*78)
+        print(f"{'인덱스':<10} {'재순위':>6} {'메모리(MB)':>11} {'절감':>7} "
+              f"{'recall@k':>9} {'손실':>7} {'지연(ms)':>9}")
+        print("-"*78)
+        print(f"{'flat':<10} {'-':>6} {baseline_bytes / 2**20:>11.1f} {'0.0%':>7} "
+              f"{1.0:>9.4f} {'0.0%':>7} {baseline_ms:>9.3f}")
+
+        for ann_type in args.ann_types:
+            db = build_database(ann_type, vectors, os.path.join(storage_dir, ann_type))
+            # 재순위화용 float32 원본은 mmap 파일이므로 상주 메모리에서 제외
+            index_bytes = faiss.serialize_index(db.index).nbytes
+            saved = 1.0 - index_bytes / baseline_bytes
+            for rerank_factor in args.rerank_factors:
+                db.set_search_params(rerank_factor=rerank_factor)
+                found, elapsed = run_queries(db, queries, args.k)
+                recall = recall_at_k(truth, found, args.k)
+                print(f"{ann_type:<10} {rerank_factor:>6} {index_bytes / 2**20:>11.1f} "
+                      f"{saved:>7.1%} {recall:>9.4f} {1.0 - recall:>7.1%} {elapsed:>9.3f}")
+        print("="*78)
+        print("재순위 0은 양자화 점수만 사용, N은 k×N 후보를 float32 원본(mmap)으로 재계산")
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,10 +4,11 @@ FastAPI 기반 벡터 검색 API 서버
 """
 
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Tuple
 import numpy as np
 from datetime import datetime
 import uvicorn
@@ -18,10 +19,12 @@ import glob
 import fitz  # PyMuPDF
 import io
 import re
+import json
 
 # 로컬 모듈 import
 # from rag.embedding_engine import KoreanEmbeddingEngine  # sentence-transformers 제거로 비활성화
-# from rag.vector_database import VectorDatabase  # 임베딩 엔진 의존성으로 비활성화
+from rag.query_batcher import QueryBatcher
+from rag.vector_database import VectorDatabase  # 키워드 검색(BM25)은 임베딩 엔진 없이 사용
 from pdf_image_renderer import PDFImageRenderer
 
 # 로깅 설정
@@ -51,13 +54,33 @@ app.add_middleware(
 )
 
 # 전역 변수로 검색 엔진 관리
-# embedding_engine = None  # 비활성화
-# vector_db = None  # 비활성화
+embedding_engine = None  # VECTOR_SEARCH=1일 때만 생성 (기본 비활성화, sentence-transformers 제거)
+query_encoder: Optional[QueryBatcher] = None  # 동시 질의 임베딩 마이크로 배치 (엔진이 있을 때만)
+vector_db = None
 pdf_renderer = None
 
+# 벡터 DB 저장 위치
+VECTOR_STORE_DIR = "./vector_store"
+VECTOR_DB_PREFIX = "road_design_db"
+# 인덱스를 읽기 전용 mmap으로 로드 (여러 uvicorn 워커가 페이지 캐시 공유)
+VECTOR_DB_MMAP = os.getenv("VECTOR_DB_MMAP", "1") == "1"
+# 검색 결과 캐시 크기 / 유효 시간(초) (0이면 캐시 사용 안 함)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+# 질의 임베딩 마이크로 배치: 최대 배치 크기 / 첫 질의 후 추가 질의를 기다리는 시간(ms)
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+# 벡터 검색 사용: 임베딩 모델을 백그라운드에서 로드 (로드 중에도 키워드/PDF 엔드포인트는 바로 응답)
+VECTOR_SEARCH = os.getenv("VECTOR_SEARCH", "0") == "1"
+
 # ======================== 고급 텍스트 추출 및 스코어링 함수 ========================
 
-def extract_text_by_characters(text: str, keywords: List[str], char_radius: int = 50) -> str:
+# 키워드 위치 함수: (텍스트, 키워드 리스트) -> [시작, 끝) 구간 리스트
+# (vector_db.locate_keywords를 넘기면 띄어쓰기/오타가 다른 표기도 찾음)
+KeywordLocator = Callable[[str, List[str]], List[Tuple[int, int]]]
+
+def extract_text_by_characters(text: str, keywords: List[str], char_radius: int = 50,
+                               locate: Optional[KeywordLocator] = None) -> str:
     """
     청크 내에서 키워드가 포함된 글자 범위만 추출하는 함수
     
@@ -65,6 +88,7 @@ def extract_text_by_characters(text: str, keywords: List[str], char_radius: int
         text: 원본 텍스트
         keywords: 검색할 키워드 리스트
         char_radius: 주변 글자 수 (기본 50자)
+        locate: 키워드 위치 함수 (없으면 대소문자 무시 정확 일치)
     
     Returns:
         키워드가 포함된 글자 범위의 추출된 텍스트
@@ -76,15 +100,18 @@ def extract_text_by_characters(text: str, keywords: List[str], char_radius: int
     keyword_positions = []
     text_lower = text.lower()
     
-    for keyword in keywords:
-        keyword_lower = keyword.lower()
-        start = 0
-        while True:
-            pos = text_lower.find(keyword_lower, start)
-            if pos == -1:
-                break
-            keyword_positions.append((pos, pos + len(keyword)))
-            start = pos + 1
+    if locate is not None:
+        keyword_positions = locate(text, keywords)
+    else:
+        for keyword in keywords:
+            keyword_lower = keyword.lower()
+            start = 0
+            while True:
+                pos = text_lower.find(keyword_lower, start)
+                if pos == -1:
+                    break
+                keyword_positions.append((pos, pos + len(keyword)))
+                start = pos + 1
     
     if not keyword_positions:
         return text[:500]
@@ -99,7 +126,7 @@ def extract_text_by_characters(text: str, keywords: List[str], char_radius: int
     extracted_lower = extracted.lower()
     keyword_count = 0
     for keyword in keywords:
-        if keyword.lower() in extracted_lower:
+        if locate(extracted, [keyword]) if locate is not None else keyword.lower() in extracted_lower:
             keyword_count += 1
     
     # 키워드가 충분히 포함되지 않으면 범위 확장
@@ -118,13 +145,15 @@ def extract_text_by_characters(text: str, keywords: List[str], char_radius: int
     
     return extracted
 
-def calculate_keyword_score(extracted_text: str, input_keywords: List[str]) -> float:
+def calculate_keyword_score(extracted_text: str, input_keywords: List[str],
+                            locate: Optional[KeywordLocator] = None) -> float:
     """
     추출된 텍스트에서 입력 키워드들의 포함 비율을 계산하는 함수
     
     Args:
         extracted_text: 검증할 텍스트
         input_keywords: 사용자가 입력한 키워드 리스트
+        locate: 키워드 위치 함수 (없으면 대소문자 무시 정확 일치)
     
     Returns:
         키워드 포함 비율 (0.0 ~ 100.0, 소수점 첫째 자리까지)
@@ -136,13 +165,14 @@ def calculate_keyword_score(extracted_text: str, input_keywords: List[str]) -> f
     found_keywords = 0
     
     for keyword in input_keywords:
-        if keyword.lower() in extracted_lower:
+        if locate(extracted_text, [keyword]) if locate is not None else keyword.lower() in extracted_lower:
             found_keywords += 1
     
     score = (found_keywords / len(input_keywords)) * 100
     return round(score, 1)
 
-def extract_sentences_with_keywords(text: str, keywords: List[str], context_sentences: int = 0) -> str:
+def extract_sentences_with_keywords(text: str, keywords: List[str], context_sentences: int = 0,
+                                    locate: Optional[KeywordLocator] = None) -> str:
     """
     청크 내에서 키워드가 포함된 문장들만 추출하는 함수
 
@@ -150,6 +180,7 @@ def extract_sentences_with_keywords(text: str, keywords: List[str], context_sent
         text: 원본 텍스트
         keywords: 검색할 키워드 리스트
         context_sentences: 전후 문장 개수 (0-3)
+        locate: 키워드 위치 함수 (없으면 대소문자 무시 정확 일치)
 
     Returns:
         키워드가 포함된 문장들과 문맥이 포함된 텍스트
@@ -177,6 +208,10 @@ def extract_sentences_with_keywords(text: str, keywords: List[str], context_sent
     # 4단계: 키워드가 포함된 문장들만 찾기
     keyword_sentences = []
     for i, sentence in enumerate(processed_sentences):
+        if locate is not None:
+            if locate(sentence, keywords):
+                keyword_sentences.append((i, sentence))
+            continue
         sentence_lower = sentence.lower()
         for keyword in keywords:
             if keyword.lower() in sentence_lower:
@@ -231,6 +266,11 @@ class SearchRequest(BaseModel):
     sentence_context: int = Field(0, description="전후 문장 개수 (0-3)", ge=0, le=3)
     full_sentences: bool = Field(False, description="키워드 포함 문장 전체 표시")
     document_filter: str = Field("all", description="문서 필터: all, 도로설계요령, 실무지침")
+    file_filter: Optional[List[str]] = Field(None, description="파일명 필터 (file_name 일치)")
+    section_filter: Optional[str] = Field(None, description="섹션 필터 (section에 포함된 문자열)")
+    proximity: Optional[int] = Field(None, description="근접 검색: 모든 키워드가 N글자 이내에 나타나는 문서만", ge=0, le=1000)
+    fuzzy: bool = Field(False, description="띄어쓰기가 다르거나 자모 1개가 틀린 표기도 매칭")
+    collapse_duplicates: bool = Field(False, description="거의 같은 청크는 가장 높은 결과 하나만 표시")
     # 고급 검색 기능 추가
     granularity: str = Field("sentence", description="검색 단위: sentence, char")
     radius: int = Field(1, description="주변 범위: 문장(1-3), 글자(30-100)", ge=1, le=100)
@@ -245,6 +285,7 @@ class SearchResult(BaseModel):
     # 고급 검색 결과 필드 추가
     extracted_text: Optional[str] = None
     keyword_score: Optional[float] = None
+    duplicates: Optional[int] = None  # collapse_duplicates로 접힌 중복 청크 수
 
 class SearchResponse(BaseModel):
     """검색 응답 모델"""
@@ -261,6 +302,13 @@ class DatabaseStats(BaseModel):
     index_type: str
     total_searches: int
     last_search: Optional[str]
+    load_timings: Optional[Dict[str, float]] = None
+    query_cache: Optional[Dict[str, Any]] = None
+    query_encoder: Optional[Dict[str, Any]] = None  # 질의 배치 크기 / 큐 대기 시간
+    model_name: Optional[str] = None  # DB를 만든 임베딩 모델 (엔진이 없어도 정보 파일 기준)
+    status: str = "operational"
+    vector_search: str = "disabled"  # ready / loading / failed / disabled
+    model: Optional[Dict[str, Any]] = None  # 임베딩 엔진 정보 (VECTOR_SEARCH=1일 때만)
 
 class ImageRequest(BaseModel):
     """이미지 요청 모델"""
@@ -279,16 +327,99 @@ class ImageResponse(BaseModel):
 
 # ======================== 초기화 함수 ========================
 
+def load_vector_database() -> Optional[VectorDatabase]:
+    """저장된 벡터 DB 로드 (키워드 검색용, 임베딩 모델 불필요)"""
+    info = VectorDatabase.read_info(VECTOR_STORE_DIR, VECTOR_DB_PREFIX)
+    if info is None:
+        logger.warning(f"벡터 DB 정보 파일이 없음: {VECTOR_STORE_DIR}/{VECTOR_DB_PREFIX}")
+        return None
+
+    db = VectorDatabase(
+        dimension=info['dimension'],
+        index_type=info.get('index_type', 'cosine'),
+        storage_dir=VECTOR_STORE_DIR,
+        mmap_index=VECTOR_DB_MMAP,
+        cache_size=QUERY_CACHE_SIZE,
+        cache_ttl=QUERY_CACHE_TTL
+    )
+    if not db.load_database(VECTOR_DB_PREFIX):
+        return None
+    logger.info(f"벡터 DB 로드 시간: {db.get_stats()['load_timings']}")
+    return db
+
+def create_embedding_engine(db: VectorDatabase):
+    """벡터 DB를 만든 모델로 임베딩 엔진 생성 (모델은 백그라운드에서 로드)
+
+    차원과 모델 식별자는 DB 정보 파일에서 읽으므로 시작 시 모델 로드를 기다리지 않는다.
+    """
+    try:
+        from rag.embedding_engine import KoreanEmbeddingEngine
+    except ImportError as e:
+        logger.warning(f"임베딩 엔진을 사용할 수 없음 (벡터 검색 비활성화): {e}")
+        return None
+
+    model_name, _, backend = (db.embedding_model or "jhgan/ko-sroberta-multitask").partition('#')
+    engine = KoreanEmbeddingEngine(
+        model_name=model_name,
+        backend=backend or "torch",
+        use_cache=False,
+        lazy_load=True,
+        dimension=db.dimension
+    )
+    engine.load_in_background()
+    return engine
+
+def readiness() -> Dict[str, str]:
+    """서비스별 준비 상태 (ready / loading / failed / disabled / not_configured / unavailable)"""
+    if embedding_engine is not None:
+        vector_status = embedding_engine.status
+    else:
+        vector_status = "disabled"
+    if vector_db is not None:
+        keyword_status = "ready"
+    else:
+        try:
+            configured = VectorDatabase.read_info(VECTOR_STORE_DIR, VECTOR_DB_PREFIX) is not None
+        except (OSError, ValueError):
+            configured = True
+        # 저장된 DB가 없는 배포는 예시 결과로 응답, DB가 있는데 로드하지 못했으면 failed
+        keyword_status = "failed" if configured else "not_configured"
+    return {
+        "keyword_search": keyword_status,
+        "pdf_rendering": "ready" if pdf_renderer is not None else "unavailable",
+        "vector_search": vector_status
+    }
+
+def require_embedding_engine():
+    """벡터 검색 엔드포인트 사전 확인 (모델 로드 전이면 503)"""
+    if vector_db is None or embedding_engine is None:
+        raise HTTPException(status_code=503, detail="시스템이 준비되지 않았습니다")
+    if not embedding_engine.is_ready:
+        raise HTTPException(status_code=503, detail=f"임베딩 모델 준비 중입니다 ({embedding_engine.status})",
+                            headers={"Retry-After": "5"})
+
 @app.on_event("startup")
 async def startup_event():
     """서버 시작시 벡터 DB 및 PDF 렌더러 로드"""
-    global pdf_renderer
+    global pdf_renderer, vector_db, query_encoder, embedding_engine
 
     try:
         logger.info("벡터 검색 시스템 초기화 중...")
 
-        # 임베딩 엔진 및 벡터 DB 비활성화 (sentence-transformers 제거로 인해)
-        logger.info("벡터 검색 기능 비활성화 (키워드 검색만 지원)")
+        # 키워드 검색(BM25)용 벡터 DB 로드
+        vector_db = load_vector_database()
+        if vector_db is not None:
+            logger.info(f"키워드 검색 DB 로드 완료: {len(vector_db.documents)}개 문서")
+        else:
+            logger.warning("키워드 검색 DB를 로드하지 못함")
+
+        # 임베딩 엔진 (VECTOR_SEARCH=1일 때만, 모델 로드는 기다리지 않음)
+        if VECTOR_SEARCH and vector_db is not None:
+            embedding_engine = create_embedding_engine(vector_db)
+        if embedding_engine is not None:
+            query_encoder = QueryBatcher(embedding_engine, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS)
+        else:
+            logger.info("벡터 검색 기능 비활성화 (키워드 검색만 지원)")
 
         # PDF 이미지 렌더러 초기화
         pdf_renderer = PDFImageRenderer(
@@ -302,6 +433,12 @@ async def startup_event():
         logger.error(f"초기화 실패: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """서버 종료시 질의 배치 작업 정리"""
+    if query_encoder is not None:
+        await query_encoder.stop()
+
 # ======================== API 엔드포인트 ========================
 
 @app.get("/", tags=["기본"])
@@ -313,109 +450,169 @@ async def root():
         "endpoints": {
             "search": "/api/search",
             "stats": "/api/stats",
-            "health": "/health"
+            "health": "/health",
+            "ready": "/health/ready"
         }
     }
 
 @app.get("/health", tags=["기본"])
 async def health_check():
-    """헬스 체크 엔드포인트 (키워드 검색만 지원)"""
+    """헬스 체크 엔드포인트 (liveness: 프로세스가 응답하면 항상 200, 준비 상태는 services에 표시)"""
+    services = readiness()
     return {
         "status": "healthy",
+        "ready": services["keyword_search"] == "ready",
+        "timestamp": datetime.now().isoformat(),
+        "services": services,
+        "message": ("벡터 검색 사용 가능" if services["vector_search"] == "ready"
+                    else "키워드 검색 서비스만 지원됩니다")
+    }
+
+@app.get("/health/ready", tags=["기본"])
+async def readiness_check():
+    """준비 상태 체크 (readiness: 저장된 키워드 검색 DB를 로드하지 못했으면 503)
+
+    저장된 DB가 없는 배포는 예시 결과로 응답하므로 준비된 것으로 본다.
+    벡터 검색 모델은 백그라운드에서 로드되므로 준비 조건에 포함하지 않고 상태만 알린다.
+    """
+    services = readiness()
+    body = {
+        "ready": services["keyword_search"] in ("ready", "not_configured"),
         "timestamp": datetime.now().isoformat(),
-        "services": {
-            "keyword_search": "available",
-            "pdf_rendering": "available",
-            "vector_search": "disabled"
-        },
-        "message": "키워드 검색 서비스만 지원됩니다"
+        "services": services,
+        "model": embedding_engine.get_model_info() if embedding_engine is not None else None
     }
+    if not body["ready"]:
+        return Response(content=json.dumps(body, ensure_ascii=False), status_code=503,
+                        media_type="application/json")
+    return body
 
 @app.post("/api/search", tags=["검색"])
 async def search(request: SearchRequest):
     """
-    문서 검색 API - 키워드 검색만 지원 (벡터 검색 비활성화)
+    문서 검색 API - vector / hybrid 모드는 임베딩 모델이 준비된 경우에만 실행하고,
+    그 외에는 키워드 검색(BM25F)으로 처리한다. 실제 사용한 모드는 mode / search_mode로 반환.
     """
-    # 벡터 검색이 비활성화된 상태에서 키워드 검색만 지원
-    logger.info("키워드 검색 모드로 실행 (벡터 검색 비활성화)")
-
     start_time = datetime.now()
 
     try:
         # 고급 검색 파라미터 로깅
         logger.info(f"Search received - Query: '{request.query}', Mode: '{request.mode}', Filter: '{request.document_filter}', Granularity: '{request.granularity}', Radius: {request.radius}")
         
-        # 키워드 파싱 (최대 5개로 제한)
-        input_keywords = request.keywords or request.query.split()
+        # 키워드 파싱 (큰따옴표로 묶은 부분은 정확한 구문, 최대 5개로 제한)
+        input_keywords = request.keywords or [
+            phrase or word for phrase, word in re.findall(r'"([^"]+)"|(\S+)', request.query)
+        ]
         if len(input_keywords) > 5:
             input_keywords = input_keywords[:5]
             logger.info(f"키워드 5개로 제한: {input_keywords}")
         
-        # 키워드 검색만 지원 (벡터 검색 비활성화)
-        logger.info("키워드 검색 실행 중...")
-        
-        # 임시 더미 데이터 반환 (실제 검색 기능 구현 필요)
-        results = [{
-            'document': f'검색어 "{request.query}"에 대한 결과입니다. 벡터 검색이 비활성화되어 키워드 검색만 지원됩니다.',
-            'metadata': {
-                'file_name': '도로설계요령(2020)/제1권 도로계획및 구조.pdf',
-                'page': 1,
-                'category': '도로설계요령'
-            },
-            'similarity': 0.8,
-            'match_score': 0.8
-        }]
-        logger.info("벡터 검색 비활성화로 인해 더미 데이터 반환")
-
-        # 필터링 로직 (메타데이터의 'category' 기준)
+        # 벡터 검색은 모델 로드가 끝난 뒤에만 사용 (VECTOR_SEARCH=0이거나 로드 중이면 키워드 검색)
+        vector_ready = embedding_engine is not None and embedding_engine.is_ready
+        if request.mode in ('vector', 'hybrid') and vector_ready:
+            search_mode = request.mode
+        else:
+            search_mode = 'keyword'
+            if request.mode != 'keyword':
+                logger.info(f"벡터 검색 사용 불가 ({readiness()['vector_search']}): 키워드 검색으로 실행")
+        logger.info(f"{search_mode} 검색 실행 중...")
+
+        # 메타데이터 필터는 검색 단계에서 적용 (결과 수가 줄어들지 않도록)
+        filters = {}
         if request.document_filter and request.document_filter != "all":
-            initial_count = len(results)
-            results = [
-                r for r in results if r.get('metadata', {}).get('category') == request.document_filter
-            ]
-            logger.info(f"Filtered results for '{request.document_filter}': {initial_count} -> {len(results)}")
+            filters['category'] = request.document_filter
+        if request.file_filter:
+            filters['file_name'] = request.file_filter
+        if request.section_filter:
+            filters['section'] = request.section_filter
+
+        if vector_db is not None and search_mode == 'keyword':
+            # BM25F 키워드 검색
+            # 검색은 읽기 스냅샷만 참조하므로 스레드 풀에서 동시에 실행
+            results = await run_in_threadpool(
+                vector_db.keyword_search,
+                input_keywords, match_all=False, k=request.max_results,
+                filters=filters or None, within=request.proximity, fuzzy=request.fuzzy,
+                collapse_duplicates=request.collapse_duplicates
+            )
+        elif vector_db is not None:
+            # 질의 임베딩 (동시 요청과 함께 배치 처리)
+            if query_encoder is not None:
+                query_embedding = await query_encoder.encode(request.query)
+            else:
+                query_embedding = await run_in_threadpool(embedding_engine.encode_query, request.query)
+
+            if search_mode == 'vector':
+                results = await run_in_threadpool(
+                    vector_db.search,
+                    query_embedding, k=request.max_results,
+                    min_similarity=request.similarity_threshold, filters=filters or None
+                )
+            else:
+                results = await run_in_threadpool(
+                    vector_db.hybrid_search,
+                    query_embedding, input_keywords, k=request.max_results,
+                    vector_weight=request.vector_weight, filters=filters or None,
+                    collapse_duplicates=request.collapse_duplicates
+                )
+        else:
+            # 임시 더미 데이터 반환 (벡터 DB 미로드)
+            results = [{
+                'document': f'검색어 "{request.query}"에 대한 결과입니다. 벡터 검색이 비활성화되어 키워드 검색만 지원됩니다.',
+                'metadata': {
+                    'file_name': '도로설계요령(2020)/제1권 도로계획및 구조.pdf',
+                    'page': 1,
+                    'category': '도로설계요령'
+                },
+                'similarity': 0.8,
+                'match_score': 0.8
+            }]
+            logger.info("벡터 DB 미로드로 인해 더미 데이터 반환")
 
         # 최종 결과 수를 max_results에 맞춤
         final_results = results[:request.max_results]
 
         # 결과 포맷팅 - 고급 검색 기능 적용
         formatted_results = []
+        
+        # fuzzy 검색이면 발췌/점수 계산도 같은 기준 (띄어쓰기 무시 + 오타 허용)
+        locate = vector_db.locate_keywords if vector_db is not None and request.fuzzy else None
 
         for i, result in enumerate(final_results):
-            score_key = 'final_score' if request.mode == 'hybrid' else ('similarity' if request.mode == 'vector' else 'match_score')
+            score_key = 'final_score' if search_mode == 'hybrid' else ('similarity' if search_mode == 'vector' else 'match_score')
             original_document = result['document']
             
             # 고급 추출 로직 적용
             extracted_text = None
             keyword_score = None
             
-            if request.mode in ['keyword', 'hybrid'] and input_keywords:
+            if search_mode in ['keyword', 'hybrid'] and input_keywords:
                 # 청크 내에서 키워드가 포함된 부분만 추출
                 if request.granularity == "sentence":
                     # 문장 단위 추출 - 키워드가 포함된 문장들만
                     extracted_text = extract_sentences_with_keywords(
-                        original_document, input_keywords, request.radius
+                        original_document, input_keywords, request.radius, locate
                     )
                 elif request.granularity == "char":
                     # 글자 단위 추출 - 키워드 위치 기반으로 범위 추출
                     extracted_text = extract_text_by_characters(
-                        original_document, input_keywords, request.radius
+                        original_document, input_keywords, request.radius, locate
                     )
                 
                 # 추출된 부분에서만 키워드 스코어 계산
                 if extracted_text and extracted_text != original_document:
-                    keyword_score = calculate_keyword_score(extracted_text, input_keywords)
+                    keyword_score = calculate_keyword_score(extracted_text, input_keywords, locate)
                     logger.info(f"Result {i+1}: Keyword score {keyword_score}% - extracted_text length: {len(extracted_text)} (original: {len(original_document)})")
                 else:
                     # 추출되지 않았으면 전체 청크에서 점수 계산
-                    keyword_score = calculate_keyword_score(original_document, input_keywords)
+                    keyword_score = calculate_keyword_score(original_document, input_keywords, locate)
                     extracted_text = original_document[:500]  # 기본 표시
             
             # 기존 방식으로 fallback
             if not extracted_text:
-                if (request.mode in ['keyword', 'hybrid'] and (request.full_sentences or request.sentence_context > 0)):
+                if (search_mode in ['keyword', 'hybrid'] and (request.full_sentences or request.sentence_context > 0)):
                     extracted_text = extract_sentences_with_keywords(
-                        original_document, input_keywords, request.sentence_context
+                        original_document, input_keywords, request.sentence_context, locate
                     )
                 else:
                     extracted_text = original_document[:500]
@@ -427,19 +624,20 @@ async def search(request: SearchRequest):
                 metadata=result['metadata'],
                 matched_keywords=result.get('matched_keywords'),
                 extracted_text=extracted_text,
-                keyword_score=keyword_score
+                keyword_score=keyword_score,
+                duplicates=result.get('duplicates')
             ))
 
         search_time_ms = (datetime.now() - start_time).total_seconds() * 1000
         response = SearchResponse(
             query=request.query,
-            mode=request.mode,
+            mode=search_mode,
             total_results=len(formatted_results),
             results=formatted_results,
             search_time_ms=round(search_time_ms, 2)
         )
         response_dict = response.dict()
-        response_dict['search_mode'] = request.mode
+        response_dict['search_mode'] = search_mode
         return response_dict
 
     except Exception as e:
@@ -448,12 +646,12 @@ async def search(request: SearchRequest):
 
 @app.get("/api/stats", response_model=DatabaseStats, tags=["통계"])
 async def get_stats():
-    """데이터베이스 통계 정보"""
-    if vector_db is None or embedding_engine is None:
+    """데이터베이스 통계 정보 (임베딩 엔진 정보는 엔진이 있을 때만 포함)"""
+    if vector_db is None:
         raise HTTPException(status_code=503, detail="시스템이 준비되지 않았습니다")
 
     db_stats = vector_db.get_stats()
-    model_info = embedding_engine.get_model_info()
+    model_info = embedding_engine.get_model_info() if embedding_engine is not None else None
 
     return DatabaseStats(
         total_documents=db_stats['total_documents'],
@@ -461,8 +659,13 @@ async def get_stats():
         index_type=db_stats['index_type'],
         total_searches=db_stats['total_searches'],
         last_search=db_stats['last_search'],
-        model_name=model_info['model_name'],
-        status="operational"
+        load_timings=db_stats.get('load_timings'),
+        query_cache=db_stats.get('query_cache'),
+        query_encoder=query_encoder.stats() if query_encoder is not None else None,
+        model_name=model_info['model_name'] if model_info is not None else db_stats.get('embedding_model'),
+        status="operational",
+        vector_search=readiness()['vector_search'],
+        model=model_info
     )
 
 @app.get("/api/documents/{doc_id}", tags=["문서"])
@@ -486,19 +689,21 @@ async def find_similar_documents(
     k: int = Query(5, description="반환할 유사 문서 수", ge=1, le=20)
 ):
     """특정 문서와 유사한 문서 찾기"""
-    if vector_db is None or embedding_engine is None:
-        raise HTTPException(status_code=503, detail="시스템이 준비되지 않았습니다")
+    require_embedding_engine()
 
     if doc_id < 0 or doc_id >= len(vector_db.documents):
         raise HTTPException(status_code=404, detail="문서를 찾을 수 없습니다")
 
     try:
-        # 해당 문서의 텍스트로 임베딩 생성
+        # 해당 문서의 텍스트로 임베딩 생성 (동시 요청과 함께 배치 처리)
         document_text = vector_db.documents[doc_id]
-        query_embedding = embedding_engine.encode_query(document_text)
+        if query_encoder is not None:
+            query_embedding = await query_encoder.encode(document_text)
+        else:
+            query_embedding = await run_in_threadpool(embedding_engine.encode_query, document_text)
 
         # 유사 문서 검색
-        results = vector_db.search(query_embedding, k=k+1)  # +1 because it will include itself
+        results = await run_in_threadpool(vector_db.search, query_embedding, k=k+1)  # +1 because it will include itself
 
         # 자기 자신 제외
         similar_docs = [r for r in results if r['vector_id'] != doc_id][:k]
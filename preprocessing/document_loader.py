@@ -3,7 +3,7 @@ RAG 1단계: Document Loader
 문서 로드 모듈 - PDF 파일을 읽어 Document 객체로 변환
 """
 import os
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 from pathlib import Path
 from langchain.schema import Document
 from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader
@@ -38,6 +38,27 @@ class DocumentLoader:
             logger.error(f"PDF 로드 실패: {file_path} - {str(e)}")
             return []
     
+    def iter_pdf(self, file_path: str) -> Iterator[Document]:
+        """단일 PDF 파일을 페이지 단위로 순차 로드 (전체 페이지를 메모리에 두지 않음)
+        
+        스트리밍 처리 중 실패를 호출자가 알 수 있도록 오류는 기록 후 다시 발생시킨다.
+        """
+        try:
+            loader = PyPDFLoader(file_path)
+            count = 0
+            for doc in loader.lazy_load():
+                doc.metadata['source_type'] = 'pdf'
+                doc.metadata['file_name'] = Path(file_path).name
+                doc.metadata['file_path'] = file_path
+                count += 1
+                yield doc
+            
+            logger.info(f"PDF 로드 완료: {file_path} - {count}개 페이지")
+            
+        except Exception as e:
+            logger.error(f"PDF 로드 실패: {file_path} - {str(e)}")
+            raise
+    
     def load_directory(self, directory_path: str, glob_pattern: str = "**/*.pdf") -> List[Document]:
         """디렉토리의 모든 PDF 파일 로드"""
         try:
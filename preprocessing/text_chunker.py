@@ -3,11 +3,13 @@ RAG 2단계: Text Chunking
 한국어 도로설계 문서에 특화된 텍스트 분할기
 """
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Callable, Optional
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 import logging
 
+from rag.near_duplicates import simhash
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -17,11 +19,17 @@ class KoreanTextChunker:
     def __init__(self, 
                  chunk_size: int = 1000, 
                  chunk_overlap: int = 200,
-                 preserve_structure: bool = True):
+                 preserve_structure: bool = True,
+                 length_function: Optional[Callable[[str], int]] = None):
         
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.preserve_structure = preserve_structure
+        # 길이 측정 함수 (기본: 글자 수). 임베딩 토크나이저의 토큰 수를 넘기면 chunk_size /
+        # chunk_overlap은 토큰 단위가 되어 청크가 모델 입력 창을 채우도록 나뉜다
+        # (KoreanEmbeddingEngine.token_length_function / max_chunk_tokens 참고)
+        self.length_function = length_function or len
+        self.token_mode = length_function is not None
         
         # 한국어 특화 구분자
         self.korean_separators = [
@@ -53,7 +61,7 @@ class KoreanTextChunker:
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             separators=self.korean_separators,
-            length_function=len,
+            length_function=self.length_function,
             is_separator_regex=False
         )
     
@@ -68,6 +76,18 @@ class KoreanTextChunker:
         logger.info(f"총 {len(documents)}개 문서를 {len(all_chunks)}개 청크로 분할")
         return all_chunks
     
+    def iter_chunks(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """문서(페이지)를 하나씩 받아 청크를 순서대로 반환 (스트리밍 처리용)"""
+        n_documents = 0
+        n_chunks = 0
+        for doc in documents:
+            n_documents += 1
+            for chunk in self.chunk_single_document(doc):
+                n_chunks += 1
+                yield chunk
+        
+        logger.info(f"총 {n_documents}개 문서를 {n_chunks}개 청크로 분할")
+    
     def chunk_single_document(self, document: Document) -> List[Document]:
         """단일 문서 청킹"""
         try:
@@ -82,6 +102,8 @@ class KoreanTextChunker:
             
             # RecursiveCharacterTextSplitter로 청킹
             text_chunks = self.splitter.split_text(processed_text)
+            if self.token_mode:
+                text_chunks = self._fit_to_budget(text_chunks)
             
             # Document 객체로 변환하며 메타데이터 추가
             chunks = []
@@ -94,8 +116,11 @@ class KoreanTextChunker:
                     'chunk_size': len(chunk_text),
                     'total_chunks': len(text_chunks),
                     'section': self._extract_section(chunk_text),
-                    'keywords': self._extract_keywords(chunk_text)
+                    'keywords': self._extract_keywords(chunk_text),
+                    'simhash': simhash(chunk_text)  # 거의 같은 청크 판별용 서명
                 })
+                if self.token_mode:
+                    chunk_metadata['chunk_tokens'] = self.length_function(chunk_text)
                 
                 chunk_doc = Document(
                     page_content=chunk_text,
@@ -110,6 +135,32 @@ class KoreanTextChunker:
             logger.error(f"청킹 오류: {e}")
             return []
     
+    def _fit_to_budget(self, text_chunks: List[str]) -> List[str]:
+        """chunk_size 토큰을 넘는 청크를 다시 나눔
+        
+        조각을 이어 붙인 문자열의 토큰 수는 조각별 토큰 수의 합과 조금 다를 수 있으므로,
+        병합 결과가 예산을 넘으면 예산에 맞는 가장 긴 앞부분(가능하면 공백 경계)을 잘라낸다.
+        """
+        fitted = []
+        for chunk in text_chunks:
+            while self.length_function(chunk) > self.chunk_size:
+                # 토큰 수가 chunk_size 이하인 가장 긴 앞부분 (이진 탐색)
+                lo, hi = 1, len(chunk) - 1
+                while lo < hi:
+                    mid = (lo + hi + 1) // 2
+                    if self.length_function(chunk[:mid]) <= self.chunk_size:
+                        lo = mid
+                    else:
+                        hi = mid - 1
+                cut = chunk.rfind(' ', 0, lo + 1)
+                if cut <= lo // 2:
+                    cut = lo
+                fitted.append(chunk[:cut].strip())
+                chunk = chunk[cut:].strip()
+            if chunk:
+                fitted.append(chunk)
+        return fitted
+    
     def _preprocess_structure(self, text: str) -> str:
         """구조 정보 전처리"""
         # 제목과 본문 사이에 구분자 추가
@@ -16,6 +16,7 @@ from preprocessing.document_loader import DocumentLoader
 from preprocessing.text_chunker import KoreanTextChunker
 from rag.embedding_engine import KoreanEmbeddingEngine
 from rag.vector_database import VectorDatabase
+from rag.ingest_pipeline import prefetch
 
 # 로깅 설정
 logging.basicConfig(
@@ -31,19 +32,42 @@ logger = logging.getLogger(__name__)
 class DocumentProcessor:
     """전체 문서 처리 클래스"""
     
-    def __init__(self):
+    def __init__(self, ann_type: str = "flat", resume: bool = False, use_embedding_cache: bool = True,
+                 embedding_backend: str = "torch", workers: int = 1, batch_size: int = 256,
+                 token_chunking: bool = False):
         self.loader = DocumentLoader()
-        self.chunker = KoreanTextChunker(
-            chunk_size=1000,
-            chunk_overlap=200,
-            preserve_structure=True
-        )
-        self.embedding_engine = KoreanEmbeddingEngine()
+        # 모델은 첫 임베딩 때 로드 (기록된 차원이 있으면 벡터 DB를 바로 생성)
+        self.embedding_engine = KoreanEmbeddingEngine(use_cache=use_embedding_cache,
+                                                      backend=embedding_backend,
+                                                      num_workers=workers,
+                                                      lazy_load=True)
+        if token_chunking:
+            # 청크 길이를 토크나이저 토큰 수로 재서 모델 입력 창(max_seq_length)을 채움
+            max_tokens = self.embedding_engine.max_chunk_tokens
+            self.chunker = KoreanTextChunker(
+                chunk_size=max_tokens,
+                chunk_overlap=max_tokens // 5,
+                preserve_structure=True,
+                length_function=self.embedding_engine.token_length_function()
+            )
+            logger.info(f"토큰 기준 청킹: 청크당 최대 {max_tokens}토큰")
+        else:
+            self.chunker = KoreanTextChunker(
+                chunk_size=1000,
+                chunk_overlap=200,
+                preserve_structure=True
+            )
         self.vector_db = VectorDatabase(
             dimension=self.embedding_engine.dimension,
             index_type="cosine",
-            storage_dir="./vector_store"
+            storage_dir="./vector_store",
+            ann_type=ann_type,
+            embedding_model=self.embedding_engine.model_fingerprint
         )
+        self.resume = resume
+        self.db_prefix = "road_design_db"
+        # 스트리밍 처리 배치 크기 (파일 크기와 관계없이 이만큼씩 임베딩 후 벡터 DB에 추가)
+        self.batch_size = batch_size
         
         # 처리 통계
         self.stats = {
@@ -76,64 +100,141 @@ class DocumentProcessor:
         logger.info(f"처리 대상 PDF 파일 {len(pdf_files)}개 발견")
         return sorted(pdf_files)
     
+    def prepare_pdf(self, file_path: str):
+        """단일 PDF를 로드/청킹/임베딩하여 (임베딩, 메타데이터, 청크 텍스트) 반환 (실패 시 None)"""
+        logger.info(f"처리 시작: {file_path}")
+        
+        # 1. PDF 로드
+        documents = self.loader.load_pdf(file_path)
+        if not documents:
+            logger.warning(f"문서 로드 실패: {file_path}")
+            return None
+            
+        # 메타데이터에 'source'로 전체 파일 경로 추가
+        for doc in documents:
+            doc.metadata['source'] = file_path.replace('\\', '/')
+
+        self.stats['total_pages'] += len(documents)
+        
+        # 2. 텍스트 청킹
+        chunks = self.chunker.chunk_documents(documents)
+        if not chunks:
+            logger.warning(f"청킹 실패: {file_path}")
+            return None
+        
+        self.stats['total_chunks'] += len(chunks)
+        
+        # 3. 카테고리 메타데이터 추가
+        category = self._category(file_path)
+        
+        # 각 청크에 카테고리 추가
+        for chunk in chunks:
+            chunk.metadata['category'] = category
+        
+        # 4. 임베딩 생성
+        chunk_texts = [chunk.page_content for chunk in chunks]
+        
+        embeddings, metadatas = self.embedding_engine.encode_documents(chunks)
+        if embeddings.size == 0:
+            logger.warning(f"임베딩 생성 실패: {file_path}")
+            return None
+        return embeddings, metadatas, chunk_texts
+    
+    @staticmethod
+    def _category(file_path: str) -> str:
+        """파일 경로로 정한 문서 카테고리"""
+        if "도로설계요령" in file_path:
+            return "도로설계요령"
+        if "실무지침" in file_path:
+            return "실무지침"
+        return "기타"
+    
+    def _stream_chunks(self, file_path: str):
+        """PDF 페이지를 하나씩 읽어 청킹하고 source/category를 붙인 청크를 순서대로 반환"""
+        source = file_path.replace('\\', '/')
+        category = self._category(file_path)
+        
+        def pages():
+            for doc in self.loader.iter_pdf(file_path):
+                doc.metadata['source'] = source
+                self.stats['total_pages'] += 1
+                yield doc
+        
+        for chunk in self.chunker.iter_chunks(pages()):
+            chunk.metadata['category'] = category
+            self.stats['total_chunks'] += 1
+            yield chunk
+    
     def process_single_pdf(self, file_path: str) -> bool:
-        """단일 PDF 처리"""
+        """단일 PDF 처리 (스트리밍)
+        
+        로드/청킹은 백그라운드 스레드에서 진행되고, 임베딩과 벡터 DB 추가는 batch_size개씩
+        이루어진다. 두 단계 사이 큐는 배치 2개 분량으로 제한되어 임베딩이 느리면 PDF 읽기가
+        기다리므로, 최대 메모리 사용량은 파일 크기와 관계없이 일정하다.
+        """
+        source = file_path.replace('\\', '/')
+        added = 0
         try:
             logger.info(f"처리 시작: {file_path}")
+            chunks = prefetch(self._stream_chunks(file_path), max_pending=2 * self.batch_size)
+            for embeddings, metadatas, chunk_texts in self.embedding_engine.encode_document_batches(
+                    chunks, self.batch_size):
+                self.vector_db.add_documents(embeddings, metadatas, chunk_texts)
+                added += len(chunk_texts)
             
-            # 1. PDF 로드
-            documents = self.loader.load_pdf(file_path)
-            if not documents:
-                logger.warning(f"문서 로드 실패: {file_path}")
+            if added == 0:
+                logger.warning(f"추가된 청크 없음: {file_path}")
                 return False
-            
-            # 메타데이터에 'source'로 전체 파일 경로 추가
-            for doc in documents:
-                doc.metadata['source'] = file_path.replace('\\', '/')
-
-            self.stats['total_pages'] += len(documents)
-            
-            # 2. 텍스트 청킹
-            chunks = self.chunker.chunk_documents(documents)
-            if not chunks:
-                logger.warning(f"청킹 실패: {file_path}")
-                return False
-            
-            self.stats['total_chunks'] += len(chunks)
-            
-            # 3. 카테고리 메타데이터 추가
-            if "도로설계요령" in file_path:
-                category = "도로설계요령"
-            elif "실무지침" in file_path:
-                category = "실무지침"
-            else:
-                category = "기타"
-            
-            # 각 청크에 카테고리 추가
-            for chunk in chunks:
-                chunk.metadata['category'] = category
-            
-            # 4. 임베딩 생성
-            chunk_texts = [chunk.page_content for chunk in chunks]
-            chunk_metadatas = [chunk.metadata for chunk in chunks]
-            
-            embeddings, metadatas = self.embedding_engine.encode_documents(chunks)
-            if embeddings.size == 0:
-                logger.warning(f"임베딩 생성 실패: {file_path}")
-                return False
-            
-            # 4. 벡터 DB에 추가
-            self.vector_db.add_documents(embeddings, metadatas, chunk_texts)
-            
-            logger.info(f"처리 완료: {file_path} ({len(chunks)}개 청크)")
+            logger.info(f"처리 완료: {file_path} ({added}개 청크)")
             return True
             
         except Exception as e:
             logger.error(f"처리 중 오류 발생: {file_path} - {e}")
+            # 일부 배치만 추가된 파일은 되돌림 (다음 실행에서 처음부터 다시 처리)
+            if added:
+                self.vector_db.remove_by_source(source)
             return False
     
-    def process_all_documents(self, save_interval: int = 3):
-        """모든 문서 처리"""
+    def update_files(self, file_paths: List[str]) -> bool:
+        """기존 벡터 DB에서 지정한 PDF만 다시 처리하여 교체 (전체 재구축 없음)"""
+        start_time = time.time()
+        if not self.vector_db.load_database(self.db_prefix):
+            logger.error("기존 벡터 DB를 불러올 수 없습니다. 먼저 전체 처리를 실행하세요.")
+            return False
+        self.vector_db.open_segment_log(self.db_prefix)
+        self.stats['total_files'] = len(file_paths)
+        
+        for file_path in file_paths:
+            try:
+                if not os.path.exists(file_path):
+                    # 파일이 없어졌으면 기존 청크만 삭제
+                    removed = self.vector_db.remove_by_source(file_path)
+                    logger.info(f"삭제된 파일 반영: {file_path} ({removed}개 청크 제거)")
+                    continue
+                
+                prepared = self.prepare_pdf(file_path)
+                if prepared is None:
+                    self.stats['failed_files'].append(file_path)
+                    continue
+                embeddings, metadatas, chunk_texts = prepared
+                self.vector_db.upsert_file(file_path, embeddings, metadatas, chunk_texts)
+                self.stats['processed_files'] += 1
+                
+            except Exception as e:
+                logger.error(f"처리 중 오류 발생: {file_path} - {e}")
+                self.stats['failed_files'].append(file_path)
+        
+        self.vector_db.wait_for_compaction()
+        success = self.vector_db.save_database(self.db_prefix)
+        self.stats['processing_time'] = time.time() - start_time
+        self.print_processing_stats()
+        return success
+    
+    def process_all_documents(self):
+        """모든 문서 처리
+        
+        중간 병합은 세그먼트가 충분히 쌓이면 VectorDatabase가 백그라운드에서 수행한다.
+        """
         start_time = time.time()
         
         # PDF 파일 목록 가져오기
@@ -144,13 +245,42 @@ class DocumentProcessor:
         
         self.stats['total_files'] = len(pdf_files)
         
+        # 이어서 처리할 DB가 있는데 불러오지 못하면 중단 (빈 스냅샷으로 덮어쓰지 않음)
+        snapshot_dir = VectorDatabase.snapshot_dir(self.vector_db.storage_dir, self.db_prefix)
+        resume = self.resume and os.path.exists(os.path.join(snapshot_dir, f"{self.db_prefix}.index"))
+        if self.resume and not resume:
+            logger.warning("이어서 처리할 벡터 DB가 없어 처음부터 처리합니다.")
+        if resume and not self.vector_db.load_database(self.db_prefix):
+            logger.error("기존 벡터 DB를 불러올 수 없어 중단합니다 (기존 DB는 그대로 둡니다).")
+            return False
+        
+        # 세그먼트 로그 시작: 배치마다 세그먼트로 기록되므로 중단되어도 현재 파일만 유실
+        if resume:
+            self.vector_db.open_segment_log(self.db_prefix)
+            # 파일을 배치 단위로 추가하므로 마지막으로 기록된 파일은 중간에 끊겼을 수 있음
+            # → 해당 파일의 청크를 지우고 다시 처리
+            # (임베딩 캐시가 있으면 다시 인코딩하지 않음)
+            # 삭제 표시된 행(처리 중 실패해 되돌린 파일 등)은 완료로 보지 않음
+            done = self.vector_db.live_sources()
+            last_source = self.vector_db.last_live_source()
+            if last_source:
+                removed = self.vector_db.remove_by_source(last_source)
+                done.discard(last_source)
+                logger.info(f"마지막 파일 재처리: {last_source} ({removed}개 청크 제거)")
+            skipped = [f for f in pdf_files if f.replace('\\', '/') in done]
+            pdf_files = [f for f in pdf_files if f.replace('\\', '/') not in done]
+            self.stats['processed_files'] += len(skipped)
+            logger.info(f"이어서 처리: 완료된 {len(skipped)}개 파일 건너뜀")
+        else:
+            self.vector_db.open_segment_log(self.db_prefix, reset=True)
+        
         # 파일별 처리
         logger.info("="*60)
         logger.info(f"전체 문서 처리 시작: {len(pdf_files)}개 파일")
         logger.info("="*60)
         
         with tqdm(pdf_files, desc="PDF 처리 진행", unit="파일") as pbar:
-            for i, file_path in enumerate(pbar):
+            for file_path in pbar:
                 pbar.set_description(f"처리 중: {os.path.basename(file_path)}")
                 
                 success = self.process_single_pdf(file_path)
@@ -167,15 +297,16 @@ class DocumentProcessor:
                         "성공": self.stats['processed_files'], 
                         "실패": len(self.stats['failed_files'])
                     })
-                
-                # 중간 저장 (메모리 관리)
-                if (i + 1) % save_interval == 0:
-                    logger.info(f"중간 저장 중... ({i+1}/{len(pdf_files)})")
-                    self.vector_db.save_database("road_design_db")
+        
+        self.vector_db.wait_for_compaction()
+        
+        # IVF 계열 인덱스는 남은 대기 벡터로 학습 후 저장
+        if not self.vector_db.train_index():
+            logger.warning("인덱스 학습 실패 (추가된 벡터 없음)")
         
         # 최종 저장
         logger.info("최종 벡터 DB 저장 중...")
-        if self.vector_db.save_database("road_design_db"):
+        if self.vector_db.save_database(self.db_prefix):
             logger.info("벡터 데이터베이스 저장 완료")
         else:
             logger.error("벡터 데이터베이스 저장 실패")
@@ -208,7 +339,13 @@ class DocumentProcessor:
         logger.info(f"\n벡터 데이터베이스 정보:")
         logger.info(f"저장된 문서: {db_stats['total_documents']}개")
         logger.info(f"임베딩 차원: {db_stats['dimension']}")
-        logger.info(f"인덱스 타입: {db_stats['index_type']}")
+        logger.info(f"인덱스 타입: {db_stats['index_type']} ({db_stats['ann_type']})")
+        
+        # 임베딩 캐시 적중률 (변경되지 않은 청크는 재인코딩하지 않음)
+        cache_stats = self.embedding_engine.get_model_info().get('embedding_cache')
+        if cache_stats:
+            logger.info(f"임베딩 캐시: 적중 {cache_stats['hits']}개 / 미적중 {cache_stats['misses']}개 "
+                        f"(적중률 {cache_stats['hit_rate']:.1%}, 저장 {cache_stats['size']}개)")
         
         # 성능 계산
         if self.stats['processing_time'] > 0:
@@ -226,6 +363,24 @@ def main():
     
     parser = argparse.ArgumentParser(description="도로설계·실무지침 문서 벡터화 스크립트")
     parser.add_argument('-y', '--yes', action='store_true', help='확인 프롬프트를 건너뛰고 바로 실행합니다.')
+    parser.add_argument('--ann-type', default='flat',
+                        choices=['flat', 'ivf_flat', 'hnsw', 'ivf_pq', 'sq8', 'sq_fp16'],
+                        help='벡터 인덱스 종류 (기본: flat)')
+    parser.add_argument('--resume', action='store_true',
+                        help='기존 벡터 DB와 세그먼트를 불러와 처리되지 않은 파일만 이어서 처리합니다.')
+    parser.add_argument('--update', nargs='+', metavar='PDF',
+                        help='기존 벡터 DB에서 지정한 PDF의 청크만 교체합니다 (파일이 없으면 삭제).')
+    parser.add_argument('--no-embedding-cache', action='store_true',
+                        help='임베딩 캐시를 사용하지 않고 모든 청크를 다시 인코딩합니다.')
+    parser.add_argument('--embedding-backend', default='torch',
+                        choices=['torch', 'onnx', 'onnx_int8'],
+                        help='임베딩 추론 백엔드 (onnx/onnx_int8은 onnxruntime 필요, 기본: torch)')
+    parser.add_argument('--batch-size', type=int, default=256,
+                        help='스트리밍 처리 배치 크기 (청크 수, 최대 메모리 사용량을 결정, 기본: 256)')
+    parser.add_argument('--token-chunking', action='store_true',
+                        help='청크 길이를 임베딩 모델 토큰 수로 재서 모델 입력 창에 맞게 분할합니다 (글자 수 1000 대신).')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='임베딩 작업 프로세스 수 (모델 복제본을 띄워 청크 배치를 나눠 처리, 기본: 1)')
     args = parser.parse_args()
     
     print("도로설계·실무지침 문서 벡터화 시작")
@@ -243,8 +398,23 @@ def main():
         sys.exit(1)
     
     # 처리기 초기화 및 실행
+    processor = None
     try:
-        processor = DocumentProcessor()
+        processor = DocumentProcessor(ann_type=args.ann_type, resume=args.resume,
+                                      use_embedding_cache=not args.no_embedding_cache,
+                                      embedding_backend=args.embedding_backend,
+                                      workers=args.workers,
+                                      batch_size=args.batch_size,
+                                      token_chunking=args.token_chunking)
+        
+        if args.update:
+            # 변경된 파일만 교체 (전체 재처리 불필요)
+            if processor.update_files(args.update):
+                print("\n지정한 파일의 교체가 완료되었습니다!")
+            else:
+                print("\n파일 교체 중 오류가 발생했습니다.")
+                sys.exit(1)
+            return
         
         # 사용자 확인
         pdf_files = processor.get_pdf_files()
@@ -279,6 +449,10 @@ def main():
     except Exception as e:
         logger.error(f"예상치 못한 오류 발생: {e}")
         sys.exit(1)
+    finally:
+        # 임베딩 작업 프로세스 종료
+        if processor is not None:
+            processor.embedding_engine.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,290 @@
+"""
+RAG 4단계 보조: BM25 Ranker
+본문 + section 필드에 대한 BM25F 키워드 랭킹
+"""
+import os
+import math
+import heapq
+from array import array
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+import numpy as np
+import logging
+
+from rag.keyword_index import KeywordIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _contains(sorted_ids: np.ndarray, doc_id: int) -> bool:
+    """정렬된 포스팅에 문서 ID가 있는지 이진 탐색"""
+    pos = int(np.searchsorted(sorted_ids, doc_id))
+    return pos < sorted_ids.size and sorted_ids[pos] == doc_id
+
+
+class BM25Ranker:
+    """BM25F 랭커
+
+    문서 길이, section 길이 등 필드 통계를 색인 시점에 미리 계산해 두고,
+    질의 시에는 키워드 역색인의 포스팅(문서 ID, tf)에 대해서만 NumPy 벡터 연산으로
+    점수를 계산한다. 상위 k개는 힙으로 선택하므로 전체 매칭 결과를 정렬하지 않는다.
+    길이 배열은 추가 시 새 배열로 교체되므로 검색 중인 스레드는 이전 배열을 그대로 본다.
+    """
+
+    def __init__(self,
+                 k1: float = 1.2,
+                 b: float = 0.75,
+                 section_weight: float = 2.0,
+                 section_b: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.section_weight = section_weight
+        self.section_b = section_b
+
+        self.doc_lengths = np.empty(0, dtype=np.int32)      # 본문 길이 (문자 수)
+        self.section_lengths = np.empty(0, dtype=np.int32)  # section 길이 (문자 수)
+        self.sections: List[str] = []                       # 소문자 section 텍스트
+        # section 사전 인코딩 (필터는 고유값에서만 부분 문자열을 찾고 코드 배열로 마스크 계산)
+        self.section_values: List[str] = []
+        self.section_codes = np.empty(0, dtype=np.int32)
+        self._section_lookup: Dict[str, int] = {}
+        self._avg_cache: Optional[Tuple[float, float]] = None
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_documents(self, documents: Iterable[str], metadatas: Iterable[Dict]):
+        """문서별 필드 통계 추가 (문서 ID 순서대로 호출)"""
+        doc_lengths = array('i')
+        section_lengths = array('i')
+        section_codes = array('i')
+        for document, metadata in zip(documents, metadatas):
+            section = str(metadata.get('section') or '').lower()
+            doc_lengths.append(len(document))
+            section_lengths.append(len(section))
+            self.sections.append(section)
+            code = self._section_lookup.get(section)
+            if code is None:
+                code = self._section_lookup[section] = len(self.section_values)
+                self.section_values.append(section)
+            section_codes.append(code)
+        self.section_codes = np.concatenate(
+            [self.section_codes, np.frombuffer(section_codes, dtype=np.int32)]
+        )
+        self.section_lengths = np.concatenate(
+            [self.section_lengths, np.frombuffer(section_lengths, dtype=np.int32)]
+        )
+        self.doc_lengths = np.concatenate(
+            [self.doc_lengths, np.frombuffer(doc_lengths, dtype=np.int32)]
+        )
+        self._avg_cache = None
+
+    def section_mask(self, text: str, size: int) -> np.ndarray:
+        """section에 text(소문자 비교)가 포함된 앞쪽 size개 문서의 마스크"""
+        text = text.lower()
+        codes = [code for code, value in enumerate(self.section_values) if text in value]
+        return np.isin(self.section_codes[:size], codes)
+
+    def _averages(self) -> Tuple[float, float]:
+        if self._avg_cache is None:
+            doc_lengths, section_lengths = self.doc_lengths, self.section_lengths
+            if doc_lengths.size == 0:
+                self._avg_cache = (1.0, 1.0)
+            else:
+                self._avg_cache = (max(float(doc_lengths.mean()), 1.0),
+                                   max(float(section_lengths.mean()), 1.0))
+        return self._avg_cache
+
+    def _length_sums(self, allowed: Optional[np.ndarray] = None) -> Tuple[int, int, int]:
+        """(문서 수, 본문 길이 합, section 길이 합), allowed가 주어지면 허용된 문서만"""
+        doc_lengths, section_lengths = self.doc_lengths, self.section_lengths
+        if allowed is None:
+            return (int(doc_lengths.size), int(doc_lengths.sum(dtype=np.int64)),
+                    int(section_lengths.sum(dtype=np.int64)))
+        size = min(doc_lengths.size, allowed.size)
+        mask = allowed[:size]
+        return (int(np.count_nonzero(mask)),
+                int(doc_lengths[:size].sum(where=mask, dtype=np.int64)),
+                int(section_lengths[:size].sum(where=mask, dtype=np.int64)))
+
+    def collection_stats(self,
+                         keyword_index: KeywordIndex,
+                         keywords: List[str],
+                         documents,
+                         allowed: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """점수 계산에 쓰이는 컬렉션 통계 (허용 문서 수, 키워드별 df, 필드 길이 합)
+
+        문서 수와 길이 합은 모두 allowed로 허용된 문서 기준이다.
+        샤드처럼 문서가 나뉘어 있을 때 merge_stats로 합쳐 rank(collection=...)에 넘기면
+        모든 문서를 한 곳에 둔 것과 같은 IDF/평균 길이로 점수가 계산된다.
+        """
+        total_docs, doc_length_sum, section_length_sum = self._length_sums(allowed)
+        n_docs = self.num_docs if allowed is None else int(np.count_nonzero(allowed))
+        return {
+            'n_docs': n_docs,
+            'df': [int(keyword_index.match_with_tf(keyword, documents, allowed)[0].size)
+                   if n_docs else 0 for keyword in keywords],
+            'total_docs': total_docs,
+            'doc_length_sum': doc_length_sum,
+            'section_length_sum': section_length_sum
+        }
+
+    @staticmethod
+    def merge_stats(stats_list: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """여러 collection_stats 결과의 합 (키워드 순서가 같아야 함)"""
+        merged: Optional[Dict[str, Any]] = None
+        for stats in stats_list:
+            if merged is None:
+                merged = {**stats, 'df': list(stats['df'])}
+                continue
+            for name in ('n_docs', 'total_docs', 'doc_length_sum', 'section_length_sum'):
+                merged[name] += stats[name]
+            merged['df'] = [a + b for a, b in zip(merged['df'], stats['df'])]
+        return merged
+
+    @staticmethod
+    def _collection_averages(collection: Dict[str, Any]) -> Tuple[float, float]:
+        if not collection['total_docs']:
+            return 1.0, 1.0
+        return (max(collection['doc_length_sum'] / collection['total_docs'], 1.0),
+                max(collection['section_length_sum'] / collection['total_docs'], 1.0))
+
+    def _keyword_scores(self,
+                        keyword: str,
+                        ids: np.ndarray,
+                        tfs: np.ndarray,
+                        n_docs: Optional[int] = None,
+                        df: Optional[int] = None,
+                        averages: Optional[Tuple[float, float]] = None) -> np.ndarray:
+        """단일 키워드의 BM25F 점수 (포스팅 단위 벡터 연산)"""
+        n_docs = self.num_docs if n_docs is None else n_docs
+        df = ids.size if df is None else df
+        idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avg_doc, avg_section = self._averages() if averages is None else averages
+
+        doc_lengths = self.doc_lengths[ids]
+        section_lengths = self.section_lengths[ids]
+
+        keyword_lower = keyword.lower()
+        if keyword_lower:
+            section_tfs = np.fromiter(
+                (self.sections[i].count(keyword_lower) for i in ids.tolist()),
+                dtype=np.float32, count=ids.size
+            )
+        else:
+            section_tfs = np.zeros(ids.size, dtype=np.float32)
+
+        text_norm = 1.0 - self.b + self.b * doc_lengths / avg_doc
+        section_norm = 1.0 - self.section_b + self.section_b * section_lengths / avg_section
+        weighted_tf = tfs / text_norm + self.section_weight * section_tfs / section_norm
+
+        return idf * weighted_tf * (self.k1 + 1.0) / (self.k1 + weighted_tf)
+
+    def rank(self,
+             keyword_index: KeywordIndex,
+             keywords: List[str],
+             documents,
+             k: int = 10,
+             match_all: bool = False,
+             allowed: Optional[np.ndarray] = None,
+             candidates: Optional[np.ndarray] = None,
+             collection: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float, List[str]]]:
+        """키워드 BM25F 상위 k개 문서
+
+        Args:
+            allowed: 문서별 허용 마스크. 주어지면 허용된 문서만 매칭/점수 계산하며,
+                IDF(N, df)와 평균 길이도 허용된 문서 집합 기준으로 계산한다.
+            candidates: 결과를 이 문서 ID들(정렬됨)로 제한 (근접 검색 등, IDF에는 영향 없음)
+            collection: 여러 색인에 걸친 collection_stats 합 (주어지면 IDF와 평균 길이에 사용)
+
+        Returns:
+            [(문서 ID, BM25 점수, 매칭된 키워드 리스트), ...] 점수 내림차순,
+            동점은 문서 ID 오름차순
+        """
+        if not keywords or k <= 0:
+            return []
+
+        n_docs = None if allowed is None else int(np.count_nonzero(allowed))
+        averages = None
+        if collection is None and allowed is not None:
+            total_docs, doc_length_sum, section_length_sum = self._length_sums(allowed)
+            averages = self._collection_averages({
+                'total_docs': total_docs,
+                'doc_length_sum': doc_length_sum,
+                'section_length_sum': section_length_sum
+            })
+        if collection is not None:
+            n_docs = collection['n_docs']
+            averages = self._collection_averages(collection)
+        keyword_ids = []
+        all_ids = []
+        all_scores = []
+        for position, keyword in enumerate(keywords):
+            ids, tfs = keyword_index.match_with_tf(keyword, documents, allowed)
+            keyword_ids.append(ids)
+            if ids.size == 0:
+                if match_all:
+                    return []
+                continue
+            all_ids.append(ids)
+            df = collection['df'][position] if collection is not None else None
+            all_scores.append(self._keyword_scores(keyword, ids, tfs, n_docs, df, averages))
+
+        if not all_ids:
+            return []
+
+        # 키워드별 포스팅 점수를 문서 단위로 합산
+        doc_ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if match_all:
+            hits = np.bincount(inverse)
+            keep = np.nonzero(hits == len(keywords))[0]
+        else:
+            keep = np.arange(doc_ids.size)
+        if candidates is not None:
+            keep = keep[np.isin(doc_ids[keep], candidates)]
+
+        top = heapq.nlargest(
+            k, keep.tolist(),
+            key=lambda j: (totals[j], -doc_ids[j])
+        )
+
+        results = []
+        for j in top:
+            doc_id = int(doc_ids[j])
+            matched = [
+                keyword for keyword, ids in zip(keywords, keyword_ids)
+                if _contains(ids, doc_id)
+            ]
+            results.append((doc_id, float(totals[j]), matched))
+        return results
+
+    def save(self, filepath: str):
+        """필드 통계 저장"""
+        np.savez(
+            filepath,
+            doc_lengths=self.doc_lengths,
+            section_lengths=self.section_lengths,
+            sections=np.array(self.sections, dtype=str),
+            params=np.array([self.k1, self.b, self.section_weight, self.section_b])
+        )
+
+    def load(self, filepath: str) -> bool:
+        """저장된 필드 통계 로드"""
+        if not os.path.exists(filepath):
+            return False
+        with np.load(filepath) as data:
+            self.doc_lengths = data['doc_lengths'].astype(np.int32)
+            self.section_lengths = data['section_lengths'].astype(np.int32)
+            self.sections = data['sections'].tolist()
+            values, codes = np.unique(data['sections'], return_inverse=True)
+            self.section_values = values.tolist()
+            self.section_codes = codes.astype(np.int32).reshape(-1)
+            self._section_lookup = {value: code for code, value in enumerate(self.section_values)}
+            self.k1, self.b, self.section_weight, self.section_b = (
+                float(v) for v in data['params']
+            )
+        self._avg_cache = None
+        logger.info(f"BM25 통계 로드 완료: {self.num_docs}개 문서")
+        return True
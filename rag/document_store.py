@@ -0,0 +1,477 @@
+"""
+RAG 4단계 보조: Document Store
+청크 원문과 메타데이터를 메모리 맵 컬럼 파일로 저장/조회
+"""
+import os
+import json
+import mmap
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 범주형(사전 인코딩)으로 저장할 문자열 컬럼의 최대 고유값 비율
+CATEGORY_MAX_RATIO = 0.5
+
+
+class _Missing:
+    """결측 값 표시용 sentinel"""
+
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+def _replace_npy(path: str, array: np.ndarray):
+    """임시 파일에 쓴 뒤 교체 (기존 파일을 mmap 중인 리더 보호)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _open_blob(path: str):
+    """UTF-8 blob 파일을 읽기 전용 mmap으로 연다 (빈 파일은 bytes)"""
+    if os.path.getsize(path) == 0:
+        return b''
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class TextColumn:
+    """가변 길이 문자열 컬럼
+
+    저장된 부분은 하나의 UTF-8 blob + 오프셋 배열(mmap)이고,
+    이후 추가된 항목은 메모리 리스트에 보관한다. 문자열은 조회 시점에만 디코딩된다.
+    """
+
+    def __init__(self, values: Optional[Iterable[str]] = None):
+        self._blob = b''
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._tail: List[str] = list(values) if values is not None else []
+
+    @property
+    def base_size(self) -> int:
+        return len(self._offsets) - 1
+
+    def __len__(self) -> int:
+        return self.base_size + len(self._tail)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        if i < self.base_size:
+            start, end = self._offsets[i], self._offsets[i + 1]
+            return bytes(self._blob[start:end]).decode('utf-8')
+        return self._tail[i - self.base_size]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, value: str):
+        self._tail.append(value)
+
+    def extend(self, values: Iterable[str]):
+        self._tail.extend(values)
+
+    def byte_length(self, i: int) -> int:
+        """디코딩 없이 저장된 항목의 바이트 길이"""
+        if i < self.base_size:
+            return int(self._offsets[i + 1] - self._offsets[i])
+        return len(self._tail[i - self.base_size].encode('utf-8'))
+
+    def save(self, blob_path: str, offsets_path: str, deleted: Optional[np.ndarray] = None):
+        """blob + 오프셋 파일로 저장 (저장된 부분은 바이트 그대로 복사)
+
+        Args:
+            deleted: 삭제 표시 마스크. 표시된 항목은 빈 문자열로 저장해 공간을 회수한다
+                (항목 위치는 유지).
+        """
+        size = len(self)
+        if deleted is not None:
+            mask = np.zeros(size, dtype=bool)
+            n = min(size, len(deleted))
+            mask[:n] = deleted[:n]
+            deleted = mask
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        base_bytes = int(self._offsets[-1])
+        lengths = np.diff(np.asarray(self._offsets))
+        compact = deleted is not None and bool((deleted[:self.base_size] & (lengths > 0)).any())
+
+        tmp_path = f"{blob_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            if compact:
+                # 삭제된 항목을 건너뛰며 저장된 부분을 다시 기록
+                position = 0
+                for i in range(self.base_size):
+                    if not deleted[i] and lengths[i]:
+                        f.write(self._blob[self._offsets[i]:self._offsets[i + 1]])
+                        position += int(lengths[i])
+                    offsets[i + 1] = position
+            else:
+                offsets[:self.base_size + 1] = self._offsets
+                if base_bytes:
+                    f.write(self._blob[:base_bytes])
+                position = base_bytes
+            for j, value in enumerate(self._tail):
+                if deleted is None or not deleted[self.base_size + j]:
+                    encoded = value.encode('utf-8')
+                    f.write(encoded)
+                    position += len(encoded)
+                offsets[self.base_size + j + 1] = position
+        os.replace(tmp_path, blob_path)
+        _replace_npy(offsets_path, offsets)
+
+    @classmethod
+    def open(cls, blob_path: str, offsets_path: str) -> 'TextColumn':
+        """저장된 컬럼을 mmap으로 연다"""
+        column = cls()
+        column._blob = _open_blob(blob_path)
+        column._offsets = np.load(offsets_path, mmap_mode='r')
+        return column
+
+
+class VectorColumn:
+    """고정 차원 float32 벡터 컬럼
+
+    저장된 부분은 .npy 파일(mmap)이고, 이후 추가된 배치는 메모리 리스트에 보관한다.
+    양자화 인덱스의 재순위화처럼 일부 행만 조회하는 용도이므로
+    조회한 행의 페이지만 메모리에 올라온다.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._base = np.empty((0, dimension), dtype=np.float32)
+        self._tail: List[np.ndarray] = []
+        self._tail_size = 0
+
+    @property
+    def base_size(self) -> int:
+        return len(self._base)
+
+    def __len__(self) -> int:
+        return self.base_size + self._tail_size
+
+    def extend(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        self._tail.append(vectors)
+        self._tail_size += len(vectors)
+
+    def take(self, ids: np.ndarray) -> np.ndarray:
+        """행 ID 배열(임의 shape)에 해당하는 벡터 (ids.shape + (차원,))"""
+        ids = np.asarray(ids, dtype=np.int64)
+        flat = ids.reshape(-1)
+        result = np.empty((flat.size, self.dimension), dtype=np.float32)
+        in_base = flat < self.base_size
+        if in_base.any():
+            # 정렬된 순서로 읽어 mmap 페이지 접근을 순차화
+            base_ids = flat[in_base]
+            order = np.argsort(base_ids, kind='stable')
+            rows = np.empty((base_ids.size, self.dimension), dtype=np.float32)
+            rows[order] = self._base[base_ids[order]]
+            result[in_base] = rows
+        if not in_base.all():
+            # 배치 단위 조각에서 직접 조회 (동시 추가 중에도 리스트를 바꾸지 않음)
+            chunks = list(self._tail)
+            starts = np.cumsum([0] + [len(chunk) for chunk in chunks])
+            positions = np.nonzero(~in_base)[0]
+            tail_ids = flat[positions] - self.base_size
+            chunk_ids = np.searchsorted(starts, tail_ids, side='right') - 1
+            for c in np.unique(chunk_ids).tolist():
+                selected = chunk_ids == c
+                result[positions[selected]] = chunks[c][tail_ids[selected] - starts[c]]
+        return result.reshape(ids.shape + (self.dimension,))
+
+    def save(self, path: str):
+        """.npy 파일로 저장 (전체를 메모리에 모으지 않고 mmap으로 복사)"""
+        tmp_path = f"{path}.tmp"
+        out = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32, shape=(len(self), self.dimension)
+        )
+        chunk = 65536
+        for start in range(0, self.base_size, chunk):
+            end = min(start + chunk, self.base_size)
+            out[start:end] = self._base[start:end]
+        position = self.base_size
+        for vectors in self._tail:
+            out[position:position + len(vectors)] = vectors
+            position += len(vectors)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path: str, dimension: int) -> 'VectorColumn':
+        """저장된 벡터 파일을 mmap으로 연다"""
+        column = cls(dimension)
+        base = np.load(path, mmap_mode='r')
+        if base.size:
+            column._base = base
+        return column
+
+
+class MetadataTable:
+    """메타데이터 컬럼 테이블
+
+    키별로 컬럼을 만들어 저장한다.
+      - int / float: NumPy 배열 (+ 결측 마스크)
+      - category: 고유값 사전 + int32 코드 배열 (category, file_name 등)
+      - text: 고유값이 많은 문자열 (TextColumn)
+      - json: 그 외 값 (리스트 등, JSON 문자열 TextColumn)
+    행 조회 시 해당 행의 dict를 새로 구성하여 반환한다.
+    """
+
+    def __init__(self, rows: Optional[Iterable[Dict[str, Any]]] = None):
+        self._columns: Dict[str, Dict[str, Any]] = {}
+        self._base_size = 0
+        self._tail: List[Dict[str, Any]] = list(rows) if rows is not None else []
+
+    def __len__(self) -> int:
+        return self._base_size + len(self._tail)
+
+    def _base_value(self, column: Dict[str, Any], i: int):
+        """저장된 컬럼의 i번째 값 (결측이면 _MISSING)"""
+        kind = column['kind']
+        if kind in ('int', 'float'):
+            mask = column.get('mask')
+            if mask is not None and not mask[i]:
+                return _MISSING
+            value = column['data'][i]
+            return int(value) if kind == 'int' else float(value)
+        if kind == 'category':
+            code = int(column['data'][i])
+            return _MISSING if code < 0 else column['values'][code]
+        raw = column['data'][i]
+        if kind == 'text':
+            return raw if column['present'] is None or column['present'][i] else _MISSING
+        return json.loads(raw) if raw else _MISSING
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        if i >= self._base_size:
+            return self._tail[i - self._base_size]
+        row = {}
+        for name, column in self._columns.items():
+            value = self._base_value(column, i)
+            if value is not _MISSING:
+                row[name] = value
+        return row
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, row: Dict[str, Any]):
+        self._tail.append(row)
+
+    def extend(self, rows: Iterable[Dict[str, Any]]):
+        self._tail.extend(rows)
+
+    def column_codes(self, name: str):
+        """범주형 컬럼의 (고유값 리스트, 저장된 행의 코드 배열) 반환 (없으면 None)"""
+        column = self._columns.get(name)
+        if column is None or column['kind'] != 'category':
+            return None
+        return column['values'], column['data']
+
+    def mask(self, name: str, values: Iterable[Any]) -> np.ndarray:
+        """컬럼 값이 values 중 하나인 행의 불리언 마스크 (범주형은 코드 배열로 벡터 연산)"""
+        wanted = set(values)
+        size = len(self)
+        mask = np.zeros(size, dtype=bool)
+        column = self._columns.get(name)
+        if column is not None and self._base_size:
+            if column['kind'] == 'category':
+                codes = [code for code, v in enumerate(column['values']) if v in wanted]
+                mask[:self._base_size] = np.isin(np.asarray(column['data']), codes)
+            else:
+                for i in range(self._base_size):
+                    value = self._base_value(column, i)
+                    mask[i] = value is not _MISSING and value in wanted
+        # 호출 중 추가되는 행은 제외
+        for j, row in enumerate(self._tail[:size - self._base_size]):
+            mask[self._base_size + j] = row.get(name, _MISSING) in wanted
+        return mask
+
+    def distinct(self, name: str, rows: Optional[np.ndarray] = None) -> set:
+        """컬럼의 고유값 집합 (범주형 컬럼은 행을 디코딩하지 않음)
+
+        Args:
+            rows: 행별 불리언 마스크. 주어지면 True인 행의 값만 모은다
+                (마스크보다 뒤의 행은 제외, 삭제 표시된 행을 빼는 용도)
+        """
+        size = len(self) if rows is None else min(len(self), len(rows))
+        base_size = min(self._base_size, size)
+        column = self._columns.get(name)
+        if column is None:
+            values = set()
+        elif column['kind'] == 'category':
+            codes = np.asarray(column['data'])[:base_size]
+            if rows is not None:
+                codes = codes[rows[:base_size]]
+            values = {column['values'][c] for c in np.unique(codes).tolist() if c >= 0}
+        else:
+            values = {self._base_value(column, i) for i in range(base_size)
+                      if rows is None or rows[i]}
+            values.discard(_MISSING)
+        for j, row in enumerate(self._tail[:size - base_size]):
+            if name in row and (rows is None or rows[base_size + j]):
+                values.add(row[name])
+        return values
+
+    @staticmethod
+    def _infer_kind(values: List[Any], n_rows: int) -> str:
+        present = [v for v in values if v is not _MISSING]
+        if not present:
+            return 'json'
+        if all(isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_))
+               for v in present):
+            return 'int'
+        if all(isinstance(v, (float, np.floating)) for v in present):
+            return 'float'
+        if all(isinstance(v, str) for v in present):
+            unique = len(set(present))
+            return 'category' if unique <= max(16, n_rows * CATEGORY_MAX_RATIO) else 'text'
+        return 'json'
+
+    def _column_values(self, name: str) -> List[Any]:
+        """컬럼 하나의 전체 값 (저장된 부분은 컬럼에서 직접 읽음)"""
+        column = self._columns.get(name)
+        if column is None:
+            values = [_MISSING] * self._base_size
+        else:
+            values = [self._base_value(column, i) for i in range(self._base_size)]
+        values.extend(row.get(name, _MISSING) for row in self._tail)
+        return values
+
+    def save(self, directory: str, deleted: Optional[np.ndarray] = None):
+        """컬럼 파일들과 스키마(schema.json) 저장 (deleted로 표시된 행은 빈 행으로 저장)"""
+        n_rows = len(self)
+        deleted_rows = [] if deleted is None else np.nonzero(deleted[:n_rows])[0].tolist()
+        names: List[str] = list(self._columns.keys())
+        for row in self._tail:
+            for name in row:
+                if name not in self._columns and name not in names:
+                    names.append(name)
+
+        schema = {'num_rows': n_rows, 'columns': []}
+        for col_id, name in enumerate(names):
+            values = self._column_values(name)
+            for i in deleted_rows:
+                values[i] = _MISSING
+            kind = self._infer_kind(values, n_rows)
+            entry = {'name': name, 'kind': kind}
+            prefix = os.path.join(directory, f"col{col_id}")
+
+            if kind in ('int', 'float'):
+                dtype = np.int64 if kind == 'int' else np.float64
+                mask = np.array([v is not _MISSING for v in values], dtype=bool)
+                data = np.array([v if v is not _MISSING else 0 for v in values], dtype=dtype)
+                _replace_npy(f"{prefix}.npy", data)
+                if not mask.all():
+                    _replace_npy(f"{prefix}_mask.npy", mask)
+                    entry['has_mask'] = True
+            elif kind == 'category':
+                categories = sorted({v for v in values if v is not _MISSING})
+                lookup = {v: code for code, v in enumerate(categories)}
+                codes = np.array([lookup[v] if v is not _MISSING else -1 for v in values],
+                                 dtype=np.int32)
+                _replace_npy(f"{prefix}.npy", codes)
+                entry['values'] = categories
+            else:
+                if kind == 'text':
+                    encoded = TextColumn(v if v is not _MISSING else '' for v in values)
+                    mask = np.array([v is not _MISSING for v in values], dtype=bool)
+                    if not mask.all():
+                        _replace_npy(f"{prefix}_mask.npy", mask)
+                        entry['has_mask'] = True
+                else:
+                    encoded = TextColumn(
+                        json.dumps(v, ensure_ascii=False, default=str) if v is not _MISSING else ''
+                        for v in values
+                    )
+                encoded.save(f"{prefix}.bin", f"{prefix}_offsets.npy")
+            schema['columns'].append(entry)
+
+        tmp_path = os.path.join(directory, "schema.json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(schema, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, "schema.json"))
+
+    @classmethod
+    def open(cls, directory: str) -> 'MetadataTable':
+        """저장된 컬럼들을 mmap으로 연다"""
+        with open(os.path.join(directory, "schema.json"), 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+
+        table = cls()
+        table._base_size = schema['num_rows']
+        for col_id, entry in enumerate(schema['columns']):
+            prefix = os.path.join(directory, f"col{col_id}")
+            kind = entry['kind']
+            column: Dict[str, Any] = {'kind': kind}
+            if kind in ('int', 'float', 'category'):
+                column['data'] = np.load(f"{prefix}.npy", mmap_mode='r')
+                if kind == 'category':
+                    column['values'] = entry['values']
+                elif entry.get('has_mask'):
+                    column['mask'] = np.load(f"{prefix}_mask.npy", mmap_mode='r')
+            else:
+                column['data'] = TextColumn.open(f"{prefix}.bin", f"{prefix}_offsets.npy")
+                if kind == 'text':
+                    column['present'] = (np.load(f"{prefix}_mask.npy", mmap_mode='r')
+                                         if entry.get('has_mask') else None)
+            table._columns[entry['name']] = column
+        return table
+
+
+class DocumentStore:
+    """청크 원문(TextColumn) + 메타데이터(MetadataTable) 디렉토리 저장소
+
+    디렉토리 구성:
+        texts.bin / texts_offsets.npy  청크 원문 UTF-8 blob과 오프셋
+        schema.json / col*.npy|bin      메타데이터 컬럼
+    """
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return (os.path.exists(os.path.join(directory, "schema.json"))
+                and os.path.exists(os.path.join(directory, "texts_offsets.npy")))
+
+    @staticmethod
+    def save(directory: str,
+             documents: TextColumn,
+             metadatas: MetadataTable,
+             deleted: Optional[np.ndarray] = None):
+        os.makedirs(directory, exist_ok=True)
+        documents.save(os.path.join(directory, "texts.bin"),
+                       os.path.join(directory, "texts_offsets.npy"),
+                       deleted=deleted)
+        metadatas.save(directory, deleted=deleted)
+
+    @staticmethod
+    def open(directory: str):
+        """(TextColumn, MetadataTable) 반환"""
+        documents = TextColumn.open(os.path.join(directory, "texts.bin"),
+                                    os.path.join(directory, "texts_offsets.npy"))
+        metadatas = MetadataTable.open(directory)
+        if len(documents) != len(metadatas):
+            raise ValueError("문서 수와 메타데이터 수가 일치하지 않음")
+        logger.info(f"문서 저장소 열기 완료: {len(documents)}개 문서 (mmap)")
+        return documents, metadatas
@@ -0,0 +1,153 @@
+"""
+RAG 3단계 보조: Embedding Cache
+모델 이름 + 청크 텍스트 해시를 키로 하는 디스크 임베딩 캐시 (mmap 벡터 파일 + 키 색인)
+"""
+import os
+import json
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16  # blake2b digest 바이트 수
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    """모델 이름과 텍스트의 내용 해시 (모델이 바뀌면 키도 바뀜)"""
+    digest = hashlib.blake2b(model_name.encode('utf-8'), digest_size=KEY_SIZE)
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """내용 주소 기반 임베딩 캐시 (추가 전용)
+
+    벡터는 float32 원시 파일(vectors.f32)에, 키는 같은 순서로 keys.bin에 이어 쓴다.
+    벡터를 먼저 쓰고 키를 나중에 쓰므로, 중단되어도 키가 있는 행은 벡터가 온전하다.
+    조회는 벡터 파일의 읽기 전용 mmap으로 하므로 적중한 행의 페이지만 읽는다.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, dimension: int):
+        self.model_name = model_name
+        self.dimension = dimension
+        model_id = hashlib.blake2b(model_name.encode('utf-8'), digest_size=8).hexdigest()
+        self.directory = os.path.join(cache_dir, "embedding_cache", model_id)
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.keys_path = os.path.join(self.directory, "keys.bin")
+        self._rows: Dict[bytes, int] = {}
+        self._mapped: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._open()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _open(self):
+        """키 색인 로드 (키와 벡터 중 짧은 쪽 기준으로 끝부분 정리)"""
+        info_path = os.path.join(self.directory, "info.json")
+        if not os.path.exists(info_path):
+            with open(info_path, 'w', encoding='utf-8') as f:
+                json.dump({'model_name': self.model_name, 'dimension': self.dimension},
+                          f, ensure_ascii=False, indent=2)
+        else:
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            if info.get('dimension') != self.dimension:
+                raise ValueError(f"임베딩 캐시 차원 불일치: {info.get('dimension')} != {self.dimension}")
+
+        keys = b''
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'rb') as f:
+                keys = f.read()
+        row_bytes = self.dimension * 4
+        vector_bytes = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        rows = min(len(keys) // KEY_SIZE, vector_bytes // row_bytes)
+
+        # 기록 도중 중단된 꼬리 제거
+        if len(keys) != rows * KEY_SIZE:
+            with open(self.keys_path, 'r+b') as f:
+                f.truncate(rows * KEY_SIZE)
+        if vector_bytes != rows * row_bytes:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(rows * row_bytes)
+
+        self._rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(rows)}
+        if rows:
+            logger.info(f"임베딩 캐시 로드: {rows}개 ({self.directory})")
+
+    def _vectors(self, rows: int) -> np.ndarray:
+        """적어도 rows행을 담은 읽기 전용 mmap (파일이 커졌으면 다시 매핑)"""
+        if self._mapped is None or len(self._mapped) < rows:
+            self._mapped = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                     shape=(len(self._rows), self.dimension))
+        return self._mapped
+
+    def lookup(self, keys: List[bytes]) -> np.ndarray:
+        """키별 캐시 행 번호 (없으면 -1)"""
+        with self._lock:
+            rows = np.fromiter((self._rows.get(key, -1) for key in keys),
+                               dtype=np.int64, count=len(keys))
+            hits = int(np.count_nonzero(rows >= 0))
+            self.hits += hits
+            self.misses += len(keys) - hits
+            return rows
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """행 번호의 벡터 (복사본)"""
+        with self._lock:
+            if len(rows) == 0:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            vectors = self._vectors(int(rows.max()) + 1)
+            order = np.argsort(rows, kind='stable')  # mmap 페이지를 순차 접근
+            result = np.empty((len(rows), self.dimension), dtype=np.float32)
+            result[order] = vectors[rows[order]]
+            return result
+
+    def add(self, keys: List[bytes], vectors: np.ndarray):
+        """새 임베딩 추가 (이미 있는 키는 건너뜀)"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        with self._lock:
+            new_keys = []
+            new_rows = []
+            seen = set()
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in seen:
+                    seen.add(key)
+                    new_keys.append(key)
+                    new_rows.append(i)
+            if not new_keys:
+                return
+
+            # 벡터를 먼저 기록한 뒤 키를 기록 (키가 커밋 표시)
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors[new_rows].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, 'ab') as f:
+                f.write(b''.join(new_keys))
+                f.flush()
+                os.fsync(f.fileno())
+
+            start = len(self._rows)
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = start + offset
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._rows),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'directory': self.directory
+            }
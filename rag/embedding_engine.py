@@ -3,60 +3,215 @@ RAG 3단계: Embedding Engine
 한국어 텍스트 임베딩 및 벡터화
 """
 import os
+import copy
+import time
+import threading
+from functools import lru_cache
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Callable
 from sentence_transformers import SentenceTransformer
 import pickle
 import json
 from langchain.schema import Document
 import logging
 
+from rag.embedding_cache import EmbeddingCache, cache_key
+from rag.onnx_encoder import OnnxSentenceEncoder, onnx_model_dir
+from rag.embedding_pool import EmbeddingPool
+from rag.embedding_file import EmbeddingFile
+from rag.ingest_pipeline import batched
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class KoreanEmbeddingEngine:
     """한국어 특화 임베딩 엔진"""
     
+    BACKENDS = ("torch", "onnx", "onnx_int8")
+    
     def __init__(self, 
                  model_name: str = "jhgan/ko-sroberta-multitask",
                  cache_dir: str = "./models",
-                 use_cache: bool = True):
+                 use_cache: bool = True,
+                 length_bucketing: bool = True,
+                 batch_token_budget: int = 8192,
+                 max_batch_size: int = 128,
+                 backend: str = "torch",
+                 onnx_threads: Optional[int] = None,
+                 num_workers: int = 1,
+                 lazy_load: bool = False,
+                 dimension: Optional[int] = None):
         
+        if backend not in self.BACKENDS:
+            raise ValueError(f"지원하지 않는 임베딩 백엔드: {backend} (선택: {', '.join(self.BACKENDS)})")
         self.model_name = model_name
         self.cache_dir = cache_dir
         self.use_cache = use_cache
+        # 길이별 배치: 토큰 수로 정렬해 비슷한 길이끼리 묶고, 배치당 (텍스트 수 × 최대 토큰 수)가
+        # batch_token_budget 이하가 되도록 배치 크기를 정함 (짧은 제목은 큰 배치, 긴 본문은 작은 배치)
+        self.length_bucketing = length_bucketing
+        self.batch_token_budget = batch_token_budget
+        self.max_batch_size = max_batch_size
+        # 추론 백엔드: torch(SentenceTransformer) / onnx(ONNX Runtime) / onnx_int8(동적 int8 양자화)
+        self.backend = backend
+        self.onnx_threads = onnx_threads
+        # 임베딩을 만든 모델 식별자 (백엔드마다 임베딩 값이 조금씩 다르므로 백엔드별로 분리)
+        # 캐시 키와 벡터 DB 정보 파일(embedding_model)에 사용
+        self.model_fingerprint = model_name if backend == "torch" else f"{model_name}#{backend}"
         self.model = None
-        self.dimension = None
+        self.dimension = dimension
+        self.load_error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._model_lock = threading.Lock()
+        self._tokenizer = None  # 풀 사용 시 부모 프로세스가 쓰는 토크나이저 (모델 없이 로드)
+        self._max_seq_length: Optional[int] = None  # 풀 사용 시 모델 입력 최대 토큰 수
+        self._load_thread: Optional[threading.Thread] = None
+        # num_workers > 1이면 대량 임베딩을 모델 복제본 프로세스들에 분산 (torch는 프로세스당 1스레드)
+        self.num_workers = num_workers
+        self.pool: Optional[EmbeddingPool] = None
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        self.last_cache_stats: Dict[str, Any] = {}  # 마지막 encode_texts의 캐시 적중 정보
         
         # 캐시 디렉토리 생성
         os.makedirs(cache_dir, exist_ok=True)
         
-        # 모델 로드
-        self._load_model()
+        # 차원은 인자 → 이전 로드 기록 순으로 확인 (모델 로드 없이 벡터 DB 생성 가능)
+        if self.dimension is None:
+            self.dimension = self._recorded_dimension()
+        
+        if num_workers > 1:
+            # 부모 프로세스는 모델을 로드하지 않음 (기록이 없으면 작업 프로세스가 보고한 값 사용)
+            self.pool = EmbeddingPool(num_workers, self.dimension, {
+                'model_name': model_name,
+                'cache_dir': cache_dir,
+                'backend': backend,
+                'onnx_threads': onnx_threads
+            })
+            self.dimension = self.pool.dimension
+            self._max_seq_length = (self._recorded_info().get('max_seq_length')
+                                    or self.pool.model_info()['max_seq_length'])
+        elif not lazy_load or self.dimension is None:
+            # 모델 로드 (lazy_load면 첫 인코딩 또는 load_in_background 때 로드)
+            if lazy_load:
+                logger.info("기록된 임베딩 차원이 없어 모델을 바로 로드합니다")
+            self._ensure_model()
+        
+        # 임베딩 캐시 (변경되지 않은 청크는 재인코딩하지 않음)
+        if use_cache:
+            try:
+                self.embedding_cache = EmbeddingCache(cache_dir, self.model_fingerprint, self.dimension)
+            except Exception as e:
+                logger.error(f"임베딩 캐시 열기 실패 (캐시 없이 진행): {e}")
+    
+    @property
+    def is_ready(self) -> bool:
+        """모델(또는 작업 프로세스 풀)이 준비되어 바로 인코딩할 수 있는지"""
+        return self.model is not None or self.pool is not None
+    
+    @property
+    def status(self) -> str:
+        """모델 상태: ready / loading / failed / not_loaded"""
+        if self.is_ready:
+            return "ready"
+        if self.load_error is not None:
+            return "failed"
+        if self._load_thread is not None:
+            return "loading"
+        return "not_loaded"
+    
+    def load_in_background(self):
+        """백그라운드 스레드에서 모델 로드 및 워밍업 (완료 여부는 is_ready / status)"""
+        if self.model is not None or self._load_thread is not None:
+            return
+        
+        def load():
+            try:
+                self._ensure_model()
+            except Exception as e:
+                self.load_error = str(e)
+        
+        self._load_thread = threading.Thread(target=load, name="embedding-model-load", daemon=True)
+        self._load_thread.start()
+    
+    def _ensure_model(self):
+        """모델이 없으면 로드 (여러 스레드가 동시에 호출해도 한 번만 로드)"""
+        if self.model is None:
+            with self._model_lock:
+                if self.model is None:
+                    self._load_model()
+        return self.model
+    
+    def _record_path(self) -> str:
+        return os.path.join(self.cache_dir, "model_info.json")
+    
+    def _recorded_info(self) -> Dict[str, Any]:
+        """이전에 로드했을 때 기록한 모델 정보 (임베딩 차원, max_seq_length, 없으면 빈 dict)"""
+        try:
+            with open(self._record_path(), 'r', encoding='utf-8') as f:
+                return json.load(f).get(self.model_fingerprint, {})
+        except (OSError, ValueError):
+            return {}
+    
+    def _recorded_dimension(self) -> Optional[int]:
+        """이전에 로드했을 때 기록한 임베딩 차원 (없으면 None)"""
+        return self._recorded_info().get('dimension')
+    
+    def _record_dimension(self):
+        """모델 식별자별 임베딩 차원과 max_seq_length 기록 (다음 시작 때 모델 로드 없이 사용)"""
+        try:
+            records = {}
+            if os.path.exists(self._record_path()):
+                with open(self._record_path(), 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            records[self.model_fingerprint] = {
+                'dimension': self.dimension,
+                'max_seq_length': getattr(self.model, 'max_seq_length', None)
+            }
+            tmp_path = f"{self._record_path()}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self._record_path())
+        except Exception as e:
+            logger.warning(f"임베딩 차원 기록 실패: {e}")
     
     def _load_model(self):
         """임베딩 모델 로드"""
         try:
-            logger.info(f"임베딩 모델 로드 중: {self.model_name}")
+            logger.info(f"임베딩 모델 로드 중: {self.model_name} (백엔드: {self.backend})")
+            started = time.perf_counter()
 
-            # PyTorch meta tensor 문제 해결을 위한 설정
-            import torch
-            torch.set_num_threads(1)  # 멀티스레딩 이슈 방지
+            if self.backend != "torch":
+                # ONNX Runtime 백엔드 (처음 한 번 ONNX 내보내기/양자화 후 cache_dir에 보관)
+                model = OnnxSentenceEncoder.load_or_export(
+                    self.model_name,
+                    self.cache_dir,
+                    quantized=self.backend == "onnx_int8",
+                    num_threads=self.onnx_threads
+                )
+            else:
+                # PyTorch meta tensor 문제 해결을 위한 설정
+                import torch
+                torch.set_num_threads(1)  # 멀티스레딩 이슈 방지
 
-            self.model = SentenceTransformer(
-                self.model_name,
-                cache_folder=self.cache_dir,
-                device='cpu'  # CPU 사용 강제 지정
-            )
+                model = SentenceTransformer(
+                    self.model_name,
+                    cache_folder=self.cache_dir,
+                    device='cpu'  # CPU 사용 강제 지정
+                )
 
-            # 모델을 명시적으로 CPU로 이동
-            self.model.to('cpu')
+                # 모델을 명시적으로 CPU로 이동
+                model.to('cpu')
 
-            # 차원 확인
-            test_embedding = self.model.encode("테스트")
-            self.dimension = len(test_embedding)
+            # 차원 확인 (첫 인코딩 워밍업 겸)
+            dimension = len(model.encode("테스트"))
+            if self.dimension is not None and dimension != self.dimension:
+                raise ValueError(f"임베딩 차원 불일치: 모델 {dimension} != 기록 {self.dimension}")
+            self.dimension = dimension
+            self.model = model
+            self.load_seconds = time.perf_counter() - started
+            self._record_dimension()
 
-            logger.info(f"모델 로드 완료. 임베딩 차원: {self.dimension}")
+            logger.info(f"모델 로드 완료. 임베딩 차원: {self.dimension} ({self.load_seconds:.1f}초)")
 
         except Exception as e:
             logger.error(f"모델 로드 실패: {e}")
@@ -68,23 +223,168 @@ class KoreanEmbeddingEngine:
             if not texts:
                 return np.array([])
             
-            logger.info(f"{len(texts)}개 텍스트 임베딩 생성 중...")
+            if self.embedding_cache is None:
+                logger.info(f"{len(texts)}개 텍스트 임베딩 생성 중...")
+                embeddings = self._encode(texts, show_progress)
+                logger.info(f"임베딩 생성 완료: {embeddings.shape}")
+                return embeddings
             
-            # 배치 처리로 임베딩 생성
-            embeddings = self.model.encode(
-                texts,
-                show_progress_bar=show_progress,
-                batch_size=32,  # 메모리 효율성 고려
-                normalize_embeddings=True  # 코사인 유사도 최적화
-            )
+            # 캐시 조회 후 없는 텍스트만 인코딩 (같은 텍스트는 한 번만)
+            keys = [cache_key(self.model_fingerprint, text) for text in texts]
+            rows = self.embedding_cache.lookup(keys)
+            embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+            hit = rows >= 0
+            embeddings[hit] = self.embedding_cache.take(rows[hit])
+            
+            misses: Dict[bytes, List[int]] = {}
+            for i in np.nonzero(~hit)[0].tolist():
+                misses.setdefault(keys[i], []).append(i)
+            if misses:
+                miss_keys = list(misses)
+                logger.info(f"{len(texts)}개 중 {len(miss_keys)}개 텍스트 임베딩 생성 중...")
+                encoded = self._encode([texts[misses[key][0]] for key in miss_keys], show_progress)
+                for key, vector in zip(miss_keys, encoded):
+                    embeddings[misses[key]] = vector
+                self.embedding_cache.add(miss_keys, encoded)
             
-            logger.info(f"임베딩 생성 완료: {embeddings.shape}")
+            n_hits = int(np.count_nonzero(hit))
+            self.last_cache_stats = {
+                'texts': len(texts),
+                'hits': n_hits,
+                'encoded': len(misses),
+                'hit_rate': n_hits / len(texts)
+            }
+            logger.info(f"임베딩 생성 완료: {embeddings.shape} "
+                        f"(캐시 적중 {n_hits}/{len(texts)}, {n_hits / len(texts):.1%})")
             return embeddings
             
         except Exception as e:
             logger.error(f"임베딩 생성 실패: {e}")
             return np.array([])
     
+    def _encode(self, texts: List[str], show_progress: bool) -> np.ndarray:
+        """모델로 임베딩 생성 (배치 처리, 결과는 입력 순서)"""
+        if self.pool is not None:
+            # 부모 프로세스는 모델 복제본 없이 토크나이저로 배치만 나눔
+            if self.length_bucketing:
+                batches = self._length_batches(self._token_lengths(texts))
+            else:
+                batches = [np.arange(start, min(start + 32, len(texts)))
+                           for start in range(0, len(texts), 32)]
+            return self.pool.encode(texts, batches, show_progress)
+        
+        model = self._ensure_model()
+        if not self.length_bucketing or len(texts) <= 1:
+            embeddings = model.encode(
+                texts,
+                show_progress_bar=show_progress,
+                batch_size=32,  # 메모리 효율성 고려
+                normalize_embeddings=True  # 코사인 유사도 최적화
+            )
+            return np.asarray(embeddings, dtype=np.float32)
+        
+        batches = self._length_batches(self._token_lengths(texts))
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        if show_progress:
+            from tqdm import tqdm
+            batches = tqdm(batches, desc="임베딩", unit="batch")
+        for batch in batches:
+            embeddings[batch] = model.encode(
+                [texts[i] for i in batch],
+                show_progress_bar=False,
+                batch_size=len(batch),
+                normalize_embeddings=True
+            )
+        return embeddings
+    
+    def _tokenizer_info(self) -> Tuple[Any, int]:
+        """(토크나이저, max_seq_length)
+        
+        작업 프로세스 풀을 쓰는 부모 프로세스는 모델을 로드하지 않고 토크나이저만 로드한다
+        (max_seq_length는 기록한 값 또는 작업 프로세스가 보고한 값).
+        """
+        if self.pool is not None:
+            # 토크나이저를 로드하지 못해도 모델은 로드하지 않음 (토큰 수 대신 글자 수 사용)
+            if self._tokenizer is None:
+                with self._model_lock:
+                    if self._tokenizer is None:
+                        # False는 로드 실패 (다시 시도하지 않음)
+                        self._tokenizer = self._load_tokenizer() or False
+            return self._tokenizer or None, self._max_seq_length or 512
+        model = self._ensure_model()
+        return getattr(model, 'tokenizer', None), getattr(model, 'max_seq_length', None) or 512
+    
+    def _load_tokenizer(self):
+        """모델 가중치 없이 토크나이저만 로드 (실패하면 None)"""
+        try:
+            from transformers import AutoTokenizer
+            if self.backend != "torch":
+                # ONNX 내보내기 때 토크나이저도 함께 저장됨
+                source = onnx_model_dir(self.cache_dir, self.model_name)
+            else:
+                # sentence-transformers 2.x는 cache_dir/<모델 이름>에, 3.x는 HF 캐시 형식으로 저장
+                source = os.path.join(self.cache_dir, self.model_name.replace('/', '_'))
+                if not os.path.isdir(source):
+                    source = self.model_name
+            tokenizer = AutoTokenizer.from_pretrained(source, cache_dir=self.cache_dir)
+            logger.info(f"토크나이저 로드 완료 (모델 없이): {source}")
+            return tokenizer
+        except Exception as e:
+            logger.warning(f"토크나이저만 로드 실패, 토큰 수 대신 글자 수 사용: {e}")
+            return None
+    
+    def _token_lengths(self, texts: List[str]) -> np.ndarray:
+        """텍스트별 토큰 수 (최대 시퀀스 길이에서 자름, 토크나이저가 없으면 글자 수)"""
+        tokenizer, max_length = self._tokenizer_info()
+        if tokenizer is None:
+            return np.minimum([len(text) for text in texts], max_length)
+        input_ids = tokenizer(texts, add_special_tokens=True, truncation=True,
+                              max_length=max_length)['input_ids']
+        return np.array([len(ids) for ids in input_ids])
+    
+    @property
+    def max_chunk_tokens(self) -> int:
+        """모델 입력 창에 들어가는 본문 토큰 수 (max_seq_length - 특수 토큰 수)"""
+        tokenizer, max_length = self._tokenizer_info()
+        if tokenizer is None:
+            raise ValueError("특수 토큰 수를 확인할 토크나이저가 없습니다")
+        return max_length - tokenizer.num_special_tokens_to_add()
+    
+    def token_length_function(self, cache_size: int = 65536) -> Callable[[str], int]:
+        """청킹용 길이 함수: 모델 토크나이저의 토큰 수 (특수 토큰 제외, 자르지 않음)
+        
+        텍스트 분할기는 같은 조각의 길이를 여러 번 재므로 문자열별 결과를 LRU 캐시한다.
+        """
+        tokenizer, _ = self._tokenizer_info()
+        if tokenizer is None:
+            raise ValueError("토큰 길이 측정에 사용할 토크나이저가 없습니다")
+        # 청킹은 임베딩과 다른 스레드에서 실행되므로 사본 사용
+        # (fast tokenizer를 스레드 간에 공유하면 'Already borrowed' 오류가 날 수 있음)
+        tokenizer = copy.deepcopy(tokenizer)
+        
+        @lru_cache(maxsize=cache_size)
+        def count_tokens(text: str) -> int:
+            return len(tokenizer(text, add_special_tokens=False, truncation=False)['input_ids'])
+        
+        return count_tokens
+    
+    def _length_batches(self, lengths: np.ndarray) -> List[np.ndarray]:
+        """길이순으로 정렬한 인덱스를 토큰 예산에 맞는 배치로 나눔
+        
+        정렬되어 있으므로 배치의 패딩 길이는 마지막(가장 긴) 텍스트의 길이다.
+        """
+        order = np.argsort(lengths, kind='stable')
+        batches = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            size = end - start
+            if size > 1 and (size * lengths[order[end - 1]] > self.batch_token_budget
+                             or size > self.max_batch_size):
+                batches.append(order[start:end - 1])
+                start = end - 1
+        batches.append(order[start:])
+        return batches
+    
     def encode_documents(self, documents: List[Document]) -> tuple[np.ndarray, List[Dict]]:
         """Document 객체들을 임베딩으로 변환 (메타데이터 포함)"""
         try:
@@ -105,10 +405,32 @@ class KoreanEmbeddingEngine:
             logger.error(f"문서 임베딩 실패: {e}")
             return np.array([]), []
     
+    def encode_document_batches(self,
+                                documents: Iterable[Document],
+                                batch_size: int = 256) -> Iterator[Tuple[np.ndarray, List[Dict], List[str]]]:
+        """Document 스트림을 batch_size개씩 임베딩하여 (임베딩, 메타데이터, 텍스트) 배치로 반환
+        
+        다음 배치는 호출자가 이전 배치를 소비한 뒤에 읽으므로 메모리 사용량은 문서 수와
+        관계없이 배치 크기에 비례한다. 배치 임베딩에 실패하면 예외를 발생시킨다.
+        """
+        offset = 0
+        for batch in batched(documents, batch_size):
+            texts = [doc.page_content for doc in batch]
+            metadatas = [doc.metadata for doc in batch]
+            
+            embeddings = self.encode_texts(texts, show_progress=False)
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"배치 임베딩 실패 ({offset}번째 문서부터 {len(texts)}개)")
+            
+            for i, metadata in enumerate(metadatas):
+                metadata['embedding_id'] = offset + i
+            offset += len(texts)
+            yield embeddings, metadatas, texts
+    
     def encode_query(self, query: str) -> np.ndarray:
         """검색 쿼리를 임베딩으로 변환"""
         try:
-            embedding = self.model.encode(
+            embedding = self._ensure_model().encode(
                 [query],
                 normalize_embeddings=True
             )
@@ -118,6 +440,18 @@ class KoreanEmbeddingEngine:
             logger.error(f"쿼리 임베딩 실패: {e}")
             return np.array([])
     
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """여러 검색 쿼리를 한 번의 모델 호출로 임베딩 (QueryBatcher용)
+        
+        실패하면 예외를 그대로 전달하여 배치의 각 호출자가 오류를 받게 한다.
+        """
+        embeddings = self._ensure_model().encode(
+            queries,
+            batch_size=len(queries),
+            normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+    
     def calculate_similarity(self, 
                            query_embedding: np.ndarray, 
                            doc_embeddings: np.ndarray) -> np.ndarray:
@@ -135,31 +469,63 @@ class KoreanEmbeddingEngine:
                        embeddings: np.ndarray, 
                        metadatas: List[Dict], 
                        filepath: str):
-        """임베딩과 메타데이터를 파일로 저장"""
+        """임베딩과 메타데이터를 파일로 저장 (기존 파일은 덮어씀)
+        
+        filepath의 확장자(.pkl/.npy/.json)를 뗀 경로에 <base>.npy(float32),
+        <base>.meta.jsonl, <base>.meta.idx, <base>.json(매니페스트)를 쓴다.
+        """
         try:
-            data = {
-                'embeddings': embeddings,
-                'metadatas': metadatas,
-                'model_name': self.model_name,
-                'dimension': self.dimension
-            }
+            embedding_file = EmbeddingFile(filepath)
+            embedding_file.create(self.dimension, self._embedding_file_info())
+            embedding_file.append(embeddings, metadatas)
             
-            with open(filepath, 'wb') as f:
-                pickle.dump(data, f)
-            
-            logger.info(f"임베딩 저장 완료: {filepath}")
+            logger.info(f"임베딩 저장 완료: {embedding_file.vectors_path} ({embedding_file.rows}개)")
             
         except Exception as e:
             logger.error(f"임베딩 저장 실패: {e}")
     
-    def load_embeddings(self, filepath: str) -> tuple[np.ndarray, List[Dict]]:
-        """저장된 임베딩과 메타데이터 로드"""
+    def append_embeddings(self, 
+                         embeddings: np.ndarray, 
+                         metadatas: List[Dict], 
+                         filepath: str):
+        """저장된 임베딩 파일 끝에 이어쓰기 (파일이 없으면 생성)"""
+        try:
+            embedding_file = EmbeddingFile(filepath)
+            if not embedding_file.exists():
+                embedding_file.create(self.dimension, self._embedding_file_info())
+            elif embedding_file.manifest.get('model_fingerprint', self.model_fingerprint) != self.model_fingerprint:
+                raise ValueError(f"임베딩 모델 불일치: 파일 {embedding_file.manifest.get('model_fingerprint')} "
+                                 f"!= 현재 {self.model_fingerprint}")
+            embedding_file.append(embeddings, metadatas)
+            
+            logger.info(f"임베딩 이어쓰기 완료: {embedding_file.vectors_path} "
+                        f"(+{len(metadatas)}개, 총 {embedding_file.rows}개)")
+            
+        except Exception as e:
+            logger.error(f"임베딩 이어쓰기 실패: {e}")
+            raise
+    
+    def _embedding_file_info(self) -> Dict[str, Any]:
+        return {'model_name': self.model_name, 'model_fingerprint': self.model_fingerprint}
+    
+    def load_embeddings(self, 
+                       filepath: str, 
+                       start: int = 0, 
+                       stop: Optional[int] = None,
+                       mmap: bool = True) -> tuple[np.ndarray, List[Dict]]:
+        """저장된 임베딩과 메타데이터 로드
+        
+        임베딩은 읽기 전용 memmap([start, stop) 구간)으로 반환하므로 전체 행렬을 메모리에
+        올리지 않고, 메타데이터도 해당 구간의 줄만 읽는다. mmap=False면 복사본을 반환한다.
+        이전 pickle 형식(.pkl 파일)도 읽는다.
+        """
         try:
-            with open(filepath, 'rb') as f:
-                data = pickle.load(f)
+            embedding_file = EmbeddingFile(filepath)
+            if not embedding_file.exists() and filepath.endswith('.pkl') and os.path.exists(filepath):
+                return self._load_pickled_embeddings(filepath, start, stop)
             
-            embeddings = data['embeddings']
-            metadatas = data['metadatas']
+            embeddings = embedding_file.vectors(mmap=mmap)[start:stop]
+            metadatas = embedding_file.metadatas(start, stop)
             
             logger.info(f"임베딩 로드 완료: {embeddings.shape}, {len(metadatas)}개 메타데이터")
             return embeddings, metadatas
@@ -168,12 +534,40 @@ class KoreanEmbeddingEngine:
             logger.error(f"임베딩 로드 실패: {e}")
             return np.array([]), []
     
+    def _load_pickled_embeddings(self, 
+                                filepath: str, 
+                                start: int, 
+                                stop: Optional[int]) -> tuple[np.ndarray, List[Dict]]:
+        """이전 pickle 형식 로드 (전체를 메모리로 읽음, save_embeddings로 다시 저장 권장)"""
+        logger.warning(f"pickle 형식 임베딩 파일: {filepath} (save_embeddings로 변환 권장)")
+        with open(filepath, 'rb') as f:
+            data = pickle.load(f)
+        
+        embeddings = data['embeddings'][start:stop]
+        metadatas = data['metadatas'][start:stop]
+        
+        logger.info(f"임베딩 로드 완료: {embeddings.shape}, {len(metadatas)}개 메타데이터")
+        return embeddings, metadatas
+    
+    def close(self):
+        """임베딩 작업 프로세스 종료"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+    
     def get_model_info(self) -> Dict[str, Any]:
         """모델 정보 반환"""
         return {
             'model_name': self.model_name,
+            'backend': self.backend,
+            'model_fingerprint': self.model_fingerprint,
+            'status': self.status,
+            'load_seconds': self.load_seconds,
+            'load_error': self.load_error,
             'dimension': self.dimension,
-            'cache_dir': self.cache_dir
+            'cache_dir': self.cache_dir,
+            'workers': self.num_workers,
+            'embedding_cache': self.embedding_cache.stats() if self.embedding_cache is not None else None
         }
 
 
@@ -221,17 +615,19 @@ def main():
                 print(f"  {i+1}. {sim:.4f} - {meta['file_name']}")
                 print(f"     {test_documents[i].page_content[:50]}...")
         
-        # 저장/로드 테스트
-        test_file = "test_embeddings.pkl"
-        engine.save_embeddings(embeddings, metadatas, test_file)
+        # 저장/이어쓰기/로드 테스트
+        test_file = "test_embeddings"
+        engine.save_embeddings(embeddings[:2], metadatas[:2], test_file)
+        engine.append_embeddings(embeddings[2:], metadatas[2:], test_file)
         
         loaded_embeddings, loaded_metadatas = engine.load_embeddings(test_file)
-        if loaded_embeddings.size > 0:
+        if loaded_embeddings.size > 0 and len(loaded_metadatas) == len(metadatas):
             print(f"\n✅ 저장/로드 테스트 성공")
         
         # 정리
-        if os.path.exists(test_file):
-            os.remove(test_file)
+        for suffix in (".npy", ".meta.jsonl", ".meta.idx", ".json"):
+            if os.path.exists(test_file + suffix):
+                os.remove(test_file + suffix)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+"""
+RAG 3단계 보조: Embedding File
+임베딩 행렬(float32 .npy, mmap 읽기/이어쓰기)과 메타데이터(JSON Lines) + 매니페스트 파일 형식
+"""
+import os
+import json
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# .npy 헤더 고정 길이 (행 수가 늘어도 헤더를 제자리에서 다시 쓸 수 있도록 여유를 둠)
+NPY_HEADER_SIZE = 128
+
+
+def _npy_header(rows: int, dimension: int) -> bytes:
+    """float32 C 순서 (rows, dimension) 배열의 .npy 1.0 헤더 (NPY_HEADER_SIZE 바이트)"""
+    header = f"{{'descr': '<f4', 'fortran_order': False, 'shape': ({rows}, {dimension}), }}"
+    padding = NPY_HEADER_SIZE - 10 - len(header) - 1
+    if padding < 0:
+        raise ValueError(f".npy 헤더 길이 초과: {header}")
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header
+
+
+class EmbeddingFile:
+    """이어쓰기 가능한 임베딩 파일
+
+    <base>.npy        float32 원시 행렬 (고정 길이 헤더, np.load(mmap_mode='r')로 열림)
+    <base>.meta.jsonl 행별 메타데이터 (한 줄에 하나)
+    <base>.meta.idx   메타데이터 줄 시작 오프셋 (uint64, 구간 조회용)
+    <base>.json       매니페스트 (모델, 차원, 커밋된 행 수)
+
+    이어쓰기는 벡터 → 메타데이터 → .npy 헤더 순으로 기록한 뒤 매니페스트를 원자적으로
+    교체한다. 매니페스트의 행 수가 커밋 기준이므로, 중간에 중단되면 다음 이어쓰기 때
+    각 파일의 커밋되지 않은 꼬리를 잘라낸다.
+    """
+
+    def __init__(self, path: str):
+        base, ext = os.path.splitext(path)
+        self.base = base if ext in ('.npy', '.json', '.pkl') else path
+        self.vectors_path = f"{self.base}.npy"
+        self.metadata_path = f"{self.base}.meta.jsonl"
+        self.offsets_path = f"{self.base}.meta.idx"
+        self.manifest_path = f"{self.base}.json"
+        self._manifest: Optional[Dict[str, Any]] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    @property
+    def manifest(self) -> Dict[str, Any]:
+        if self._manifest is None:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self._manifest = json.load(f)
+        return self._manifest
+
+    @property
+    def rows(self) -> int:
+        return self.manifest['rows']
+
+    @property
+    def dimension(self) -> int:
+        return self.manifest['dimension']
+
+    def _line_offset(self, row: int) -> int:
+        """row번째 메타데이터 줄의 시작 오프셋"""
+        with open(self.offsets_path, 'rb') as f:
+            f.seek(row * 8)
+            return int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        manifest['updated_at'] = datetime.now().isoformat()
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest = manifest
+
+    def create(self, dimension: int, info: Optional[Dict[str, Any]] = None):
+        """빈 파일 생성 (기존 파일은 덮어씀)"""
+        with open(self.vectors_path, 'wb') as f:
+            f.write(_npy_header(0, dimension))
+        open(self.metadata_path, 'wb').close()
+        open(self.offsets_path, 'wb').close()
+        now = datetime.now().isoformat()
+        self._write_manifest({
+            'format_version': FORMAT_VERSION,
+            'dtype': 'float32',
+            'dimension': dimension,
+            'rows': 0,
+            'created_at': now,
+            **(info or {})
+        })
+
+    def append(self, embeddings: np.ndarray, metadatas: List[Dict]):
+        """행 추가 (임베딩 수와 메타데이터 수가 같아야 함)"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dimension:
+            raise ValueError(f"임베딩 차원 불일치: {embeddings.shape} (파일 차원 {self.dimension})")
+        if len(embeddings) != len(metadatas):
+            raise ValueError(f"임베딩과 메타데이터 수 불일치: {len(embeddings)} != {len(metadatas)}")
+
+        manifest = dict(self.manifest)
+        rows = manifest['rows']
+        new_rows = rows + len(embeddings)
+
+        # 벡터 (커밋되지 않은 꼬리는 덮어씀)
+        with open(self.vectors_path, 'r+b') as f:
+            f.truncate(NPY_HEADER_SIZE + rows * self.dimension * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(embeddings.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # 메타데이터 줄과 오프셋
+        with open(self.metadata_path, 'r+b') as f:
+            end = 0
+            if rows:
+                f.seek(self._line_offset(rows - 1))
+                f.readline()
+                end = f.tell()
+            f.truncate(end)
+            f.seek(end)
+            new_offsets = np.empty(len(metadatas), dtype=np.uint64)
+            for i, metadata in enumerate(metadatas):
+                new_offsets[i] = f.tell()
+                f.write(json.dumps(metadata, ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.offsets_path, 'r+b') as f:
+            f.truncate(rows * 8)
+            f.seek(0, os.SEEK_END)
+            f.write(new_offsets.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # .npy 헤더의 행 수 갱신 후 매니페스트로 커밋
+        with open(self.vectors_path, 'r+b') as f:
+            f.write(_npy_header(new_rows, self.dimension))
+            f.flush()
+            os.fsync(f.fileno())
+        manifest['rows'] = new_rows
+        self._write_manifest(manifest)
+
+    def vectors(self, mmap: bool = True) -> np.ndarray:
+        """커밋된 행의 임베딩 행렬 (mmap=True면 읽기 전용 memmap, 필요한 페이지만 읽음)"""
+        rows = self.rows
+        if not mmap:
+            with open(self.vectors_path, 'rb') as f:
+                f.seek(NPY_HEADER_SIZE)
+                return np.fromfile(f, dtype=np.float32, count=rows * self.dimension).reshape(rows, self.dimension)
+        if rows == 0:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.load(self.vectors_path, mmap_mode='r')[:rows]
+
+    def metadatas(self, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+        """[start, stop) 행의 메타데이터 (해당 줄만 읽음)"""
+        rows = self.rows
+        start, stop, _ = slice(start, stop).indices(rows)
+        if start >= stop:
+            return []
+        with open(self.metadata_path, 'rb') as f:
+            f.seek(self._line_offset(start))
+            return [json.loads(f.readline()) for _ in range(stop - start)]
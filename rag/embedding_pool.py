@@ -0,0 +1,108 @@
+"""
+RAG 3단계 보조: Embedding Pool
+여러 프로세스에 모델 복제본을 띄워 대량 임베딩을 병렬 처리 (결과는 공유 메모리로 전달)
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 작업 프로세스의 임베딩 엔진 (프로세스마다 하나)
+_worker_engine = None
+
+
+def _init_worker(engine_kwargs: Dict[str, Any]):
+    """작업 프로세스 초기화: 모델 복제본 로드 (torch는 프로세스당 1스레드)"""
+    global _worker_engine
+    from rag.embedding_engine import KoreanEmbeddingEngine
+    _worker_engine = KoreanEmbeddingEngine(use_cache=False, num_workers=1, **engine_kwargs)
+
+
+def _worker_info() -> Dict[str, Any]:
+    """작업 프로세스가 로드한 모델의 임베딩 차원과 max_seq_length"""
+    return {
+        'dimension': _worker_engine.dimension,
+        'max_seq_length': getattr(_worker_engine.model, 'max_seq_length', None)
+    }
+
+
+def _encode_into(task: Tuple[str, Tuple[int, int], np.ndarray, List[str]]) -> int:
+    """배치 하나를 인코딩해 공유 메모리 버퍼의 해당 행에 기록 (반환값은 행 수만)"""
+    shm_name, shape, rows, texts = task
+    embeddings = _worker_engine.model.encode(
+        texts,
+        show_progress_bar=False,
+        batch_size=len(texts),
+        normalize_embeddings=True
+    )
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buffer = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        buffer[rows] = embeddings
+        del buffer
+    finally:
+        shm.close()
+    return len(rows)
+
+
+class EmbeddingPool:
+    """임베딩 작업 프로세스 풀
+
+    부모 프로세스가 길이별 배치로 나눈 텍스트를 작업 프로세스에 나눠 주고,
+    각 작업 프로세스는 임베딩을 공유 메모리 버퍼(텍스트 수 × 차원, float32)의
+    자기 행에 직접 쓴다. 프로세스 간에는 텍스트와 행 번호만 전달되고 임베딩은
+    pickle되지 않는다. torch를 fork 이후에 쓰면 멈출 수 있으므로 spawn으로 시작한다.
+    dimension이 None이면 작업 프로세스 하나가 모델을 로드한 뒤 보고한 값을 쓴다.
+    """
+
+    def __init__(self, num_workers: int, dimension: Optional[int], engine_kwargs: Dict[str, Any]):
+        self.num_workers = num_workers
+        self._model_info: Optional[Dict[str, Any]] = None
+        logger.info(f"임베딩 작업 프로세스 {num_workers}개 시작 (모델 복제본 로드)")
+        self._pool = mp.get_context('spawn').Pool(
+            num_workers, initializer=_init_worker, initargs=(engine_kwargs,)
+        )
+        self.dimension = dimension if dimension is not None else self.model_info()['dimension']
+
+    def model_info(self) -> Dict[str, Any]:
+        """작업 프로세스의 모델 정보 (dimension, max_seq_length, 첫 호출 때 모델 로드를 기다림)"""
+        if self._model_info is None:
+            if self._pool is None:
+                raise RuntimeError("임베딩 풀이 종료되었습니다")
+            self._model_info = self._pool.apply(_worker_info)
+        return self._model_info
+
+    def encode(self, texts: List[str], batches: List[np.ndarray], show_progress: bool = False) -> np.ndarray:
+        """배치별로 작업 프로세스에 분배하여 임베딩 (결과는 입력 순서)"""
+        if self._pool is None:
+            raise RuntimeError("임베딩 풀이 종료되었습니다")
+        shape = (len(texts), self.dimension)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(texts) * self.dimension * 4))
+        try:
+            tasks = [(shm.name, shape, batch, [texts[i] for i in batch]) for batch in batches]
+            # 긴 배치부터 보내 마지막에 한 프로세스만 일하는 시간을 줄임
+            tasks.reverse()
+            done = self._pool.imap_unordered(_encode_into, tasks)
+            if show_progress:
+                from tqdm import tqdm
+                done = tqdm(done, total=len(tasks), desc=f"임베딩 ({self.num_workers} 프로세스)", unit="batch")
+            for _ in done:
+                pass
+            buffer = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            embeddings = buffer.copy()
+            del buffer
+            return embeddings
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self):
+        """작업 프로세스 종료"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
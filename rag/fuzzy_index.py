@@ -0,0 +1,258 @@
+"""
+RAG 4단계 보조: Fuzzy Index
+띄어쓰기를 제거하고 자모로 분해한 텍스트의 n-gram 역색인 (띄어쓰기/오타 허용 검색)
+"""
+import unicodedata
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Iterable, Optional, Tuple
+import numpy as np
+import logging
+
+from rag.keyword_index import KeywordIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 조합형 자모 (NFKD 분해 결과)
+CHOSEONG = [chr(c) for c in range(0x1100, 0x1113)]
+JUNGSEONG = [chr(c) for c in range(0x1161, 0x1176)]
+JONGSEONG = [chr(c) for c in range(0x11A8, 0x11C3)]
+ALNUM = list("abcdefghijklmnopqrstuvwxyz0123456789")
+
+
+def to_jamo(text: str) -> str:
+    """공백 제거 + 소문자 + 자모 분해 (한글 음절은 초성/중성/종성 문자로)"""
+    return unicodedata.normalize('NFKD', "".join(text.lower().split()))
+
+
+def jamo_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """자모 분해 텍스트와 각 자모의 원문 문자 위치"""
+    pieces = []
+    offsets = []
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            continue
+        jamo = unicodedata.normalize('NFKD', ch.lower())
+        pieces.append(jamo)
+        offsets.extend([i] * len(jamo))
+    return "".join(pieces), offsets
+
+
+def _jamo_class(ch: str) -> str:
+    code = ord(ch)
+    if 0x1100 <= code <= 0x1112:
+        return 'cho'
+    if 0x1161 <= code <= 0x1175:
+        return 'jung'
+    if 0x11A8 <= code <= 0x11C2:
+        return 'jong'
+    return 'other'
+
+
+# 같은 위치에 올 수 있는 대체 문자 (치환)
+_SUBSTITUTES = {'cho': CHOSEONG, 'jung': JUNGSEONG, 'jong': JONGSEONG, 'other': ALNUM}
+
+# 앞 문자 종류별로 뒤에 끼어들 수 있는 문자 (삽입)
+_INSERTS = {
+    'cho': JUNGSEONG,
+    'jung': JONGSEONG + CHOSEONG,
+    'jong': CHOSEONG,
+    'other': ALNUM + CHOSEONG,
+}
+
+
+class _JamoTexts:
+    """문서 시퀀스를 자모 분해 텍스트로 보여주는 지연 뷰 (짧은 키워드 위치 확인용)"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def __getitem__(self, i: int) -> str:
+        return to_jamo(self.documents[i])
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+
+class FuzzyIndex:
+    """띄어쓰기·오타 허용 검색용 자모 n-gram 색인
+
+    문서를 공백 제거 + 자모 분해한 뒤 위치 정보가 있는 자모 n-gram 역색인
+    (KeywordIndex)에 넣는다. 공백을 지운 텍스트이므로 "설계 속도"와 "설계속도"가
+    같은 자모열이 되고, 질의도 같은 방식으로 변환해 위치 목록 병합으로 찾는다.
+
+    오타는 자모 1개의 치환/삭제/삽입/인접 교환(편집 거리 1)으로 보고,
+    질의의 변형 중 모든 n-gram이 색인 사전에 있는 것만 위치 목록으로 조회한다.
+    사전 조회만으로 대부분의 변형이 걸러지므로 질의 시 원문을 스캔하지 않는다.
+    오타 변형으로 찾은 출현은 fuzzy_weight만큼만 tf에 반영한다.
+    """
+
+    def __init__(self,
+                 ngram_size: int = 3,
+                 min_fuzzy_length: int = 5,
+                 fuzzy_weight: float = 0.5,
+                 cache_size: int = 1024):
+        self.index = KeywordIndex(ngram_size, positional=True)
+        self.min_fuzzy_length = min_fuzzy_length  # 오타 변형을 만들 최소 자모 수
+        self.fuzzy_weight = fuzzy_weight
+        self.cache_size = cache_size
+        self._variant_cache: "OrderedDict[tuple, List[str]]" = OrderedDict()
+        self._followers: Dict[str, set] = {}  # (n-1)-gram 뒤에 색인에서 나타나는 문자
+        self._followers_size = -1  # _followers를 만들 때의 n-gram 사전 크기
+        self._cache_lock = threading.Lock()
+
+    @property
+    def num_docs(self) -> int:
+        return self.index.num_docs
+
+    def add_documents(self, documents: Iterable[str], start_id: Optional[int] = None):
+        """문서들을 자모 분해하여 색인에 추가 (문서 ID는 start_id부터 연속)"""
+        self.index.add_documents((to_jamo(document) for document in documents), start_id)
+
+    def _next_chars(self) -> Dict[str, set]:
+        """(n-1)-gram -> 색인에서 그 뒤에 오는 문자 집합 (사전이 커지면 다시 만듦)"""
+        postings = self.index.postings
+        with self._cache_lock:
+            if self._followers_size != len(postings):
+                n = self.index.ngram_size
+                followers: Dict[str, set] = {}
+                for gram in list(postings):
+                    if len(gram) == n:
+                        followers.setdefault(gram[:-1], set()).add(gram[-1])
+                self._followers = followers
+                self._followers_size = len(postings)
+            return self._followers
+
+    def _grams_exist(self, text: str, lo: int, hi: int) -> bool:
+        """text에서 시작 위치가 [lo, hi)인 n-gram이 모두 색인 사전에 있는지"""
+        n = self.index.ngram_size
+        postings = self.index.postings
+        return all(text[i:i + n] in postings
+                   for i in range(max(lo, 0), min(hi, len(text) - n + 1)))
+
+    def variants(self, jamo: str) -> List[str]:
+        """편집 거리 1인 변형 중 색인에 존재할 수 있는 것 (자모 문자열)"""
+        if len(jamo) < self.min_fuzzy_length:
+            return []
+        key = (jamo, self.index.num_docs)
+        with self._cache_lock:
+            cached = self._variant_cache.get(key)
+            if cached is not None:
+                self._variant_cache.move_to_end(key)
+                return cached
+
+        # 편집 위치에서 먼 n-gram은 원래 질의와 같으므로, 질의에서 빠진 n-gram이
+        # 편집 범위 밖에 있으면 그 위치의 변형은 만들지 않고 새로 생긴 n-gram만 확인한다
+        n = self.index.ngram_size
+        missing = [i for i in range(len(jamo) - n + 1)
+                   if jamo[i:i + n] not in self.index.postings]
+
+        def editable(lo: int, hi: int) -> bool:
+            return all(lo <= i < hi for i in missing)
+
+        # 편집 위치 앞의 (n-1)자 뒤에 색인에서 실제로 오는 문자만 후보로 삼는다
+        followers = self._next_chars()
+
+        def choices(i: int, alphabet: List[str]) -> Iterable[str]:
+            if i < n - 1:
+                return alphabet
+            return followers.get(jamo[i - n + 1:i], set()).intersection(alphabet)
+
+        found = set()
+        last = len(jamo) - 1
+        for i, ch in enumerate(jamo):
+            head, tail = jamo[:i], jamo[i + 1:]
+            if editable(i - n + 1, i + 1):
+                # 치환 (같은 종류의 자모끼리)
+                for sub in choices(i, _SUBSTITUTES[_jamo_class(ch)]):
+                    variant = head + sub + tail
+                    if sub != ch and self._grams_exist(variant, i - n + 1, i + 1):
+                        found.add(variant)
+                # 삭제 (양 끝 삭제는 질의의 부분 문자열이라 정확한 출현과 겹치므로 제외)
+                variant = head + tail
+                if 0 < i < last and self._grams_exist(variant, i - n + 1, i):
+                    found.add(variant)
+            # 인접 교환
+            if i < last and editable(i - n + 1, i + 2):
+                variant = head + tail[0] + ch + tail[1:]
+                if self._grams_exist(variant, i - n + 1, i + 2):
+                    found.add(variant)
+        for i in range(1, len(jamo)):
+            # 삽입 (앞 자모 종류에 맞는 문자, 양 끝 삽입은 정확한 출현을 포함하므로 제외)
+            if editable(i - n + 1, i):
+                for ins in choices(i, _INSERTS[_jamo_class(jamo[i - 1])]):
+                    variant = jamo[:i] + ins + jamo[i:]
+                    if self._grams_exist(variant, i - n + 1, i + 1):
+                        found.add(variant)
+        found.discard(jamo)
+        found = sorted(found)
+
+        with self._cache_lock:
+            self._variant_cache[key] = found
+            while len(self._variant_cache) > self.cache_size:
+                self._variant_cache.popitem(last=False)
+        return found
+
+    def expand(self, keyword: str, fuzzy: bool = True) -> List[str]:
+        """키워드의 자모 질의 목록 (첫 번째가 정확한 형태)"""
+        jamo = to_jamo(keyword)
+        if not jamo:
+            return []
+        return [jamo] + (self.variants(jamo) if fuzzy else [])
+
+    def match_with_tf(self, keyword: str, documents, allowed: Optional[np.ndarray] = None) -> tuple:
+        """띄어쓰기 무시 + 오타 허용 매칭 문서 ID와 tf (KeywordIndex.match_with_tf와 같은 형식)
+
+        BM25Ranker.rank에 키워드 색인 대신 전달할 수 있다.
+        """
+        terms = self.expand(keyword)
+        if not terms:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        jamo_documents = _JamoTexts(documents)
+
+        all_ids = []
+        all_weights = []
+        for j, term in enumerate(terms):
+            keys = self.index.occurrences(term, jamo_documents, allowed)
+            if keys.size == 0:
+                continue
+            all_ids.append(keys >> 32)
+            all_weights.append(np.full(keys.size, 1.0 if j == 0 else self.fuzzy_weight))
+        if not all_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        tfs = np.bincount(inverse, weights=np.concatenate(all_weights))
+        return ids.astype(np.int32), tfs.astype(np.float32)
+
+    def match(self, keyword: str, documents, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        return self.match_with_tf(keyword, documents, allowed)[0]
+
+    def locate(self, text: str, keywords: List[str], fuzzy: bool = True) -> List[Tuple[int, int]]:
+        """원문에서 키워드(띄어쓰기/오타 허용)가 나타나는 [시작, 끝) 문자 구간 (정렬됨)
+
+        결과 문서 한 건의 자모 분해 텍스트에서 질의 자모열의 위치를 찾아 원문 위치로 되돌린다.
+        """
+        jamo, offsets = jamo_with_offsets(text)
+        spans = set()
+        for keyword in keywords:
+            for term in self.expand(keyword, fuzzy):
+                start = jamo.find(term)
+                while start >= 0:
+                    spans.add((offsets[start], offsets[start + len(term) - 1] + 1))
+                    start = jamo.find(term, start + 1)
+        return sorted(spans)
+
+    def remove_documents(self, deleted: np.ndarray) -> 'FuzzyIndex':
+        """삭제 표시된 문서를 제거한 새 색인 반환"""
+        fuzzy = FuzzyIndex(self.index.ngram_size, self.min_fuzzy_length,
+                           self.fuzzy_weight, self.cache_size)
+        fuzzy.index = self.index.remove_documents(deleted)
+        return fuzzy
+
+    def save(self, filepath: str):
+        self.index.save(filepath)
+
+    def load(self, filepath: str) -> bool:
+        return self.index.load(filepath)
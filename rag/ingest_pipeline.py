@@ -0,0 +1,70 @@
+"""
+RAG 수집 보조: Ingest Pipeline
+PDF 로드 → 청킹 → 임베딩 → 벡터 DB 추가를 제너레이터로 잇는 스트리밍 처리 도구
+"""
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_DONE = object()  # 생산 완료 표시
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """items를 batch_size개씩 묶어 순서대로 반환 (마지막 배치는 더 작을 수 있음)"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(items: Iterable[T], max_pending: int = 512, name: str = "ingest-prefetch") -> Iterator[T]:
+    """items를 백그라운드 스레드에서 미리 생산하여 소비와 겹쳐 실행
+
+    생산된 항목은 크기 max_pending의 큐를 거치므로, 소비(임베딩)가 느리면 생산자
+    (PDF 파싱/청킹)가 큐에 자리가 날 때까지 멈춘다(back-pressure). 생산 중 예외는
+    소비 쪽에서 다시 발생하고, 소비를 중단하면 생산 스레드도 다음 항목에서 멈춘다.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((None, item)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((e, None))
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            marker, item = buffer.get()
+            if marker is _DONE:
+                return
+            if marker is not None:
+                raise marker
+            yield item
+    finally:
+        stop.set()
+        thread.join()
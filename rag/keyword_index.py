@@ -0,0 +1,474 @@
+"""
+RAG 4단계 보조: Keyword Index
+문자 n-gram 역색인 기반 키워드 검색
+"""
+import os
+import heapq
+from array import array
+from collections import Counter
+from typing import List, Dict, Iterable, Optional, Union
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Posting = Union[array, np.ndarray]
+
+
+class KeywordIndex:
+    """문자 n-gram 역색인
+
+    한국어는 형태소 분석 없이도 문자 단위 n-gram 으로 부분 문자열 검색이 가능하다.
+    길이 1..ngram_size 의 모든 n-gram 에 대해 문서 ID 포스팅을 유지하며,
+    키워드 길이가 ngram_size 이하이면 포스팅 자체가 정확한 결과이고
+    더 길면 n-gram 포스팅 교집합으로 후보를 만든 뒤 부분 문자열 검증을 거친다.
+    각 포스팅에는 BM25 점수 계산을 위한 문서 내 출현 빈도(tf)가 함께 저장된다.
+
+    positional=True면 길이가 ngram_size인 n-gram에 대해 문서 내 시작 위치도 저장한다.
+    위치 목록은 포스팅 순서대로 tf개씩 이어 붙인 배열이므로 별도 오프셋이 필요 없다.
+    긴 키워드(구문)는 n-gram 위치 목록을 (문서, 시작 위치) 키로 교집합하여
+    원문을 읽지 않고 정확한 출현 위치를 구하며, 근접 검색도 이 위치로 판정한다.
+    """
+
+    def __init__(self, ngram_size: int = 2, positional: bool = True):
+        self.ngram_size = ngram_size
+        self.positional = positional
+        self.postings: Dict[str, Posting] = {}
+        self.term_freqs: Dict[str, Posting] = {}
+        self.positions: Dict[str, Posting] = {}
+        self.num_docs = 0
+
+    def _doc_grams(self, text: str) -> Counter:
+        """문서에 등장하는 길이 1..n 의 n-gram 빈도"""
+        grams = Counter()
+        length = len(text)
+        for n in range(1, self.ngram_size + 1):
+            grams.update(text[i:i + n] for i in range(length - n + 1))
+        return grams
+
+    @staticmethod
+    def _to_array(values: np.ndarray, typecode: str) -> array:
+        converted = array(typecode)
+        converted.frombytes(values.astype(np.dtype(typecode)).tobytes())
+        return converted
+
+    def _writable(self, gram: str) -> tuple:
+        """추가 가능한 (문서 ID, tf) 포스팅 반환 (로드된 읽기 전용 배열은 복사)"""
+        posting = self.postings.get(gram)
+        if posting is None:
+            self.postings[gram] = array('i')
+            self.term_freqs[gram] = array('H')
+        elif isinstance(posting, np.ndarray):
+            self.postings[gram] = self._to_array(posting, 'i')
+            self.term_freqs[gram] = self._to_array(self.term_freqs[gram], 'H')
+        return self.postings[gram], self.term_freqs[gram]
+
+    def _gram_positions(self, text: str) -> Dict[str, List[int]]:
+        """길이 ngram_size인 n-gram별 시작 위치 목록"""
+        n = self.ngram_size
+        positions: Dict[str, List[int]] = {}
+        for i in range(len(text) - n + 1):
+            positions.setdefault(text[i:i + n], []).append(i)
+        return positions
+
+    def _writable_positions(self, gram: str) -> array:
+        positions = self.positions.get(gram)
+        if positions is None:
+            positions = self.positions[gram] = array('i')
+        elif isinstance(positions, np.ndarray):
+            positions = self.positions[gram] = self._to_array(positions, 'i')
+        return positions
+
+    def add_documents(self, documents: Iterable[str], start_id: Optional[int] = None):
+        """문서들을 색인에 추가 (문서 ID는 start_id부터 연속)"""
+        doc_id = self.num_docs if start_id is None else start_id
+        for document in documents:
+            text = document.lower()
+            positions = self._gram_positions(text) if self.positional else {}
+            for gram, count in self._doc_grams(text).items():
+                count = min(count, 0xFFFF)
+                if gram in positions:
+                    # 위치를 먼저 기록해야 검색 중인 스레드가 포스팅과 어긋나지 않는다
+                    self._writable_positions(gram).extend(positions[gram][:count])
+                ids, tfs = self._writable(gram)
+                ids.append(doc_id)
+                tfs.append(count)
+            doc_id += 1
+        self.num_docs = max(self.num_docs, doc_id)
+
+    def posting(self, gram: str) -> np.ndarray:
+        """n-gram 포스팅을 정렬된 int32 배열로 반환"""
+        posting = self.postings.get(gram)
+        if posting is None:
+            return np.empty(0, dtype=np.int32)
+        if isinstance(posting, array):
+            # 버퍼를 공유하면 이후 append가 막히므로 복사본 반환
+            # (tobytes는 GIL 안에서 한 번에 복사되어 동시 추가 중에도 안전)
+            return np.frombuffer(posting.tobytes(), dtype=np.int32)
+        return posting
+
+    def term_freq(self, gram: str) -> np.ndarray:
+        """n-gram 포스팅과 같은 순서의 tf 배열 반환"""
+        tfs = self.term_freqs.get(gram)
+        if tfs is None:
+            return np.empty(0, dtype=np.uint16)
+        if isinstance(tfs, array):
+            return np.frombuffer(tfs.tobytes(), dtype=np.uint16)
+        return tfs
+
+    def _posting_entries(self, gram: str) -> tuple:
+        """(문서 ID, tf, 위치) 배열을 서로 맞춰 반환 (동시 추가 중 미완성 항목 제외)"""
+        ids = self.posting(gram)
+        tfs = self.term_freq(gram).astype(np.int64)
+        positions = self.positions.get(gram)
+        if positions is None:
+            positions = np.empty(0, dtype=np.int32)
+        elif isinstance(positions, array):
+            positions = np.frombuffer(positions.tobytes(), dtype=np.int32)
+        n = min(ids.size, tfs.size)
+        ends = np.cumsum(tfs[:n])
+        n = int(np.searchsorted(ends, positions.size, side='right'))
+        return ids[:n], tfs[:n], positions[:int(ends[n - 1]) if n else 0]
+
+    def _scan_occurrences(self, term: str, documents, ids: np.ndarray) -> np.ndarray:
+        """후보 문서 원문에서 term의 시작 위치를 찾아 (문서 << 32 | 위치) 키로 반환"""
+        keys = []
+        for doc_id in ids.tolist():
+            text = documents[doc_id].lower()
+            start = text.find(term)
+            while start >= 0:
+                keys.append((doc_id << 32) | start)
+                start = text.find(term, start + 1)
+        return np.asarray(keys, dtype=np.int64)
+
+    def occurrences(self, term: str, documents, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """term의 모든 출현을 정렬된 (문서 ID << 32 | 시작 위치) int64 키로 반환
+
+        term이 ngram_size 이상이고 위치 정보가 있으면 n-gram 위치 목록을 병합하여
+        원문을 읽지 않는다. 그보다 짧은 term은 포스팅 후보의 원문에서 위치를 찾는다.
+        """
+        term = term.lower()
+        n = self.ngram_size
+        if not term:
+            return np.empty(0, dtype=np.int64)
+        if len(term) < n or not self.positional:
+            ids, _ = self.candidates(term, allowed)
+            return self._scan_occurrences(term, documents, ids)
+
+        # term을 덮는 n-gram 오프셋 (겹치지 않게 건너뛰고 마지막 n-gram은 끝에 맞춤)
+        offsets = list(range(0, len(term) - n + 1, n))
+        if offsets[-1] != len(term) - n:
+            offsets.append(len(term) - n)
+        entries = [(offset, self._posting_entries(term[offset:offset + n])) for offset in offsets]
+        entries.sort(key=lambda e: e[1][0].size)
+
+        # 문서 단위 교집합으로 후보를 먼저 좁힘
+        docs = self._restrict(entries[0][1][0], allowed)
+        for _, (ids, _, _) in entries[1:]:
+            if docs.size == 0:
+                break
+            docs = np.intersect1d(docs, ids, assume_unique=True)
+        if docs.size == 0:
+            return np.empty(0, dtype=np.int64)
+
+        # (문서, term 시작 위치) 키의 교집합
+        # 포스팅은 문서 ID 순, 위치는 문서 내 오름차순이므로 키는 이미 정렬되어 있다
+        keys = None
+        for offset, (ids, tfs, positions) in entries:
+            keep = self._sorted_isin(ids, docs)
+            doc_ids = np.repeat(ids[keep].astype(np.int64), tfs[keep])
+            starts = positions[np.repeat(keep, tfs)].astype(np.int64) - offset
+            valid = starts >= 0
+            gram_keys = (doc_ids[valid] << 32) | starts[valid]
+            keys = gram_keys if keys is None else keys[self._sorted_isin(keys, gram_keys)]
+            if keys.size == 0:
+                break
+        return keys
+
+    @staticmethod
+    def _sorted_isin(values: np.ndarray, sorted_set: np.ndarray) -> np.ndarray:
+        """정렬된 배열에 대한 소속 여부 (이진 탐색, 정렬 없음)"""
+        if sorted_set.size == 0:
+            return np.zeros(values.size, dtype=bool)
+        pos = np.minimum(np.searchsorted(sorted_set, values), sorted_set.size - 1)
+        return sorted_set[pos] == values
+
+    @staticmethod
+    def _doc_ranges(keys: np.ndarray, doc_ids: np.ndarray) -> tuple:
+        """정렬된 키 배열에서 문서별 [시작, 끝) 구간"""
+        doc_ids = doc_ids.astype(np.int64)
+        return (np.searchsorted(keys, doc_ids << 32),
+                np.searchsorted(keys, (doc_ids + 1) << 32))
+
+    def proximity_match(self,
+                        terms: List[str],
+                        window: int,
+                        documents,
+                        allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """모든 term이 시작 위치 기준 window 문자 이내에 함께 나타나는 문서 ID (정렬됨)
+
+        term별 위치 목록을 문서마다 병합하여(최소 구간 탐색) 판정한다.
+        """
+        terms = [t for t in dict.fromkeys(t.lower() for t in terms) if t]
+        if not terms:
+            return np.empty(0, dtype=np.int32)
+        term_keys = [self.occurrences(t, documents, allowed) for t in terms]
+        docs = None
+        for keys in sorted(term_keys, key=len):
+            ids = np.unique(keys >> 32)
+            docs = ids if docs is None else np.intersect1d(docs, ids, assume_unique=True)
+            if docs.size == 0:
+                return np.empty(0, dtype=np.int32)
+        if len(terms) == 1:
+            return docs.astype(np.int32)
+
+        ranges = [self._doc_ranges(keys, docs) for keys in term_keys]
+        matched = []
+        for j, doc_id in enumerate(docs.tolist()):
+            lists = [(keys[lo[j]:hi[j]] & 0xFFFFFFFF).tolist()
+                     for keys, (lo, hi) in zip(term_keys, ranges)]
+            if self._within_window(lists, window):
+                matched.append(doc_id)
+        return np.asarray(matched, dtype=np.int32)
+
+    @staticmethod
+    def _within_window(lists: List[List[int]], window: int) -> bool:
+        """정렬된 위치 목록마다 하나씩 골라 (최대 - 최소) <= window 가 되는지 (k-way 병합)"""
+        heap = [(positions[0], i, 0) for i, positions in enumerate(lists)]
+        heapq.heapify(heap)
+        highest = max(positions[0] for positions in lists)
+        while True:
+            lowest, i, j = heap[0]
+            if highest - lowest <= window:
+                return True
+            if j + 1 == len(lists[i]):
+                return False
+            following = lists[i][j + 1]
+            heapq.heapreplace(heap, (following, i, j + 1))
+            highest = max(highest, following)
+
+    @staticmethod
+    def _restrict(ids: np.ndarray, allowed: Optional[np.ndarray]) -> np.ndarray:
+        """허용 마스크에 해당하는 문서 ID만 남김"""
+        if allowed is None or ids.size == 0:
+            return ids
+        ids = ids[ids < allowed.size]
+        return ids[allowed[ids]]
+
+    def candidates(self, keyword: str, allowed: Optional[np.ndarray] = None) -> tuple:
+        """키워드 후보 문서 ID와 검증 필요 여부 반환
+
+        Args:
+            allowed: 문서별 허용 마스크 (주어지면 허용된 문서만 후보로 반환)
+
+        Returns:
+            (후보 문서 ID 배열, 부분 문자열 검증이 필요한지 여부)
+        """
+        keyword = keyword.lower()
+        if not keyword:
+            ids = np.arange(self.num_docs, dtype=np.int32)
+            return self._restrict(ids, allowed), False
+        if len(keyword) <= self.ngram_size:
+            return self._restrict(self.posting(keyword), allowed), False
+
+        n = self.ngram_size
+        grams = {keyword[i:i + n] for i in range(len(keyword) - n + 1)}
+        postings = sorted((self.posting(g) for g in grams), key=len)
+        result = self._restrict(postings[0], allowed)
+        for posting in postings[1:]:
+            if result.size == 0:
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result, True
+
+    def match(self, keyword: str, documents, allowed: Optional[np.ndarray] = None) -> np.ndarray:
+        """키워드를 부분 문자열로 포함하는 문서 ID 배열 (정렬됨)"""
+        if len(keyword) > self.ngram_size and self.positional:
+            # 위치 목록 병합으로 정확히 판정 (원문 검증 없음)
+            return np.unique(self.occurrences(keyword, documents, allowed) >> 32).astype(np.int32)
+        ids, needs_check = self.candidates(keyword, allowed)
+        if not needs_check or ids.size == 0:
+            return ids
+        keyword_lower = keyword.lower()
+        verified = [i for i in ids.tolist() if keyword_lower in documents[i].lower()]
+        return np.asarray(verified, dtype=np.int32)
+
+    def match_with_tf(self, keyword: str, documents, allowed: Optional[np.ndarray] = None) -> tuple:
+        """키워드를 포함하는 문서 ID 배열과 문서별 키워드 출현 빈도 반환
+
+        allowed가 주어지면 부분 문자열 검증 전에 허용된 문서로 후보를 좁힌다.
+        """
+        keyword_lower = keyword.lower()
+        if keyword_lower and len(keyword_lower) <= self.ngram_size:
+            # 짧은 키워드는 포스팅의 tf를 그대로 사용
+            ids = self.posting(keyword_lower)
+            tfs = self.term_freq(keyword_lower).astype(np.float32)
+            if ids.size != tfs.size:
+                # 동시 추가 중 ID만 먼저 추가된 경우 (새 문서는 허용 범위 밖)
+                n = min(ids.size, tfs.size)
+                ids, tfs = ids[:n], tfs[:n]
+            if allowed is not None and ids.size:
+                keep = ids < allowed.size
+                keep[keep] = allowed[ids[keep]]
+                ids, tfs = ids[keep], tfs[keep]
+            return ids, tfs
+
+        if keyword_lower and self.positional:
+            # 구문 출현 횟수를 위치 목록에서 바로 계산
+            ids, counts = np.unique(self.occurrences(keyword, documents, allowed) >> 32,
+                                    return_counts=True)
+            return ids.astype(np.int32), counts.astype(np.float32)
+
+        ids = self.match(keyword, documents, allowed)
+        if not keyword_lower:
+            return ids, np.ones(ids.size, dtype=np.float32)
+        tfs = np.fromiter(
+            (documents[i].lower().count(keyword_lower) for i in ids.tolist()),
+            dtype=np.float32, count=ids.size
+        )
+        return ids, tfs
+
+    def search(self,
+               keywords: List[str],
+               documents,
+               match_all: bool = False) -> Dict[int, List[str]]:
+        """키워드별 포스팅을 교집합/합집합하여 문서별 매칭 키워드 반환
+
+        Args:
+            keywords: 검색 키워드 리스트
+            documents: 문서 ID로 원문을 조회할 수 있는 시퀀스 (검증용)
+            match_all: True면 모든 키워드를 포함한 문서만 반환
+
+        Returns:
+            {문서 ID: 매칭된 키워드 리스트(입력 순서 유지)}
+        """
+        if not keywords:
+            # 기존 동작 유지: 키워드가 없으면 match_all일 때만 전체 문서가 매칭
+            return {i: [] for i in range(self.num_docs)} if match_all else {}
+
+        matched: Dict[int, List[str]] = {}
+        allowed = None
+        for keyword in keywords:
+            if match_all:
+                # 앞선 키워드의 결과 안에서만 후보를 좁힘
+                ids, needs_check = self.candidates(keyword)
+                if allowed is not None:
+                    ids = np.intersect1d(ids, allowed, assume_unique=True)
+                if needs_check and ids.size:
+                    keyword_lower = keyword.lower()
+                    ids = np.asarray(
+                        [i for i in ids.tolist() if keyword_lower in documents[i].lower()],
+                        dtype=np.int32
+                    )
+                allowed = ids
+                if allowed.size == 0:
+                    return {}
+            else:
+                ids = self.match(keyword, documents)
+                for doc_id in ids.tolist():
+                    matched.setdefault(doc_id, []).append(keyword)
+
+        if match_all:
+            return {doc_id: list(keywords) for doc_id in allowed.tolist()}
+        return matched
+
+    def remove_documents(self, deleted: np.ndarray) -> 'KeywordIndex':
+        """삭제 표시된 문서를 포스팅에서 제거한 새 색인 반환 (문서 ID는 유지)
+
+        검색 중인 스레드가 기존 포스팅을 계속 읽을 수 있도록 원본은 수정하지 않는다.
+        """
+        index = KeywordIndex(self.ngram_size, self.positional)
+        index.num_docs = self.num_docs
+        for gram in list(self.postings.keys()):
+            if gram in self.positions:
+                ids, tfs, positions = self._posting_entries(gram)
+            else:
+                ids = self.posting(gram)
+                tfs = self.term_freq(gram)
+                n = min(ids.size, tfs.size)
+                ids, tfs, positions = ids[:n], tfs[:n], None
+            keep = ids >= deleted.size
+            keep[~keep] = ~deleted[ids[~keep]]
+            if keep.any():
+                index.postings[gram] = ids[keep]
+                index.term_freqs[gram] = tfs[keep].astype(np.uint16)
+                if positions is not None:
+                    index.positions[gram] = positions[np.repeat(keep, tfs)]
+        return index
+
+    def save(self, filepath: str):
+        """색인을 npz 파일로 저장 (n-gram 사전 + 평탄화된 포스팅)"""
+        grams = sorted(self.postings.keys())
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        position_offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        chunks = []
+        tf_chunks = []
+        position_chunks = []
+        for i, gram in enumerate(grams):
+            if gram in self.positions:
+                posting, tfs, positions = self._posting_entries(gram)
+                position_chunks.append(positions)
+            else:
+                posting, tfs, positions = self.posting(gram), self.term_freq(gram), ()
+            chunks.append(posting)
+            tf_chunks.append(tfs)
+            offsets[i + 1] = offsets[i] + len(posting)
+            position_offsets[i + 1] = position_offsets[i] + len(positions)
+        doc_ids = np.concatenate(chunks).astype(np.int32) if chunks else np.empty(0, dtype=np.int32)
+        term_freqs = np.concatenate(tf_chunks).astype(np.uint16) if tf_chunks else np.empty(0, dtype=np.uint16)
+        positions = (np.concatenate(position_chunks).astype(np.int32) if position_chunks
+                     else np.empty(0, dtype=np.int32))
+
+        np.savez(
+            filepath,
+            grams=np.array(grams, dtype=str),
+            offsets=offsets,
+            doc_ids=doc_ids,
+            term_freqs=term_freqs,
+            positions=positions,
+            position_offsets=position_offsets,
+            meta=np.array([self.ngram_size, self.num_docs, int(self.positional)], dtype=np.int64)
+        )
+
+    def load(self, filepath: str) -> bool:
+        """저장된 색인 로드"""
+        if not os.path.exists(filepath):
+            return False
+        with np.load(filepath) as data:
+            if 'term_freqs' not in data.files:
+                logger.info("tf 정보가 없는 이전 형식의 키워드 색인")
+                return False
+            grams = data['grams'].tolist()
+            offsets = data['offsets']
+            doc_ids = data['doc_ids']
+            term_freqs = data['term_freqs']
+            meta = [int(v) for v in data['meta']]
+            self.ngram_size, self.num_docs = meta[:2]
+            if 'positions' in data.files:
+                positions = data['positions']
+                position_offsets = data['position_offsets']
+                self.positional = bool(meta[2])
+            else:
+                # 위치 정보가 없는 이전 형식: 긴 키워드는 원문 검증으로 처리
+                positions = None
+                self.positional = False
+
+        # 평탄화된 배열의 뷰로 포스팅 구성 (복사 없음)
+        self.postings = {
+            gram: doc_ids[offsets[i]:offsets[i + 1]]
+            for i, gram in enumerate(grams)
+        }
+        self.term_freqs = {
+            gram: term_freqs[offsets[i]:offsets[i + 1]]
+            for i, gram in enumerate(grams)
+        }
+        self.positions = {}
+        if positions is not None:
+            self.positions = {
+                gram: positions[position_offsets[i]:position_offsets[i + 1]]
+                for i, gram in enumerate(grams)
+                if len(gram) == self.ngram_size
+            }
+        logger.info(f"키워드 색인 로드 완료: {len(grams)}개 n-gram, {self.num_docs}개 문서")
+        return True
@@ -0,0 +1,197 @@
+"""
+RAG 4단계 보조: Near-Duplicate Index
+청크의 SimHash 서명과 LSH 테이블로 거의 같은 청크를 묶어 검색 결과에서 접기
+"""
+import os
+from array import array
+from typing import List, Dict, Iterable, Optional
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_MASK64 = (1 << 64) - 1
+_SHINGLE_PRIME = np.uint64(0x100000001B3)
+
+
+def _hamming(a: int, b: int) -> int:
+    """두 64비트 서명의 해밍 거리 (int.bit_count는 3.10 이상이므로 bin 사용)"""
+    return bin((a ^ b) & _MASK64).count('1')
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 마무리 함수 (shingle 해시 비트 분산)"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """공백을 제거한 글자 shingle의 64비트 SimHash (메타데이터 int 컬럼용 부호 있는 정수)
+
+    겹치는 shingle이 많은 두 텍스트는 서명의 해밍 거리가 작다.
+    """
+    normalized = "".join(text.lower().split())
+    if not normalized:
+        return 0
+    codes = np.frombuffer(normalized.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    size = min(shingle_size, len(codes))
+    n_shingles = len(codes) - size + 1
+
+    hashes = np.zeros(n_shingles, dtype=np.uint64)
+    for j in range(size):
+        hashes = (hashes * _SHINGLE_PRIME) ^ codes[j:j + n_shingles]
+    hashes = np.unique(_mix64(hashes))  # shingle 집합 (반복 문구가 서명을 지배하지 않도록)
+
+    # 비트별 다수결
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(hashes)
+    value = sum(1 << int(b) for b in np.nonzero(votes > 0)[0])
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class DuplicateIndex:
+    """SimHash LSH 테이블 (추가 전용)
+
+    64비트 서명을 num_bands개 구간으로 나눠 구간 값별 버킷에 넣는다.
+    해밍 거리가 max_distance 이하인 두 서명은 (max_distance < num_bands이면)
+    적어도 한 구간이 같으므로 같은 버킷에서 찾을 수 있다.
+    추가 시 이미 있는 중복 청크의 그룹 번호를 물려받으므로, 검색 시에는
+    그룹 번호 비교만으로 결과를 접는다.
+    """
+
+    def __init__(self, max_distance: int = 3, num_bands: int = 4):
+        if max_distance >= num_bands:
+            raise ValueError("max_distance는 num_bands보다 작아야 함")
+        self.max_distance = max_distance
+        self.num_bands = num_bands
+        self.band_bits = 64 // num_bands
+        self.signatures = array('q')  # 행별 서명
+        self.groups = array('i')  # 행별 중복 그룹 번호 (그룹의 첫 행 번호)
+        self.bucketed = array('b')  # 버킷에 들어 있는지 (삭제 후 정리된 행은 0)
+        self._buckets: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def _band_keys(self, signature: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        signature &= _MASK64
+        return [(band << self.band_bits) | ((signature >> (band * self.band_bits)) & mask)
+                for band in range(self.num_bands)]
+
+    def _find_group(self, signature: int, keys: List[int]) -> Optional[int]:
+        """버킷에서 해밍 거리 max_distance 이하인 행의 그룹 번호"""
+        for key in keys:
+            for other in self._buckets.get(key, ()):
+                if _hamming(signature, self.signatures[other]) <= self.max_distance:
+                    return self.groups[other]
+        return None
+
+    def _bucket(self, doc_id: int, keys: List[int]):
+        for key in keys:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = array('i')
+            bucket.append(doc_id)
+
+    def add(self, signatures: Iterable[int]):
+        """서명 추가 (행 번호는 현재 행 수부터 연속)"""
+        for signature in signatures:
+            doc_id = len(self.signatures)
+            keys = self._band_keys(signature)
+            group = self._find_group(signature, keys)
+            self.signatures.append(signature)
+            self.bucketed.append(1)
+            # 그룹 번호를 마지막에 기록해야 검색 중인 스레드가 새 행을 보지 않는다
+            self.groups.append(doc_id if group is None else group)
+            self._bucket(doc_id, keys)
+
+    def group_of(self, doc_ids: Iterable[int]) -> List[int]:
+        """행별 중복 그룹 번호"""
+        return [self.groups[int(i)] for i in doc_ids]
+
+    def num_duplicates(self) -> int:
+        """다른 행의 그룹에 속한 (중복으로 접히는) 행 수"""
+        groups = np.fromiter(self.groups, dtype=np.int64)  # 버퍼를 잡지 않음 (추가와 동시 호출 가능)
+        return int(np.count_nonzero(groups != np.arange(len(groups))))
+
+    def _rebuild_buckets(self):
+        self._buckets = {}
+        for doc_id, (signature, bucketed) in enumerate(zip(self.signatures, self.bucketed)):
+            if bucketed:
+                self._bucket(doc_id, self._band_keys(signature))
+
+    def remove_documents(self, deleted: np.ndarray) -> 'DuplicateIndex':
+        """삭제 표시된 행을 버킷에서 뺀 새 테이블 반환 (행 번호와 그룹 번호는 유지)"""
+        index = DuplicateIndex(self.max_distance, self.num_bands)
+        index.signatures = array('q', self.signatures)
+        index.groups = array('i', self.groups)
+        index.bucketed = array('b', self.bucketed)
+        n = min(len(deleted), len(index.bucketed))
+        for doc_id in np.nonzero(deleted[:n])[0]:
+            index.bucketed[int(doc_id)] = 0
+        index._rebuild_buckets()
+        return index
+
+    def save(self, filepath: str):
+        np.savez(
+            filepath,
+            signatures=np.array(self.signatures, dtype=np.int64),
+            groups=np.array(self.groups, dtype=np.int32),
+            bucketed=np.array(self.bucketed, dtype=np.int8),
+            meta=np.array([self.max_distance, self.num_bands], dtype=np.int64)
+        )
+
+    def load(self, filepath: str) -> bool:
+        """저장된 테이블 로드 (버킷은 서명으로부터 재구성)"""
+        if not os.path.exists(filepath):
+            return False
+        with np.load(filepath) as data:
+            self.max_distance, self.num_bands = (int(v) for v in data['meta'])
+            self.band_bits = 64 // self.num_bands
+            self.signatures = array('q', data['signatures'].astype(np.int64).tobytes())
+            self.groups = array('i', data['groups'].astype(np.int32).tobytes())
+            self.bucketed = array('b', data['bucketed'].astype(np.int8).tobytes())
+        self._rebuild_buckets()
+        return True
+
+
+def signature_groups(signatures: List[Optional[int]], max_distance: int = 3) -> List[int]:
+    """서명이 해밍 거리 max_distance 이내인 앞선 항목의 번호로 묶음
+
+    LSH 테이블이 없는 결과 목록(샤드 병합 결과 등)용 쌍 비교이며,
+    서명이 없는(None) 항목은 따로 둔다.
+    """
+    groups: List[int] = []
+    for i, signature in enumerate(signatures):
+        group = i
+        if signature is not None:
+            for j in range(i):
+                other = signatures[j]
+                if (groups[j] == j and other is not None
+                        and _hamming(signature, other) <= max_distance):
+                    group = j
+                    break
+        groups.append(group)
+    return groups
+
+
+def collapse_results(results: List[Dict], groups: Iterable, k: int) -> List[Dict]:
+    """그룹별 첫 결과만 k개까지 남기기
+
+    접힌 결과 수는 대표 결과의 'duplicates'에 더한다 (이미 접힌 수 포함).
+    """
+    heads: Dict = {}
+    collapsed = []
+    for result, group in zip(results, groups):
+        head = heads.get(group)
+        if head is not None:
+            head['duplicates'] = head.get('duplicates', 0) + 1 + result.get('duplicates', 0)
+        elif len(collapsed) < k:
+            heads[group] = result
+            collapsed.append(result)
+    return collapsed
@@ -0,0 +1,163 @@
+"""
+RAG 3단계 보조: ONNX Encoder
+SentenceTransformer 모델을 ONNX로 내보내 ONNX Runtime(CPU)으로 임베딩 (선택적으로 동적 int8 양자화)
+"""
+import os
+import json
+from typing import List, Dict, Any, Optional, Union
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ONNX_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+CONFIG_FILE = "encoder_config.json"
+
+
+def onnx_model_dir(cache_dir: str, model_name: str) -> str:
+    """모델별 ONNX 파일 디렉토리"""
+    return os.path.join(cache_dir, "onnx", model_name.replace('/', '__'))
+
+
+def export_onnx(model_name: str, cache_dir: str, model_dir: str, opset: int = 14):
+    """SentenceTransformer의 트랜스포머 본체를 ONNX로 내보내기 (토크나이저/풀링 설정 함께 저장)
+
+    풀링과 정규화는 encode에서 NumPy로 처리하므로 그래프는 last_hidden_state까지만 포함한다.
+    내보내기에만 torch가 필요하다.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    logger.info(f"ONNX 내보내기: {model_name} -> {model_dir}")
+    st_model = SentenceTransformer(model_name, cache_folder=cache_dir, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    pooling = st_model[1].get_pooling_mode_str() if len(st_model) > 1 else 'mean'
+    if pooling not in ('mean', 'cls', 'max'):
+        raise ValueError(f"지원하지 않는 풀링 방식: {pooling}")
+
+    class _HiddenStates(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    os.makedirs(model_dir, exist_ok=True)
+    sample = tokenizer(["도로 설계속도 기준"], return_tensors='pt')
+    tmp_path = os.path.join(model_dir, f"{ONNX_FILE}.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStates(transformer),
+            (sample['input_ids'], sample['attention_mask']),
+            tmp_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'last_hidden_state': {0: 'batch', 1: 'sequence'}
+            },
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    os.replace(tmp_path, os.path.join(model_dir, ONNX_FILE))
+
+    tokenizer.save_pretrained(model_dir)
+    with open(os.path.join(model_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'pooling': pooling,
+            'max_seq_length': st_model.max_seq_length
+        }, f, ensure_ascii=False, indent=2)
+
+
+def quantize_int8(model_dir: str):
+    """가중치 동적 int8 양자화 (활성값은 실행 시 양자화, 보정 데이터 불필요)"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    logger.info(f"ONNX 동적 int8 양자화: {model_dir}")
+    tmp_path = os.path.join(model_dir, f"{INT8_FILE}.tmp")
+    quantize_dynamic(os.path.join(model_dir, ONNX_FILE), tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, os.path.join(model_dir, INT8_FILE))
+
+
+class OnnxSentenceEncoder:
+    """SentenceTransformer.encode와 같은 인터페이스의 ONNX Runtime 인코더
+
+    KoreanEmbeddingEngine이 사용하는 encode / tokenizer / max_seq_length만 제공한다.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.pooling = config['pooling']
+        self.max_seq_length = config['max_seq_length']
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.model_path = os.path.join(model_dir, INT8_FILE if quantized else ONNX_FILE)
+        self.session = ort.InferenceSession(self.model_path, options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    @classmethod
+    def load_or_export(cls,
+                       model_name: str,
+                       cache_dir: str,
+                       quantized: bool = False,
+                       num_threads: Optional[int] = None) -> 'OnnxSentenceEncoder':
+        """내보낸 ONNX 모델이 있으면 로드, 없으면 내보내기(및 양자화) 후 로드"""
+        model_dir = onnx_model_dir(cache_dir, model_name)
+        if not os.path.exists(os.path.join(model_dir, ONNX_FILE)):
+            export_onnx(model_name, cache_dir, model_dir)
+        if quantized and not os.path.exists(os.path.join(model_dir, INT8_FILE)):
+            quantize_int8(model_dir)
+        return cls(model_dir, quantized, num_threads)
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == 'cls':
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(hidden.dtype)
+        if self.pooling == 'max':
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self,
+               sentences: Union[str, List[str]],
+               batch_size: int = 32,
+               show_progress_bar: bool = False,
+               normalize_embeddings: bool = False,
+               **_) -> np.ndarray:
+        """문장(들)의 임베딩 (입력이 문자열이면 1차원 벡터)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            features = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors='np'
+            )
+            feeds = {name: features[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            outputs.append(self._pool(hidden, features['attention_mask']))
+        embeddings = (np.vstack(outputs) if outputs else np.empty((0, 0))).astype(np.float32)
+        if normalize_embeddings and len(embeddings):
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            'model_path': self.model_path,
+            'pooling': self.pooling,
+            'max_seq_length': self.max_seq_length
+        }
@@ -0,0 +1,137 @@
+"""
+RAG 3단계 보조: Query Batcher
+동시에 들어온 검색 질의를 모아 한 번의 모델 호출로 임베딩 (asyncio 마이크로 배치)
+"""
+import time
+import asyncio
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QueryBatcher:
+    """질의 임베딩 마이크로 배치기
+
+    encode()는 질의를 큐에 넣고 결과 future를 기다린다. 배치 작업은 첫 질의가
+    도착한 뒤 max_wait_ms 동안(또는 max_batch_size개가 찰 때까지) 질의를 더 모아
+    engine.encode_queries를 스레드 풀에서 한 번 호출하고 각 future에 결과를 넣는다.
+    이벤트 루프는 모델 연산 중에도 다른 요청을 처리한다.
+    """
+
+    def __init__(self,
+                 engine,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 latency_window: int = 1024):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # 통계 (최근 latency_window개 질의의 대기 시간)
+        self._queue_latencies: deque = deque(maxlen=latency_window)
+        self._encode_times: deque = deque(maxlen=latency_window)
+        self.total_queries = 0
+        self.total_batches = 0
+
+    def start(self):
+        """현재 이벤트 루프에서 배치 작업 시작 (encode 첫 호출 시 자동 시작)"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """배치 작업 종료 (대기 중인 질의는 취소)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.cancel()
+
+    async def encode(self, query: str) -> np.ndarray:
+        """질의 하나의 임베딩 (다른 동시 질의와 같은 배치로 계산)"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, float]]:
+        """첫 질의를 기다린 뒤 max_wait 동안 최대 max_batch_size개까지 모음"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # 대기 없이 꺼낼 수 있는 질의는 마저 포함
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 호출자가 이미 포기한(취소된) 질의는 제외
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self._queue_latencies.append(started - enqueued)
+            try:
+                embeddings = await loop.run_in_executor(
+                    None, self.engine.encode_queries, [query for query, _, _ in batch]
+                )
+                if len(embeddings) != len(batch):
+                    raise RuntimeError(f"배치 임베딩 수 불일치: {len(embeddings)} != {len(batch)}")
+                for (_, future, _), embedding in zip(batch, embeddings):
+                    if not future.done():
+                        future.set_result(embedding)
+            except Exception as e:
+                logger.error(f"질의 배치 임베딩 실패: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self._encode_times.append(time.perf_counter() - started)
+            self.total_queries += len(batch)
+            self.total_batches += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """배치 크기와 큐 대기 시간(ms) 통계"""
+        latencies = np.array(self._queue_latencies, dtype=np.float64) * 1000
+        encode_times = np.array(self._encode_times, dtype=np.float64) * 1000
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'total_queries': self.total_queries,
+            'total_batches': self.total_batches,
+            'mean_batch_size': self.total_queries / self.total_batches if self.total_batches else 0.0,
+            'queue_latency_ms': {
+                'p50': float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+                'p95': float(np.percentile(latencies, 95)) if latencies.size else 0.0,
+                'max': float(latencies.max()) if latencies.size else 0.0
+            },
+            'encode_ms': {
+                'p50': float(np.percentile(encode_times, 50)) if encode_times.size else 0.0,
+                'p95': float(np.percentile(encode_times, 95)) if encode_times.size else 0.0
+            },
+            'pending': self._queue.qsize() if self._queue is not None else 0
+        }
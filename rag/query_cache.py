@@ -0,0 +1,120 @@
+"""
+RAG 4단계 보조: Query Cache
+반복 질의의 검색 결과를 LRU + TTL로 캐시
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Hashable
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def vector_digest(vector: np.ndarray) -> str:
+    """질의 임베딩의 캐시 키 (float32 바이트 해시)"""
+    data = np.ascontiguousarray(vector, dtype='float32').tobytes()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def make_key(mode: str, query: Any, **params) -> str:
+    """모드, 질의, 검색 파라미터(k, 필터 등)로 캐시 키 생성
+
+    키워드는 그대로 키에 넣는다. 구문 검색은 공백까지 그대로 매칭하고 결과의
+    matched_keywords도 입력 키워드를 담으므로, 정규화하면 결과가 다른 질의가 섞인다.
+    """
+    return json.dumps([mode, query, params], sort_keys=True, ensure_ascii=False, default=str)
+
+
+class QueryCache:
+    """스레드 안전 LRU + TTL 캐시
+
+    인덱스 버전이 바뀌면(sync) 전체를 비워 오래된 결과가 반환되지 않게 한다.
+    max_size가 0이면 캐시를 사용하지 않는다.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def sync(self, version: int):
+        """인덱스 버전이 달라졌으면 캐시 비우기"""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """캐시된 값 (없거나 만료되면 None)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+def copy_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """캐시 결과를 호출자가 수정해도 캐시가 바뀌지 않도록 복사"""
+    copied = []
+    for result in results:
+        result = dict(result)
+        if isinstance(result.get('metadata'), dict):
+            result['metadata'] = result['metadata'].copy()
+        if isinstance(result.get('matched_keywords'), list):
+            result['matched_keywords'] = list(result['matched_keywords'])
+        copied.append(result)
+    return copied
@@ -0,0 +1,171 @@
+"""
+RAG 4단계 보조: Segment Log
+add_documents 배치를 추가 전용 세그먼트 파일 + WAL로 기록
+"""
+import os
+import json
+from typing import List, Dict, Any, Tuple
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _fsync_write(path: str, data: bytes):
+    """임시 파일에 기록 후 fsync, 원자적으로 교체"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SegmentLog:
+    """추가 전용 세그먼트 로그
+
+    각 배치는 seg_XXXXXX.npz 세그먼트(정규화된 임베딩 + 문서/메타데이터 JSON)로
+    fsync 후 기록되고, 이어서 wal.log에 한 줄이 추가되어야 커밋된 것으로 본다.
+    문서 삭제도 삭제된 문서 ID 배열을 담은 세그먼트(op: delete)로 같은 순서에 기록된다.
+    기록 도중 중단되면 WAL에 없는 세그먼트는 무시되므로 현재 배치만 유실된다.
+    세그먼트 정리 후에는 checkpoint 항목을 남겨 seq가 계속 증가하도록 한다.
+    """
+
+    WAL_NAME = "wal.log"
+
+    def __init__(self, directory: str, repair: bool = True):
+        """
+        Args:
+            repair: 잘린 WAL 줄을 정리할지 여부. 다른 인스턴스가 기록 중인 로그를
+                읽기만 할 때는 False (기록 중인 줄을 지우지 않도록)
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.wal_path = os.path.join(directory, self.WAL_NAME)
+        entries = self.entries()
+        if repair:
+            self._repair(entries)
+        self.last_seq = entries[-1]['seq'] if entries else 0
+
+    def _repair(self, entries: List[Dict[str, Any]]):
+        """중단으로 잘린 마지막 줄이 있으면 커밋된 항목만 남기고 다시 기록"""
+        if not os.path.exists(self.wal_path):
+            return
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode('utf-8')
+        if os.path.getsize(self.wal_path) != len(data):
+            logger.warning("WAL 복구: 불완전한 항목 제거")
+            _fsync_write(self.wal_path, data)
+
+    def entries(self, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """커밋된 WAL 항목 (after_seq 이후, seq 순, checkpoint 포함)"""
+        if not os.path.exists(self.wal_path):
+            return []
+        entries = []
+        with open(self.wal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 기록 도중 중단된 마지막 줄
+                    logger.warning("불완전한 WAL 항목 무시")
+                    break
+                if entry['seq'] > after_seq:
+                    entries.append(entry)
+        return entries
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"seg_{seq:06d}.npz")
+
+    def _write_segment(self, seq: int, **arrays) -> str:
+        """세그먼트 파일을 fsync 후 기록하고 파일 이름 반환"""
+        path = self._segment_path(seq)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return os.path.basename(path)
+
+    def _commit(self, entry: Dict[str, Any]):
+        """WAL에 항목 추가 (이 시점부터 커밋된 것으로 봄)"""
+        with open(self.wal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.last_seq = entry['seq']
+
+    def append(self,
+               embeddings: np.ndarray,
+               metadatas: List[Dict],
+               documents: List[str],
+               start_id: int) -> int:
+        """배치를 세그먼트로 기록하고 WAL에 커밋, seq 반환"""
+        seq = self.last_seq + 1
+        payload = json.dumps(
+            {'metadatas': metadatas, 'documents': documents},
+            ensure_ascii=False, default=str
+        ).encode('utf-8')
+        filename = self._write_segment(
+            seq,
+            embeddings=np.ascontiguousarray(embeddings, dtype='float32'),
+            payload=np.frombuffer(payload, dtype=np.uint8)
+        )
+        self._commit({
+            'op': 'add',
+            'seq': seq,
+            'file': filename,
+            'start_id': start_id,
+            'count': len(documents)
+        })
+        return seq
+
+    def append_delete(self, doc_ids: np.ndarray) -> int:
+        """삭제된 문서 ID를 세그먼트로 기록하고 WAL에 커밋, seq 반환"""
+        seq = self.last_seq + 1
+        filename = self._write_segment(seq, deleted_ids=np.asarray(doc_ids, dtype=np.int64))
+        self._commit({
+            'op': 'delete',
+            'seq': seq,
+            'file': filename,
+            'count': int(len(doc_ids))
+        })
+        return seq
+
+    def read_segment(self, entry: Dict[str, Any]) -> Tuple[np.ndarray, List[Dict], List[str]]:
+        """세그먼트 내용 (임베딩, 메타데이터, 문서) 반환"""
+        with np.load(os.path.join(self.directory, entry['file'])) as data:
+            embeddings = data['embeddings']
+            payload = json.loads(data['payload'].tobytes().decode('utf-8'))
+        return embeddings, payload['metadatas'], payload['documents']
+
+    def read_deleted(self, entry: Dict[str, Any]) -> np.ndarray:
+        """삭제 세그먼트의 문서 ID 배열 반환"""
+        with np.load(os.path.join(self.directory, entry['file'])) as data:
+            return data['deleted_ids']
+
+    def truncate(self, upto_seq: int):
+        """스냅샷에 병합된 세그먼트(seq <= upto_seq) 제거"""
+        remaining = self.entries(after_seq=upto_seq)
+        checkpoint = {'op': 'checkpoint', 'seq': upto_seq}
+        data = "".join(json.dumps(entry) + "\n" for entry in [checkpoint] + remaining)
+        _fsync_write(self.wal_path, data.encode('utf-8'))
+
+        for name in os.listdir(self.directory):
+            if name.startswith("seg_") and name.endswith(".npz"):
+                seq = int(name[4:-4])
+                if seq <= upto_seq:
+                    os.remove(os.path.join(self.directory, name))
+        logger.info(f"세그먼트 정리 완료: seq {upto_seq} 이하 제거, {len(remaining)}개 유지")
+
+    def segments(self, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """재적용할 세그먼트 항목 (after_seq 이후, add/delete)"""
+        return [entry for entry in self.entries(after_seq) if entry['op'] in ('add', 'delete')]
+
+    def reset(self):
+        """모든 세그먼트와 WAL 삭제 (전체 재구축 시작 시)"""
+        for name in os.listdir(self.directory):
+            if name.startswith("seg_") or name.startswith(self.WAL_NAME):
+                os.remove(os.path.join(self.directory, name))
+        self.last_seq = 0
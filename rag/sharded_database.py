@@ -0,0 +1,427 @@
+"""
+RAG 4단계 보조: Sharded Vector Database
+VectorDatabase 여러 개로 코퍼스를 분할하고 병렬 검색 후 상위 k개 병합
+"""
+import os
+import json
+import heapq
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import numpy as np
+import logging
+
+from rag.vector_database import VectorDatabase
+from rag.bm25_ranker import BM25Ranker
+from rag.near_duplicates import signature_groups, collapse_results
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 분할 기준
+PARTITION_TYPES = ('category', 'hash')
+
+# category 값이 없는 문서가 들어가는 샤드
+DEFAULT_SHARD = "_default"
+
+
+class ShardedVectorDatabase:
+    """샤드별 VectorDatabase 묶음
+
+    partition으로 문서를 샤드에 배정한다.
+      - category: metadata['category'] 값별 샤드 (필터에 category가 있으면 해당 샤드만 검색)
+      - hash: metadata['source'](원본 파일) 해시로 num_shards개 샤드에 분산
+    검색은 샤드별 search/keyword_search를 스레드 풀에서 동시에 실행하고
+    힙으로 상위 k개만 병합한다. FAISS/NumPy 연산은 GIL을 놓으므로 스레드로도
+    여러 코어를 사용한다. 각 샤드는 storage_dir/shard_<이름> 에 자신의 파일을 저장하며,
+    샤드 목록은 <prefix>_shards.json 에 기록되어 일부 샤드만 로드할 수 있다.
+
+    결과의 vector_id는 샤드 내 ID이므로 'shard'와 함께 문서를 식별한다.
+    """
+
+    def __init__(self,
+                 dimension: int,
+                 index_type: str = "cosine",
+                 storage_dir: str = "./vector_store",
+                 ann_type: str = "flat",
+                 partition: str = "category",
+                 num_shards: int = 4,
+                 index_params: Optional[Dict[str, Any]] = None,
+                 search_params: Optional[Dict[str, Any]] = None,
+                 max_workers: Optional[int] = None,
+                 mmap_index: bool = False):
+
+        if partition not in PARTITION_TYPES:
+            raise ValueError(f"지원하지 않는 분할 기준: {partition}")
+
+        self.dimension = dimension
+        self.index_type = index_type
+        self.storage_dir = storage_dir
+        self.ann_type = ann_type
+        self.partition = partition
+        self.num_shards = num_shards
+        self.index_params = index_params
+        self.search_params = search_params
+        self.max_workers = max_workers
+        self.mmap_index = mmap_index
+
+        os.makedirs(storage_dir, exist_ok=True)
+
+        self.shards: Dict[str, VectorDatabase] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _create_shard(self, name: str) -> VectorDatabase:
+        """샤드 생성 (샤드별 저장 디렉토리)"""
+        shard = VectorDatabase(
+            dimension=self.dimension,
+            index_type=self.index_type,
+            storage_dir=os.path.join(self.storage_dir, f"shard_{name}"),
+            ann_type=self.ann_type,
+            index_params=self.index_params,
+            search_params=self.search_params,
+            mmap_index=self.mmap_index
+        )
+        self.shards[name] = shard
+        return shard
+
+    def shard_name(self, metadata: Dict) -> str:
+        """문서를 배정할 샤드 이름"""
+        if self.partition == "category":
+            category = str(metadata.get('category') or DEFAULT_SHARD)
+            # 디렉토리 이름으로 쓸 수 없는 문자 치환
+            return category.replace('/', '_').replace('\\', '_')
+        source = str(metadata.get('source') or metadata.get('file_name') or '')
+        return f"{zlib.crc32(source.encode('utf-8')) % self.num_shards:02d}"
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            workers = self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+            self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                thread_name_prefix="vector-db-shard")
+        return self._executor
+
+    def close(self):
+        """스레드 풀 종료"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _fan_out(self,
+                 func: Callable[[VectorDatabase], Any],
+                 names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """샤드별로 func를 병렬 실행하여 {샤드 이름: 결과} 반환"""
+        names = list(self.shards) if names is None else names
+        if len(names) == 1:
+            return {names[0]: func(self.shards[names[0]])}
+        futures = {name: self._pool().submit(func, self.shards[name]) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _target_shards(self, filters: Optional[Dict[str, Any]]) -> List[str]:
+        """필터로 검색 대상 샤드를 좁힘 (category 분할에서 category 필터가 있을 때)"""
+        if self.partition != "category" or not filters or filters.get('category') is None:
+            return list(self.shards)
+        value = filters['category']
+        values = [value] if isinstance(value, str) else list(value)
+        wanted = {self.shard_name({'category': v}) for v in values}
+        return [name for name in self.shards if name in wanted]
+
+    @staticmethod
+    def _tag(results: List[Dict[str, Any]], name: str) -> List[Dict[str, Any]]:
+        for result in results:
+            result['shard'] = name
+        return results
+
+    def _merge_vector_results(self,
+                              per_shard: Dict[str, List[Dict[str, Any]]],
+                              k: int) -> List[Dict[str, Any]]:
+        """샤드별 벡터 검색 결과에서 힙으로 상위 k개 선택"""
+        candidates = (r for name, results in per_shard.items() for r in self._tag(results, name))
+        if self.index_type == "l2":
+            # L2는 거리가 작을수록 유사
+            return heapq.nsmallest(k, candidates, key=lambda r: r['similarity'])
+        return heapq.nlargest(k, candidates, key=lambda r: r['similarity'])
+
+    def add_documents(self,
+                      embeddings: np.ndarray,
+                      metadatas: List[Dict],
+                      documents: List[str]):
+        """문서를 샤드별로 나누어 추가 (샤드 간에는 병렬)"""
+        if embeddings.shape[0] != len(metadatas) or embeddings.shape[0] != len(documents):
+            raise ValueError("임베딩, 메타데이터, 문서 수가 일치하지 않음")
+
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            name = self.shard_name(metadata)
+            metadata['shard'] = name
+            groups.setdefault(name, []).append(i)
+
+        for name in groups:
+            if name not in self.shards:
+                self._create_shard(name)
+
+        def add(name: str, rows: List[int]):
+            self.shards[name].add_documents(
+                embeddings[rows],
+                [metadatas[i] for i in rows],
+                [documents[i] for i in rows]
+            )
+
+        futures = [self._pool().submit(add, name, rows) for name, rows in groups.items()]
+        for future in futures:
+            future.result()
+
+    def remove_by_source(self, file_path: str) -> int:
+        """모든 샤드에서 원본 파일의 문서 삭제, 삭제한 문서 수 반환"""
+        removed = self._fan_out(lambda shard: shard.remove_by_source(file_path))
+        return sum(removed.values())
+
+    def upsert_file(self,
+                    file_path: str,
+                    embeddings: np.ndarray,
+                    metadatas: List[Dict],
+                    documents: List[str]) -> int:
+        """원본 파일의 기존 문서를 삭제하고 새 청크를 샤드별로 추가, 삭제한 문서 수 반환"""
+        source = file_path.replace('\\', '/')
+        for metadata in metadatas:
+            metadata['source'] = source
+        removed = self.remove_by_source(source)
+        self.add_documents(embeddings, metadatas, documents)
+        return removed
+
+    def train_index(self) -> bool:
+        """모든 샤드의 인덱스 학습 (IVF 계열)"""
+        trained = self._fan_out(lambda shard: shard.train_index())
+        return bool(trained) and all(trained.values())
+
+    def search(self,
+               query_embedding: np.ndarray,
+               k: int = 5,
+               min_similarity: float = 0.0,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """샤드별 벡터 검색을 병렬 실행 후 상위 k개 병합"""
+        try:
+            per_shard = self._fan_out(
+                lambda shard: shard.search(query_embedding, k, min_similarity,
+                                           nprobe, ef_search, filters),
+                self._target_shards(filters)
+            )
+            return self._merge_vector_results(per_shard, k)
+
+        except Exception as e:
+            logger.error(f"샤드 벡터 검색 실패: {e}")
+            return []
+
+    def search_batch(self,
+                     query_matrix: np.ndarray,
+                     k: int = 5,
+                     min_similarity: float = 0.0,
+                     nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """여러 질의를 샤드별 배치 검색 후 질의마다 상위 k개 병합"""
+        n_queries = len(query_matrix)
+        try:
+            per_shard = self._fan_out(
+                lambda shard: shard.search_batch(query_matrix, k, min_similarity,
+                                                 nprobe, ef_search, filters),
+                self._target_shards(filters)
+            )
+            return [
+                self._merge_vector_results(
+                    {name: results[q] for name, results in per_shard.items()}, k
+                )
+                for q in range(n_queries)
+            ]
+
+        except Exception as e:
+            logger.error(f"샤드 배치 벡터 검색 실패: {e}")
+            return [[] for _ in range(n_queries)]
+
+    def keyword_search(self,
+                       keywords: List[str],
+                       match_all: bool = False,
+                       k: int = 10,
+                       filters: Optional[Dict[str, Any]] = None,
+                       within: Optional[int] = None,
+                       fuzzy: bool = False,
+                       collapse_duplicates: bool = False) -> List[Dict[str, Any]]:
+        """샤드별 BM25F 키워드 검색을 병렬 실행 후 상위 k개 병합
+
+        먼저 샤드별 컬렉션 통계(문서 수, 키워드별 df, 필드 길이 합)를 모아 합친 뒤
+        그 통계로 각 샤드가 점수를 계산하므로, bm25_score는 샤드를 나누지 않은 것과 같은
+        IDF/평균 길이 기준이다. match_score는 병합된 상위 결과 기준으로 다시 정규화한다.
+        collapse_duplicates=True면 샤드 안에서 접은 뒤 샤드 사이의 중복도 접는다.
+        """
+        try:
+            names = self._target_shards(filters)
+            if not names:
+                return []
+            # 평균 길이는 전체 문서 기준이므로 검색 대상이 아닌 샤드의 통계도 합침
+            # (필터에 맞는 문서가 없는 샤드는 매칭 없이 길이 합만 반환)
+            collection = BM25Ranker.merge_stats(self._fan_out(
+                lambda shard: shard.keyword_collection_stats(keywords, filters, fuzzy)
+            ).values())
+            per_shard = self._fan_out(
+                lambda shard: shard.keyword_search(keywords, match_all, k, filters,
+                                                   within, fuzzy, collapse_duplicates,
+                                                   collection_stats=collection),
+                names
+            )
+            candidates = (r for name, results in per_shard.items()
+                          for r in self._tag(results, name))
+            if collapse_duplicates:
+                ranked = sorted(candidates, key=lambda r: r['bm25_score'], reverse=True)
+                results = self._collapse_across(ranked, k)
+            else:
+                results = heapq.nlargest(k, candidates, key=lambda r: r['bm25_score'])
+
+            top_score = results[0]['bm25_score'] if results else 0.0
+            for result in results:
+                result['match_score'] = result['bm25_score'] / top_score if top_score > 0 else 0.0
+            return results
+
+        except Exception as e:
+            logger.error(f"샤드 키워드 검색 실패: {e}")
+            return []
+
+    def locate_keywords(self,
+                        text: str,
+                        keywords: List[str],
+                        fuzzy: bool = True) -> List[Tuple[int, int]]:
+        """텍스트의 키워드 구간 (오타 변형은 샤드마다 어휘가 다르므로 합집합)"""
+        spans = set()
+        for shard in self.shards.values():
+            spans.update(shard.locate_keywords(text, keywords, fuzzy))
+        return sorted(spans)
+
+    def hybrid_search(self,
+                      query_embedding: np.ndarray,
+                      keywords: List[str],
+                      k: int = 10,
+                      vector_weight: float = 0.7,
+                      filters: Optional[Dict[str, Any]] = None,
+                      collapse_duplicates: bool = False) -> List[Dict[str, Any]]:
+        """하이브리드 검색 (병합된 벡터/키워드 결과를 (샤드, vector_id) 단위로 조합)"""
+        try:
+            if not collapse_duplicates:
+                vector_results = self.search(query_embedding, k*2, filters=filters)
+                keyword_results = self.keyword_search(keywords, False, k*2, filters)
+                return VectorDatabase._combine_results(vector_results, keyword_results,
+                                                       k, vector_weight)
+
+            # 접은 뒤 k개가 안 되면 후보를 늘려 다시 가져옴 (VectorDatabase._fetch_collapsed와 같은 기준)
+            n = k * 2
+            while True:
+                vector_results = self.search(query_embedding, n, filters=filters)
+                keyword_results = self.keyword_search(keywords, False, n, filters,
+                                                      collapse_duplicates=True)
+                combined = VectorDatabase._combine_results(
+                    vector_results, keyword_results,
+                    len(vector_results) + len(keyword_results), vector_weight
+                )
+                results = self._collapse_across(combined, k)
+                if len(results) >= k or len(vector_results) < n or n >= k * 8:
+                    return results
+                n *= 2
+
+        except Exception as e:
+            logger.error(f"샤드 하이브리드 검색 실패: {e}")
+            return []
+
+    @staticmethod
+    def _collapse_across(results: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """샤드마다 LSH 테이블이 따로 있으므로 병합된 결과는 메타데이터 simhash를 쌍 비교"""
+        groups = signature_groups([r['metadata'].get('simhash') for r in results])
+        return collapse_results(results, groups, k)
+
+    def open_segment_log(self, filename_prefix: str = "vector_db", reset: bool = False):
+        """모든 샤드의 세그먼트 로그 시작 (새로 생기는 샤드는 add 시점에 로그 없음)"""
+        for shard in self.shards.values():
+            shard.open_segment_log(filename_prefix, reset=reset)
+
+    def wait_for_compaction(self):
+        for shard in self.shards.values():
+            shard.wait_for_compaction()
+
+    def save_database(self, filename_prefix: str = "vector_db") -> bool:
+        """샤드별 save_database(각 샤드 디렉토리) 후 샤드 목록 저장"""
+        try:
+            saved = self._fan_out(lambda shard: shard.save_database(filename_prefix))
+            if not all(saved.values()):
+                logger.error("일부 샤드 저장 실패")
+                return False
+
+            manifest_path = os.path.join(self.storage_dir, f"{filename_prefix}_shards.json")
+            with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump({
+                    'partition': self.partition,
+                    'num_shards': self.num_shards,
+                    'dimension': self.dimension,
+                    'index_type': self.index_type,
+                    'ann_type': self.ann_type,
+                    'shards': sorted(self.shards)
+                }, f, ensure_ascii=False, indent=2)
+            os.replace(f"{manifest_path}.tmp", manifest_path)
+
+            logger.info(f"샤드 데이터베이스 저장 완료: {len(self.shards)}개 샤드")
+            return True
+
+        except Exception as e:
+            logger.error(f"샤드 데이터베이스 저장 실패: {e}")
+            return False
+
+    def load_database(self,
+                      filename_prefix: str = "vector_db",
+                      shards: Optional[List[str]] = None) -> bool:
+        """샤드 목록을 읽고 샤드별 데이터베이스를 병렬 로드
+
+        Args:
+            shards: 로드할 샤드 이름 (None이면 전체). 일부 컬렉션만 메모리에 올릴 때 사용.
+        """
+        try:
+            manifest_path = os.path.join(self.storage_dir, f"{filename_prefix}_shards.json")
+            if not os.path.exists(manifest_path):
+                logger.warning("샤드 목록 파일을 찾을 수 없음")
+                return False
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.partition = manifest.get('partition', self.partition)
+            self.num_shards = manifest.get('num_shards', self.num_shards)
+            self.ann_type = manifest.get('ann_type', self.ann_type)
+
+            names = manifest['shards'] if shards is None else [
+                name for name in manifest['shards'] if name in shards
+            ]
+            self.shards = {}
+            for name in names:
+                self._create_shard(name)
+            loaded = self._fan_out(lambda shard: shard.load_database(filename_prefix), names)
+
+            failed = [name for name, ok in loaded.items() if not ok]
+            for name in failed:
+                del self.shards[name]
+            if failed:
+                logger.warning(f"로드 실패 샤드: {failed}")
+
+            logger.info(f"샤드 데이터베이스 로드 완료: {len(self.shards)}개 샤드")
+            return bool(self.shards)
+
+        except Exception as e:
+            logger.error(f"샤드 데이터베이스 로드 실패: {e}")
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """전체 및 샤드별 통계"""
+        shard_stats = {name: shard.get_stats() for name, shard in self.shards.items()}
+        return {
+            'total_documents': sum(s['total_documents'] for s in shard_stats.values()),
+            'dimension': self.dimension,
+            'index_type': self.index_type,
+            'ann_type': self.ann_type,
+            'partition': self.partition,
+            'num_shards': len(self.shards),
+            'total_searches': sum(s['total_searches'] for s in shard_stats.values()),
+            'shards': shard_stats
+        }
@@ -3,63 +3,666 @@ RAG 4단계: Vector Database
 FAISS 기반 벡터 데이터베이스와 키워드 검색
 """
 import os
+import re
+import time
+import shutil
+import threading
 import faiss
 import numpy as np
 import json
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Callable
 import pickle
 from datetime import datetime
 import logging
 
+from rag.keyword_index import KeywordIndex
+from rag.fuzzy_index import FuzzyIndex
+from rag.near_duplicates import DuplicateIndex, simhash, collapse_results
+from rag.bm25_ranker import BM25Ranker
+from rag.document_store import DocumentStore, TextColumn, MetadataTable, VectorColumn
+from rag.segment_log import SegmentLog
+from rag.query_cache import QueryCache, make_key, vector_digest, copy_results
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 검색 중 적용 가능한 메타데이터 필터 필드 (값 일치)
+FILTER_FIELDS = ('category', 'file_name')
+
+# 스냅샷별로 보관하는 필터 마스크 수 (LRU)
+FILTER_CACHE_SIZE = 32
+
+# ANN 인덱스 종류별 기본 파라미터
+DEFAULT_INDEX_PARAMS = {
+    'flat': {},
+    'ivf_flat': {'nlist': 256},
+    'hnsw': {'M': 32, 'ef_construction': 200},
+    'ivf_pq': {'nlist': 256, 'pq_m': 48, 'pq_nbits': 8},
+    'sq8': {'train_size': 4096},
+    'sq_fp16': {},
+}
+
+# 양자화된 벡터를 저장하는 인덱스 (float32 원본을 mmap 파일로 두고 재순위화)
+QUANTIZED_TYPES = ('ivf_pq', 'sq8', 'sq_fp16')
+
+# 질의 시점 기본 파라미터
+DEFAULT_SEARCH_PARAMS = {
+    'nprobe': 16,       # IVF 계열: 탐색할 클러스터 수
+    'ef_search': 64,    # HNSW: 탐색 후보 리스트 크기
+    'rerank_factor': 4, # 양자화 인덱스: k × 배수 후보를 float32 원본으로 재순위화 (0이면 끔)
+}
+
+# k-means 학습에 필요한 클러스터당 최소 학습 벡터 수 (FAISS 권장값)
+MIN_POINTS_PER_CENTROID = 39
+
+# 인덱스를 읽기 전용 mmap으로 여는 FAISS IO 플래그
+# (IO_FLAG_MMAP_IFC는 Flat/SQ 코드와 IVF 리스트까지 매핑, 이전 버전은 IO_FLAG_MMAP)
+MMAP_IO_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# 매니페스트 이전 형식에서 storage_dir에 바로 저장되던 스냅샷 파일 (prefix 뒤에 붙는 이름)
+LEGACY_SNAPSHOT_FILES = ('.index', '_store', '_vectors.npy', '_pending.npy', '_deleted.npy',
+                         '_keywords.npz', '_fuzzy.npz', '_bm25.npz', '_duplicates.npz',
+                         '_info.json', '.pkl')
+
+
+def _fsync_tree(directory: str):
+    """디렉토리 아래 모든 파일을 디스크에 기록 (매니페스트 교체 전에 호출)"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                os.fsync(f.fileno())
+
+
+class _SearchStats:
+    """검색 통계 카운터 (여러 스레드에서 동시에 갱신)
+
+    잠금은 카운터 갱신 동안만 잡으므로 검색이 DB 쓰기 작업을 기다리지 않는다.
+    """
+
+    def __init__(self, total_searches: int = 0, last_search: Optional[str] = None, **_):
+        self._lock = threading.Lock()
+        self._total_searches = total_searches
+        self._last_search = last_search
+
+    def record(self, count: int = 1):
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._total_searches += count
+            self._last_search = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'total_searches': self._total_searches,
+                'last_search': self._last_search
+            }
+
+
+class _ReadSnapshot:
+    """검색이 참조하는 읽기 상태
+
+    발행된 스냅샷은 수정되지 않고 통째로 교체된다. FAISS 인덱스, 대기 벡터,
+    삭제 표시는 쓰기 시 새 객체로 바뀌고, 문서/메타데이터/키워드 색인은 추가 전용으로
+    공유하되 검색은 size 이전의 삭제되지 않은 행만 본다.
+    """
+
+    FIELDS = ('ann_type', 'index', 'index_rows', 'pending', 'raw_vectors', 'deleted',
+              'documents', 'metadatas', 'keyword_index', 'fuzzy_index', 'bm25',
+              'duplicate_index', 'version')
+
+    def __init__(self,
+                 ann_type: str,
+                 index,
+                 index_rows: int,
+                 pending: Tuple[np.ndarray, ...],
+                 raw_vectors: Optional[VectorColumn],
+                 deleted: Optional[np.ndarray],
+                 documents: TextColumn,
+                 metadatas: MetadataTable,
+                 keyword_index: KeywordIndex,
+                 fuzzy_index: FuzzyIndex,
+                 bm25: BM25Ranker,
+                 duplicate_index: DuplicateIndex,
+                 version: int = 0):
+        self.ann_type = ann_type
+        self.index = index
+        self.index_rows = index_rows  # 인덱스에 추가된 행 수 (대기 벡터는 이 ID부터)
+        self.pending = pending
+        self.raw_vectors = raw_vectors
+        self.deleted = deleted  # 삭제 표시 마스크 (행 수보다 짧을 수 있음, 없으면 None)
+        self.documents = documents
+        self.metadatas = metadatas
+        self.keyword_index = keyword_index
+        self.fuzzy_index = fuzzy_index
+        self.bm25 = bm25
+        self.duplicate_index = duplicate_index
+        self.version = version  # 발행될 때마다 증가 (결과 캐시 무효화 기준)
+        self.num_vectors = index_rows + sum(len(e) for e in pending)
+        self.size = min(self.num_vectors, len(documents))  # 검색에 보이는 행 수
+        # 필터별 허용 문서 마스크 (필터 값은 사용자 입력이므로 개수 제한)
+        self.filter_cache = QueryCache(max_size=FILTER_CACHE_SIZE, ttl=float('inf'))
+        self._pending_matrix: Optional[np.ndarray] = None
+        self._all_docs: Optional[np.ndarray] = None
+
+    def pending_matrix(self) -> np.ndarray:
+        if self._pending_matrix is None:
+            self._pending_matrix = np.vstack(self.pending)
+        return self._pending_matrix
+
+    def all_docs(self) -> np.ndarray:
+        """보이는 행 중 삭제되지 않은 행의 허용 마스크"""
+        if self._all_docs is None:
+            mask = np.ones(self.size, dtype=bool)
+            if self.deleted is not None:
+                n = min(self.size, len(self.deleted))
+                mask[:n] &= ~self.deleted[:n]
+            self._all_docs = mask
+        return self._all_docs
+
+    def num_deleted(self) -> int:
+        """보이는 행 중 삭제 표시된 행 수"""
+        return self.size - int(np.count_nonzero(self.all_docs()))
+
+
 class VectorDatabase:
-    """FAISS 기반 벡터 데이터베이스"""
+    """FAISS 기반 벡터 데이터베이스
+    
+    ann_type으로 인덱스 구조를 선택한다.
+      - flat: 전수 탐색 (정확, 기본값)
+      - ivf_flat: IVF 클러스터링 + 원본 벡터
+      - hnsw: HNSW 그래프 (학습 불필요)
+      - ivf_pq: IVF + Product Quantization (메모리 절약)
+      - sq8: 차원별 8bit 스칼라 양자화 (float32 대비 1/4)
+      - sq_fp16: float16 저장 (float32 대비 1/2, 학습 불필요)
+    IVF 계열은 학습이 필요하므로 학습 전 추가된 벡터는 대기 버퍼에 모아두었다가
+    충분히 쌓이면(또는 train_index 호출 시) 학습 후 일괄 추가한다.
+    양자화 인덱스는 float32 원본 벡터를 별도 파일(mmap)에 두고, 상위 후보만
+    원본으로 다시 점수를 계산해 양자화 오차로 인한 순위 손실을 줄인다.
+    
+    검색은 잠금 없이 현재 _ReadSnapshot 하나만 참조하고, 추가/학습/로드는
+    쓰기 잠금 안에서 새 스냅샷을 만들어 원자적으로 교체한다. 추가된 벡터는
+    대기 벡터(전수 탐색)로 보이다가 merge_threshold개가 쌓이면 인덱스 복사본에
+    병합되므로, 검색 중인 FAISS 인덱스는 변경되지 않는다.
+    
+    mmap_index=True면 저장된 인덱스를 읽기 전용 mmap으로 열어 여러 워커 프로세스가
+    페이지 캐시를 공유한다. 매핑된 인덱스는 수정할 수 없으므로 병합/삭제 시에는
+    직렬화 복사본(힙 메모리)을 만들어 교체한다.
+    
+    벡터 ID는 행 번호(vector_id)와 같은 고정 ID이다(IndexIDMap 또는 IVF add_with_ids).
+    remove_by_source로 삭제된 행은 삭제 표시(tombstone)만 남겨 검색에서 제외하고,
+    저장(병합) 시 인덱스와 키워드 포스팅에서 실제로 제거한다.
+    """
     
     def __init__(self, 
                  dimension: int,
                  index_type: str = "cosine",
-                 storage_dir: str = "./vector_store"):
+                 storage_dir: str = "./vector_store",
+                 ann_type: str = "flat",
+                 index_params: Optional[Dict[str, Any]] = None,
+                 search_params: Optional[Dict[str, Any]] = None,
+                 mmap_index: bool = False,
+                 cache_size: int = 1024,
+                 cache_ttl: float = 300.0,
+                 embedding_model: Optional[str] = None):
+        
+        if ann_type not in DEFAULT_INDEX_PARAMS:
+            raise ValueError(f"지원하지 않는 인덱스 종류: {ann_type}")
         
         self.dimension = dimension
         self.index_type = index_type
         self.storage_dir = storage_dir
+        self.ann_type = ann_type
+        self.index_params = {**DEFAULT_INDEX_PARAMS[ann_type], **(index_params or {})}
+        self.search_params = {**DEFAULT_SEARCH_PARAMS, **(search_params or {})}
+        self.mmap_index = mmap_index
+        # 벡터를 만든 임베딩 모델 식별자 (KoreanEmbeddingEngine.model_fingerprint, 정보 파일에 저장)
+        self.embedding_model = embedding_model
         
         # 저장소 디렉토리 생성
         os.makedirs(storage_dir, exist_ok=True)
         
-        # FAISS 인덱스 초기화
-        self.index = self._create_index()
-        self.metadatas = []
-        self.documents = []  # 원본 텍스트 저장
+        # 검색용 읽기 스냅샷 (FAISS 인덱스, 대기 벡터, 문서, 키워드 색인)
+        self._snapshot = _ReadSnapshot(
+            ann_type=ann_type,
+            index=self._create_index(),
+            index_rows=0,
+            pending=(),  # 인덱스에 아직 병합되지 않은 벡터 (학습 전 포함)
+            raw_vectors=self._create_raw_vectors(),  # 재순위화용 float32 원본 (양자화 인덱스)
+            deleted=None,  # 삭제 표시 (tombstone)
+            documents=TextColumn(),  # 원본 텍스트 저장 (저장 후에는 mmap blob)
+            metadatas=MetadataTable(),  # 메타데이터 (저장 후에는 mmap 컬럼)
+            keyword_index=KeywordIndex(),  # 키워드 검색용 n-gram 역색인
+            fuzzy_index=FuzzyIndex(),  # 띄어쓰기/오타 허용 검색용 자모 n-gram 색인
+            bm25=BM25Ranker(),  # 키워드 검색 랭킹
+            duplicate_index=DuplicateIndex()  # 거의 같은 청크 묶음 (SimHash LSH)
+        )
+        self.merge_threshold = 4096  # 학습된 인덱스에 대기 벡터를 병합하는 기준 개수
         
         # 검색 통계
-        self.search_stats = {
-            'total_searches': 0,
-            'last_search': None
-        }
+        self._stats = _SearchStats()
+        
+        # 검색 결과 캐시 (스냅샷 버전이 바뀌면 비움, cache_size=0이면 사용 안 함)
+        self.query_cache = QueryCache(max_size=cache_size, ttl=cache_ttl)
+        
+        # 추가 전용 세그먼트 로그 (open_segment_log로 활성화)
+        self.segment_log: Optional[SegmentLog] = None
+        self.segment_prefix: Optional[str] = None
+        self.compaction_threshold = 8  # 병합하기 전 최소 세그먼트 수
+        # 병합 후 추가된 행이 스냅샷 행 수의 이 비율을 넘으면 백그라운드 병합
+        # (병합 간격이 DB 크기에 비례하므로 전체 재기록량은 문서 수에 선형)
+        self.compaction_ratio = 0.5
+        self._merged_seq = 0  # 스냅샷에 병합된 마지막 세그먼트 seq
+        self._merged_rows = 0  # 저장된 스냅샷의 행 수
+        self._replayed_seq = 0  # 마지막 load_database에서 재적용한 세그먼트 seq
+        self._purged_rows = 0  # 키워드 포스팅에서 제거된 삭제 행 수
+        self._mapped_index = None  # mmap으로 연 인덱스 (수정 불가)
+        self._load_timings: Dict[str, float] = {}  # 마지막 load_database 단계별 소요 시간 (초)
+        self._write_lock = threading.RLock()
+        self._save_lock = threading.Lock()  # 스냅샷 버전 기록은 한 번에 하나 (_write_lock보다 먼저 획득)
+        self._compaction_thread: Optional[threading.Thread] = None
     
-    def _create_index(self):
-        """FAISS 인덱스 생성"""
-        if self.index_type == "cosine":
-            # 코사인 유사도용 인덱스 (정규화된 벡터)
-            index = faiss.IndexFlatIP(self.dimension)
-        elif self.index_type == "l2":
-            # L2 거리용 인덱스
-            index = faiss.IndexFlatL2(self.dimension)
+    # 현재 스냅샷의 읽기 전용 뷰
+    @property
+    def index(self):
+        return self._snapshot.index
+    
+    @property
+    def documents(self) -> TextColumn:
+        return self._snapshot.documents
+    
+    @property
+    def metadatas(self) -> MetadataTable:
+        return self._snapshot.metadatas
+    
+    @property
+    def keyword_index(self) -> KeywordIndex:
+        return self._snapshot.keyword_index
+    
+    @property
+    def fuzzy_index(self) -> FuzzyIndex:
+        return self._snapshot.fuzzy_index
+    
+    @property
+    def bm25(self) -> BM25Ranker:
+        return self._snapshot.bm25
+    
+    @property
+    def raw_vectors(self) -> Optional[VectorColumn]:
+        return self._snapshot.raw_vectors
+    
+    @property
+    def search_stats(self) -> Dict[str, Any]:
+        return self._stats.to_dict()
+    
+    def _publish(self, **changes):
+        """현재 스냅샷에 변경 사항을 반영한 새 스냅샷으로 교체 (쓰기 잠금 안에서 호출)"""
+        snapshot = self._snapshot
+        fields = {name: getattr(snapshot, name) for name in _ReadSnapshot.FIELDS}
+        fields.update(changes)
+        fields['version'] = snapshot.version + 1
+        self._snapshot = _ReadSnapshot(**fields)
+    
+    def _metric(self) -> int:
+        """FAISS 거리 척도"""
+        if self.index_type == "l2":
+            return faiss.METRIC_L2
+        # 기본값: 내적 (코사인 유사도)
+        return faiss.METRIC_INNER_PRODUCT
+    
+    def _create_index(self, n_train: Optional[int] = None):
+        """FAISS 인덱스 생성
+        
+        Args:
+            n_train: 학습 벡터 수. 주어지면 IVF 클러스터 수를 학습 데이터에 맞게 줄인다.
+        """
+        params = self.index_params
+        
+        # IVF 계열 외에는 IDMap으로 감싸 행 번호를 고정 벡터 ID로 사용
+        if self.ann_type == "flat":
+            # L2 거리 또는 내적(정규화된 벡터의 코사인 유사도) 전수 탐색
+            index = faiss.index_factory(self.dimension, "IDMap,Flat", self._metric())
+        elif self.ann_type == "hnsw":
+            index = faiss.index_factory(self.dimension, f"IDMap,HNSW{params['M']}", self._metric())
+            self._base_index(index).hnsw.efConstruction = params['ef_construction']
+        elif self.ann_type == "sq8":
+            index = faiss.index_factory(self.dimension, "IDMap,SQ8", self._metric())
+        elif self.ann_type == "sq_fp16":
+            index = faiss.index_factory(self.dimension, "IDMap,SQfp16", self._metric())
         else:
-            # 기본값: 내적 (코사인 유사도)
-            index = faiss.IndexFlatIP(self.dimension)
+            nlist = params['nlist']
+            if n_train is not None:
+                nlist = max(1, min(nlist, n_train // MIN_POINTS_PER_CENTROID))
+            if self.ann_type == "ivf_pq":
+                if n_train is not None and n_train < 2 ** params['pq_nbits']:
+                    # PQ 코드북 학습 데이터 부족 → IVF-Flat으로 대체
+                    logger.warning(f"PQ 학습 벡터 부족({n_train}개), IVF-Flat으로 대체")
+                    description = f"IVF{nlist},Flat"
+                else:
+                    description = f"IVF{nlist},PQ{params['pq_m']}x{params['pq_nbits']}"
+            else:
+                description = f"IVF{nlist},Flat"
+            index = faiss.index_factory(self.dimension, description, self._metric())
         
-        logger.info(f"FAISS 인덱스 생성: {self.index_type}, 차원: {self.dimension}")
+        logger.info(f"FAISS 인덱스 생성: {self.index_type}/{self.ann_type}, 차원: {self.dimension}")
+        return index
+    
+    @staticmethod
+    def _base_index(index):
+        """IDMap 안쪽의 실제 인덱스 (IDMap이 아니면 그대로)"""
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexIDMap):
+            index = faiss.downcast_index(index.index)
         return index
     
+    @staticmethod
+    def _has_stable_ids(index) -> bool:
+        """벡터 ID를 직접 지정하는 인덱스인지 (IDMap 또는 IVF)"""
+        return (isinstance(faiss.downcast_index(index), faiss.IndexIDMap)
+                or faiss.try_extract_index_ivf(index) is not None)
+    
+    def _copy_index(self, index):
+        """수정용 인덱스 복사본 (mmap 인덱스는 clone_index가 매핑을 공유하므로 직렬화 복사)"""
+        if index is self._mapped_index:
+            return faiss.deserialize_index(faiss.serialize_index(index))
+        return faiss.clone_index(index)
+    
+    def _index_add(self, index, vectors: np.ndarray, start_id: int):
+        """행 번호를 벡터 ID로 인덱스에 추가"""
+        if self._has_stable_ids(index):
+            ids = np.arange(start_id, start_id + len(vectors), dtype='int64')
+            index.add_with_ids(vectors, ids)
+        else:
+            # 이전 형식 인덱스 (추가 순서 = ID, 삭제 벡터는 제거하지 않음)
+            index.add(vectors)
+    
+    def _create_raw_vectors(self) -> Optional[VectorColumn]:
+        """양자화 인덱스면 재순위화용 원본 벡터 컬럼 생성"""
+        if self.ann_type in QUANTIZED_TYPES:
+            return VectorColumn(self.dimension)
+        return None
+    
+    def _train_size(self) -> int:
+        """자동 학습을 시작할 대기 벡터 수"""
+        if self.ann_type == "sq8":
+            return self.index_params['train_size']
+        if self.ann_type == "ivf_pq":
+            return max(self.index_params['nlist'] * MIN_POINTS_PER_CENTROID,
+                       2 ** self.index_params['pq_nbits'])
+        return self.index_params.get('nlist', 1) * MIN_POINTS_PER_CENTROID
+    
+    @property
+    def ntotal(self) -> int:
+        """인덱스 + 대기 벡터 수"""
+        return self._snapshot.num_vectors
+    
+    def train_index(self) -> bool:
+        """대기 벡터로 인덱스를 학습하고 일괄 추가 (IVF 계열)"""
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.index.is_trained:
+                return True
+            if not snapshot.pending:
+                logger.warning("학습할 벡터가 없음")
+                return False
+            
+            training = snapshot.pending_matrix()
+            index = self._create_index(n_train=len(training))
+            logger.info(f"인덱스 학습 중: {len(training)}개 벡터")
+            index.train(training)
+            self._index_add(index, training, snapshot.index_rows)
+            self._apply_search_params(index)
+            self._publish(index=index, index_rows=snapshot.num_vectors, pending=())
+            return True
+    
+    def _merge_pending(self):
+        """대기 벡터를 인덱스 복사본에 추가한 뒤 교체 (검색 중인 인덱스는 그대로 둠)"""
+        with self._write_lock:
+            snapshot = self._snapshot
+            if not snapshot.pending or not snapshot.index.is_trained:
+                return
+            index = self._copy_index(snapshot.index)
+            self._index_add(index, snapshot.pending_matrix(), snapshot.index_rows)
+            self._apply_search_params(index)
+            self._publish(index=index, index_rows=snapshot.num_vectors, pending=())
+    
+    def _purge_deleted(self):
+        """삭제 표시된 행을 인덱스 복사본과 키워드 포스팅에서 제거한 뒤 교체
+        
+        HNSW는 그래프에서 벡터를 제거할 수 없으므로 삭제 표시로만 검색에서 제외한다.
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.deleted is None:
+                return
+            changes = {}
+            
+            deleted_ids = np.nonzero(snapshot.deleted[:snapshot.index_rows])[0].astype('int64')
+            index = snapshot.index
+            if (index.ntotal > snapshot.index_rows - len(deleted_ids)
+                    and self._has_stable_ids(index)
+                    and not isinstance(self._base_index(index), faiss.IndexHNSW)):
+                index = self._copy_index(index)
+                removed = index.remove_ids(deleted_ids)
+                self._apply_search_params(index)
+                changes['index'] = index
+                logger.info(f"인덱스에서 삭제된 벡터 {removed}개 제거")
+            
+            n_deleted = int(np.count_nonzero(snapshot.deleted))
+            if n_deleted > self._purged_rows:
+                changes['keyword_index'] = snapshot.keyword_index.remove_documents(snapshot.deleted)
+                changes['fuzzy_index'] = snapshot.fuzzy_index.remove_documents(snapshot.deleted)
+                changes['duplicate_index'] = snapshot.duplicate_index.remove_documents(snapshot.deleted)
+                self._purged_rows = n_deleted
+            
+            if changes:
+                self._publish(**changes)
+    
+    def set_search_params(self,
+                          nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None,
+                          rerank_factor: Optional[int] = None):
+        """질의 시점 파라미터 기본값 변경"""
+        if nprobe is not None:
+            self.search_params['nprobe'] = nprobe
+        if ef_search is not None:
+            self.search_params['ef_search'] = ef_search
+        if rerank_factor is not None:
+            self.search_params['rerank_factor'] = rerank_factor
+        self._apply_search_params(self.index)
+    
+    def _apply_search_params(self, index):
+        """인덱스 객체에 기본 질의 파라미터 반영"""
+        if self.ann_type in ("ivf_flat", "ivf_pq") and index.is_trained:
+            faiss.extract_index_ivf(index).nprobe = self.search_params['nprobe']
+        elif self.ann_type == "hnsw":
+            self._base_index(index).hnsw.efSearch = self.search_params['ef_search']
+    
+    def _search_parameters(self,
+                           snapshot: _ReadSnapshot,
+                           nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None,
+                           allowed: Optional[np.ndarray] = None):
+        """질의별 FAISS SearchParameters 생성
+        
+        allowed가 주어지면 IDSelectorBitmap을 붙여 허용된 벡터만 거리 계산한다.
+        """
+        if snapshot.ann_type in ("ivf_flat", "ivf_pq"):
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe or self.search_params['nprobe']
+        elif snapshot.ann_type == "hnsw":
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = ef_search or self.search_params['ef_search']
+        elif allowed is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+        
+        if allowed is not None:
+            # 인덱스 ID 범위에 맞춘 비트맵 (마스크 밖의 벡터는 제외)
+            bits = np.zeros(snapshot.index_rows, dtype=bool)
+            n = min(len(bits), len(allowed))
+            bits[:n] = allowed[:n]
+            bitmap = np.packbits(bits, bitorder='little')
+            params.sel = faiss.IDSelectorBitmap(bitmap.size, faiss.swig_ptr(bitmap))
+            # FAISS는 포인터만 보관하므로 검색이 끝날 때까지 비트맵을 유지
+            params._bitmap = bitmap
+        return params
+    
+    def _filter_mask(self,
+                     snapshot: _ReadSnapshot,
+                     filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """구조화 필터를 문서별 허용 마스크로 변환 (필터가 없으면 None)
+        
+        Args:
+            filters: {'category': 값 또는 값 리스트, 'file_name': 값 또는 값 리스트,
+                      'section': section에 포함될 문자열}
+        """
+        if not filters:
+            return None
+        
+        cache_key = json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str)
+        cached = snapshot.filter_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        size = snapshot.size
+        mask = snapshot.all_docs().copy()  # 삭제된 행 제외
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name in FILTER_FIELDS:
+                values = [value] if isinstance(value, str) else list(value)
+                mask &= snapshot.metadatas.mask(name, values)[:size]
+            elif name == 'section':
+                mask &= snapshot.bm25.section_mask(str(value), size)
+            else:
+                raise ValueError(f"지원하지 않는 필터 필드: {name}")
+        
+        snapshot.filter_cache.put(cache_key, mask)
+        return mask
+    
+    def _search_pending(self,
+                        snapshot: _ReadSnapshot,
+                        query_matrix: np.ndarray,
+                        k: int,
+                        allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """인덱스에 병합되지 않은 대기 벡터 전수 탐색 (FAISS search와 같은 형식 반환)"""
+        vectors = snapshot.pending_matrix()
+        offset = snapshot.index_rows  # 대기 벡터는 인덱스 다음 ID부터
+        ids = np.arange(len(vectors))
+        if allowed is not None:
+            # 허용된 벡터만 거리 계산
+            ids = np.nonzero(allowed[offset:offset + len(vectors)])[0]
+            vectors = vectors[ids]
+        k = min(k, len(vectors))
+        if k == 0:
+            empty = np.empty((len(query_matrix), 0))
+            return empty.astype('float32'), empty.astype('int64')
+        if self.index_type == "l2":
+            # ||q - x||^2 = ||q||^2 - 2 q·x + ||x||^2
+            scores = ((query_matrix ** 2).sum(axis=1, keepdims=True)
+                      - 2.0 * query_matrix @ vectors.T
+                      + (vectors ** 2).sum(axis=1)[None, :])
+            order = np.argsort(scores, axis=1)[:, :k]
+        else:
+            scores = query_matrix @ vectors.T
+            order = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, order, axis=1), ids[order] + offset
+    
+    def _vector_search(self,
+                       snapshot: _ReadSnapshot,
+                       query_matrix: np.ndarray,
+                       k: int,
+                       nprobe: Optional[int] = None,
+                       ef_search: Optional[int] = None,
+                       allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(nq, d) 질의 행렬을 한 번에 정규화하고 한 번의 FAISS 호출로 검색"""
+        query_matrix = np.ascontiguousarray(query_matrix, dtype='float32')
+        if query_matrix.ndim == 1:
+            query_matrix = query_matrix.reshape(1, -1)
+        
+        # 쿼리 임베딩 정규화 (행 단위 벡터 연산)
+        if self.index_type == "cosine":
+            norms = np.linalg.norm(query_matrix, axis=1, keepdims=True)
+            query_matrix = query_matrix / np.maximum(norms, 1e-12)
+        
+        if allowed is None and (snapshot.size < snapshot.num_vectors or snapshot.num_deleted()):
+            # 행이 아직 없는 벡터(세그먼트 재적용 중)와 삭제된 행 제외
+            allowed = snapshot.all_docs()
+        
+        parts = []
+        index = snapshot.index
+        if index.ntotal > 0:
+            rerank_factor = self._rerank_factor(snapshot)
+            fetch = k * rerank_factor if rerank_factor > 1 else k
+            similarities, indices = index.search(
+                query_matrix, min(fetch, index.ntotal),
+                params=self._search_parameters(snapshot, nprobe, ef_search, allowed)
+            )
+            if rerank_factor:
+                similarities, indices = self._rerank(snapshot, query_matrix, indices, k)
+            parts.append((similarities, indices))
+        if snapshot.pending:
+            parts.append(self._search_pending(snapshot, query_matrix, k, allowed))
+        if len(parts) == 1:
+            return parts[0]
+        
+        # 인덱스 결과와 대기 벡터 결과 병합
+        similarities = np.hstack([p[0] for p in parts])
+        indices = np.hstack([p[1] for p in parts])
+        if self.index_type == "l2":
+            order = np.argsort(similarities, axis=1, kind='stable')[:, :k]
+        else:
+            order = np.argsort(-similarities, axis=1, kind='stable')[:, :k]
+        return (np.take_along_axis(similarities, order, axis=1),
+                np.take_along_axis(indices, order, axis=1))
+    
+    def _rerank_factor(self, snapshot: _ReadSnapshot) -> int:
+        """재순위화 후보 배수 (원본 벡터가 없거나 꺼져 있으면 0)"""
+        raw_vectors = snapshot.raw_vectors
+        if raw_vectors is None or len(raw_vectors) < snapshot.index_rows:
+            return 0
+        return max(int(self.search_params.get('rerank_factor', 0)), 0)
+    
+    def _rerank(self,
+                snapshot: _ReadSnapshot,
+                query_matrix: np.ndarray,
+                indices: np.ndarray,
+                k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """양자화 인덱스 후보를 float32 원본 벡터로 다시 점수 계산하여 상위 k개 선택"""
+        valid = indices >= 0
+        vectors = snapshot.raw_vectors.take(np.where(valid, indices, 0))
+        if self.index_type == "l2":
+            scores = ((vectors - query_matrix[:, None, :]) ** 2).sum(axis=2)
+            scores[~valid] = np.inf
+            order = np.argsort(scores, axis=1, kind='stable')[:, :k]
+        else:
+            scores = np.einsum('qkd,qd->qk', vectors, query_matrix)
+            scores[~valid] = -np.inf
+            order = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        return (np.take_along_axis(scores, order, axis=1).astype('float32'),
+                np.take_along_axis(indices, order, axis=1))
+    
+    def _cache_key(self, snapshot: _ReadSnapshot, mode: str, query: Any, **params) -> Optional[str]:
+        """스냅샷 버전에 맞춘 결과 캐시 키 (캐시를 쓰지 않으면 None)"""
+        if not self.query_cache.enabled:
+            return None
+        self.query_cache.sync(snapshot.version)
+        return make_key(mode, query, version=snapshot.version,
+                        search_params=self.search_params, **params)
+    
+    def _record_searches(self, count: int = 1):
+        """검색 통계 업데이트"""
+        self._stats.record(count)
+    
     def add_documents(self, 
                      embeddings: np.ndarray, 
                      metadatas: List[Dict], 
                      documents: List[str]):
-        """문서와 임베딩을 데이터베이스에 추가"""
+        """문서와 임베딩을 데이터베이스에 추가
+        
+        세그먼트 로그가 열려 있으면 배치를 세그먼트로 기록한 뒤 반환한다.
+        """
         try:
             if embeddings.shape[0] != len(metadatas) or embeddings.shape[0] != len(documents):
                 raise ValueError("임베딩, 메타데이터, 문서 수가 일치하지 않음")
@@ -67,18 +670,27 @@ class VectorDatabase:
             # 임베딩 정규화 (코사인 유사도용)
             if self.index_type == "cosine":
                 embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = np.ascontiguousarray(embeddings, dtype='float32')
             
-            # FAISS 인덱스에 추가
-            self.index.add(embeddings.astype('float32'))
-            
-            # 메타데이터와 문서 저장
-            start_id = len(self.metadatas)
-            for i, (metadata, document) in enumerate(zip(metadatas, documents)):
-                metadata['vector_id'] = start_id + i
-                metadata['added_at'] = datetime.now().isoformat()
-            
-            self.metadatas.extend(metadatas)
-            self.documents.extend(documents)
+            with self._write_lock:
+                # 메타데이터에 벡터 ID 부여
+                start_id = len(self.metadatas)
+                for i, (metadata, document) in enumerate(zip(metadatas, documents)):
+                    metadata['vector_id'] = start_id + i
+                    metadata['added_at'] = datetime.now().isoformat()
+                    if 'simhash' not in metadata:
+                        # 청킹 단계에서 계산되지 않은 서명 (중복 청크 판별용)
+                        metadata['simhash'] = simhash(document)
+                
+                # 행을 먼저 기록해야 벡터가 발행될 때 함께 보인다
+                self._add_rows(metadatas, documents)
+                self._add_vectors(embeddings)
+                
+                # 세그먼트 기록 (커밋 후에는 중단되어도 유실되지 않음)
+                if self.segment_log is not None:
+                    seq = self.segment_log.append(embeddings, metadatas, documents, start_id)
+                    if self._should_compact(seq):
+                        self.compact_async()
             
             logger.info(f"벡터 DB에 {len(documents)}개 문서 추가 완료 (총 {len(self.documents)}개)")
             
@@ -86,39 +698,389 @@ class VectorDatabase:
             logger.error(f"문서 추가 실패: {e}")
             raise
     
+    def _add_vectors(self, embeddings: np.ndarray):
+        """대기 벡터로 추가 후 발행 (학습 전이면 충분히 쌓였을 때 학습,
+        학습된 인덱스는 merge_threshold개가 쌓이면 병합)"""
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.raw_vectors is not None:
+                snapshot.raw_vectors.extend(embeddings)
+            pending = snapshot.pending + (embeddings,)
+            self._publish(pending=pending)
+            
+            if not snapshot.index.is_trained:
+                if self.ntotal >= self._train_size():
+                    self.train_index()
+            elif sum(len(e) for e in pending) >= self.merge_threshold:
+                self._merge_pending()
+    
+    def _add_rows(self, metadatas: List[Dict], documents: List[str]):
+        """메타데이터, 문서, 키워드 색인 추가 후 발행
+        
+        추가 전용 구조에 먼저 기록하고, 새 스냅샷의 size가 늘어날 때 검색에 보인다.
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            start_id = len(snapshot.documents)
+            snapshot.metadatas.extend(metadatas)
+            snapshot.documents.extend(documents)
+            snapshot.keyword_index.add_documents(documents, start_id)
+            snapshot.fuzzy_index.add_documents(documents, start_id)
+            snapshot.bm25.add_documents(documents, metadatas)
+            snapshot.duplicate_index.add(
+                metadata['simhash'] if 'simhash' in metadata else simhash(document)
+                for metadata, document in zip(metadatas, documents)
+            )
+            self._publish()
+    
+    def _delete_rows(self, doc_ids: np.ndarray):
+        """행에 삭제 표시 후 발행 (삭제 마스크는 새 배열로 교체)"""
+        with self._write_lock:
+            snapshot = self._snapshot
+            deleted = np.zeros(len(snapshot.documents), dtype=bool)
+            if snapshot.deleted is not None:
+                deleted[:len(snapshot.deleted)] = snapshot.deleted
+            deleted[doc_ids] = True
+            self._publish(deleted=deleted)
+    
+    def remove_by_source(self, file_path: str) -> int:
+        """원본 파일(metadata['source'])에서 나온 문서를 삭제, 삭제한 문서 수 반환
+        
+        삭제 표시만 남기므로 비용은 해당 파일의 청크 수에 비례한다.
+        세그먼트 로그가 열려 있으면 삭제도 세그먼트로 기록된다.
+        """
+        source = file_path.replace('\\', '/')
+        try:
+            with self._write_lock:
+                doc_ids = self._source_rows(source)
+                if doc_ids.size == 0:
+                    logger.info(f"삭제할 문서 없음: {source}")
+                    return 0
+                self._remove_rows(doc_ids)
+            
+            logger.info(f"문서 삭제 완료: {source} ({doc_ids.size}개)")
+            return int(doc_ids.size)
+            
+        except Exception as e:
+            logger.error(f"문서 삭제 실패: {e}")
+            raise
+    
+    def _source_rows(self, source: str) -> np.ndarray:
+        """원본 파일에서 나온 삭제되지 않은 행 번호"""
+        snapshot = self._snapshot
+        rows = snapshot.metadatas.mask('source', [source])[:snapshot.size]
+        return np.nonzero(rows & snapshot.all_docs())[0]
+    
+    def _remove_rows(self, doc_ids: np.ndarray):
+        """행 삭제 표시 후 세그먼트 로그에 삭제 기록"""
+        with self._write_lock:
+            self._delete_rows(doc_ids)
+            if self.segment_log is not None:
+                seq = self.segment_log.append_delete(doc_ids)
+                if self._should_compact(seq):
+                    self.compact_async()
+    
+    def live_sources(self) -> set:
+        """삭제되지 않은 문서의 원본 파일(metadata['source']) 집합"""
+        snapshot = self._snapshot
+        return snapshot.metadatas.distinct('source', snapshot.all_docs())
+    
+    def last_live_source(self) -> Optional[str]:
+        """삭제되지 않은 마지막 행의 원본 파일 (없으면 None)"""
+        snapshot = self._snapshot
+        live = np.nonzero(snapshot.all_docs())[0]
+        if live.size == 0:
+            return None
+        return snapshot.metadatas[int(live[-1])].get('source')
+    
+    def upsert_file(self,
+                    file_path: str,
+                    embeddings: np.ndarray,
+                    metadatas: List[Dict],
+                    documents: List[str]) -> int:
+        """원본 파일의 기존 문서를 삭제하고 새 청크로 교체, 삭제한 문서 수 반환
+        
+        새 청크를 먼저 기록한 뒤 기존 행을 삭제하므로, 중간에 중단되어도 파일의
+        문서가 사라지지 않는다 (최악의 경우 다음 교체 때까지 이전 청크가 함께 남음).
+        """
+        source = file_path.replace('\\', '/')
+        try:
+            with self._write_lock:
+                for metadata in metadatas:
+                    metadata['source'] = source
+                old_ids = self._source_rows(source)
+                self.add_documents(embeddings, metadatas, documents)
+                if old_ids.size:
+                    self._remove_rows(old_ids)
+        except Exception as e:
+            logger.error(f"파일 교체 실패: {e}")
+            raise
+        removed = int(old_ids.size)
+        logger.info(f"파일 교체 완료: {source} (삭제 {removed}개, 추가 {len(documents)}개)")
+        return removed
+    
+    def open_segment_log(self, filename_prefix: str = "vector_db", reset: bool = False):
+        """add_documents 배치를 세그먼트로 기록하기 시작
+        
+        Args:
+            reset: True면 기존 세그먼트를 지우고 빈 스냅샷을 저장 (전체 재구축용)
+        """
+        with self._write_lock:
+            log_dir = os.path.join(self.storage_dir, f"{filename_prefix}_segments")
+            self.segment_log = SegmentLog(log_dir)
+            self.segment_prefix = filename_prefix
+            if reset:
+                self.segment_log.reset()
+                self._merged_seq = 0
+            else:
+                # 스냅샷보다 작은 seq가 다시 쓰이지 않도록 보정
+                self.segment_log.last_seq = max(self.segment_log.last_seq, self._merged_seq)
+            logger.info(f"세그먼트 로그 시작: {log_dir}")
+        if reset:
+            self.save_database(filename_prefix)
+    
+    def _should_compact(self, seq: int) -> bool:
+        """병합 시점 여부 (쓰기 잠금 안에서 호출)
+        
+        세그먼트가 compaction_threshold개 이상이고 병합 후 추가된 행이 스냅샷 행 수의
+        compaction_ratio 이상일 때 병합한다. 병합할 때마다 스냅샷 전체를 다시 쓰므로,
+        간격을 DB 크기에 비례시켜 각 행이 다시 기록되는 횟수를 상수로 유지한다.
+        """
+        if seq - self._merged_seq < self.compaction_threshold:
+            return False
+        unmerged = len(self.documents) - self._merged_rows
+        return unmerged >= self.compaction_ratio * max(self._merged_rows, self.merge_threshold)
+    
+    def compact(self) -> bool:
+        """커밋된 세그먼트를 저장된 스냅샷에 병합하여 새 버전으로 저장 후 병합된 세그먼트 삭제
+        
+        검색과 추가 중인 메모리 상태는 건드리지 않고, 별도 인스턴스에 저장된 스냅샷을
+        mmap으로 연 뒤 세그먼트를 재적용해 새 버전 디렉토리에 기록한다.
+        쓰기 잠금은 마지막 세그먼트 정리 때만 잡으므로 병합 중에도 add_documents가 진행된다.
+        """
+        if self.segment_prefix is None:
+            logger.warning("세그먼트 로그가 열려있지 않음")
+            return False
+        prefix = self.segment_prefix
+        try:
+            with self._save_lock:
+                base = VectorDatabase(
+                    dimension=self.dimension,
+                    index_type=self.index_type,
+                    storage_dir=self.storage_dir,
+                    ann_type=self.ann_type,
+                    index_params=self.index_params,
+                    search_params=self.search_params,
+                    mmap_index=True,
+                    cache_size=0,
+                    embedding_model=self.embedding_model
+                )
+                base.merge_threshold = self.merge_threshold
+                if not base.load_database(prefix):
+                    logger.error("병합 실패: 저장된 스냅샷을 열 수 없음")
+                    return False
+                merged_seq = base._replayed_seq
+                if merged_seq <= self._merged_seq:
+                    return True
+                base._stats = self._stats
+                base._write_snapshot(prefix, merged_seq)
+                
+                with self._write_lock:
+                    self._merged_seq = merged_seq
+                    self._merged_rows = len(base.documents)
+                    self.segment_log.truncate(merged_seq)
+            
+            logger.info(f"세그먼트 병합 완료: seq {merged_seq}까지 ({len(base.documents)}개 문서)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"세그먼트 병합 실패: {e}")
+            return False
+    
+    def compact_async(self):
+        """백그라운드 스레드에서 병합 (이미 진행 중이면 무시)"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(
+            target=self.compact, name="vector-db-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+    
+    def wait_for_compaction(self):
+        """진행 중인 백그라운드 병합 완료 대기"""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+    
+    def _replay_segments(self, filename_prefix: str, after_seq: int) -> int:
+        """스냅샷 이후 커밋된 세그먼트 재적용, 마지막으로 적용한 세그먼트 seq 반환
+        
+        세그먼트의 start_id로 이미 스냅샷에 포함된 행은 건너뛰고,
+        삭제 세그먼트는 삭제 표시로 다시 적용한다.
+        """
+        log_dir = os.path.join(self.storage_dir, f"{filename_prefix}_segments")
+        if not os.path.exists(log_dir):
+            return after_seq
+        
+        # 병합 중에는 다른 인스턴스가 같은 로그에 기록하므로 읽기만 한다
+        log = SegmentLog(log_dir, repair=False)
+        applied = 0
+        last_seq = after_seq
+        for entry in log.segments(after_seq=after_seq):
+            if entry['op'] == 'delete':
+                doc_ids = log.read_deleted(entry)
+                self._delete_rows(doc_ids[doc_ids < len(self.documents)])
+                applied += 1
+                last_seq = entry['seq']
+                continue
+            
+            start_id = entry['start_id']
+            if start_id > len(self.documents) or start_id > self.ntotal:
+                logger.error(f"세그먼트 {entry['seq']} 이전 데이터 누락, 재적용 중단")
+                break
+            embeddings, metadatas, documents = log.read_segment(entry)
+            
+            skip = self.ntotal - start_id
+            if skip < len(embeddings):
+                self._add_vectors(np.ascontiguousarray(embeddings[skip:]))
+            skip = len(self.documents) - start_id
+            if skip < len(documents):
+                self._add_rows(metadatas[skip:], documents[skip:])
+            applied += 1
+            last_seq = entry['seq']
+        
+        if applied:
+            logger.info(f"세그먼트 {applied}개 재적용 (총 {len(self.documents)}개 문서)")
+        return last_seq
+    
+    def _vector_hits(self,
+                     snapshot: _ReadSnapshot,
+                     query_matrix: np.ndarray,
+                     k: int,
+                     min_similarity: float = 0.0,
+                     nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[float, int]]]:
+        """스냅샷에 대한 벡터 검색, 질의별 [(유사도, 문서 ID), ...] 반환"""
+        query_matrix = np.asarray(query_matrix, dtype='float32')
+        if query_matrix.ndim == 1:
+            query_matrix = query_matrix.reshape(1, -1)
+        n_queries = len(query_matrix)
+        
+        allowed = self._filter_mask(snapshot, filters)
+        if snapshot.num_vectors == 0 or (allowed is not None and not allowed.any()):
+            return [[] for _ in range(n_queries)]
+        
+        similarities, indices = self._vector_search(
+            snapshot, query_matrix, k, nprobe, ef_search, allowed
+        )
+        
+        # IVF/HNSW는 결과가 부족하면 -1을 반환, 스냅샷 이후 추가된 행은 제외
+        size = snapshot.size
+        return [
+            [(sim, idx) for sim, idx in zip(row_sims, row_ids)
+             if sim >= min_similarity and 0 <= idx < size]
+            for row_sims, row_ids in zip(similarities.tolist(), indices.tolist())
+        ]
+    
+    def _keyword_results(self,
+                         snapshot: _ReadSnapshot,
+                         keywords: List[str],
+                         match_all: bool,
+                         k: int,
+                         filters: Optional[Dict[str, Any]] = None,
+                         within: Optional[int] = None,
+                         fuzzy: bool = False,
+                         collection_stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """스냅샷에 대한 BM25F 키워드 검색 결과"""
+        allowed = self._filter_mask(snapshot, filters)
+        if allowed is None:
+            allowed = snapshot.all_docs()
+        if not allowed.any():
+            return []
+        
+        # 근접 검색: 모든 키워드가 within 문자 이내에 나타나는 문서로 제한 (위치 목록 병합)
+        candidates = None
+        if within is not None and keywords:
+            candidates = snapshot.keyword_index.proximity_match(
+                keywords, within, snapshot.documents, allowed
+            )
+            if candidates.size == 0:
+                return []
+            match_all = True
+        
+        # 역색인 포스팅에 대해 BM25F 점수 계산 후 상위 k개만 선택
+        # (fuzzy면 띄어쓰기를 무시하고 자모 1개 오타까지 허용하는 자모 색인으로 매칭)
+        index = snapshot.fuzzy_index if fuzzy else snapshot.keyword_index
+        ranked = snapshot.bm25.rank(
+            index, keywords, snapshot.documents,
+            k=k, match_all=match_all, allowed=allowed, candidates=candidates,
+            collection=collection_stats
+        )
+        
+        results = []
+        top_score = ranked[0][1] if ranked else 0.0
+        for i, bm25_score, keyword_matches in ranked:
+            result = {
+                'match_score': bm25_score / top_score if top_score > 0 else 0.0,
+                'bm25_score': bm25_score,
+                'matched_keywords': keyword_matches,
+                'document': snapshot.documents[i],
+                'metadata': snapshot.metadatas[i].copy(),
+                'vector_id': i
+            }
+            results.append(result)
+        return results
+    
     def search(self, 
                query_embedding: np.ndarray, 
                k: int = 5,
-               min_similarity: float = 0.0) -> List[Dict[str, Any]]:
-        """벡터 유사도 검색"""
+               min_similarity: float = 0.0,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """벡터 유사도 검색
+        
+        nprobe/ef_search를 지정하면 이번 질의에 한해 기본 질의 파라미터 대신 사용한다.
+        filters(category, file_name, section)는 검색 중에 적용되어 조건에 맞는 문서만
+        후보가 되므로, 일치하는 문서가 있으면 k개를 채워 반환한다.
+        """
         try:
-            if self.index.ntotal == 0:
+            snapshot = self._snapshot
+            if snapshot.num_vectors == 0:
                 logger.warning("인덱스가 비어있음")
                 return []
             
-            # 쿼리 임베딩 정규화
-            if self.index_type == "cosine":
-                query_embedding = query_embedding / np.linalg.norm(query_embedding)
+            # 같은 질의 벡터/파라미터의 결과가 캐시되어 있으면 재사용
+            cache_key = self._cache_key(
+                snapshot, 'vector', vector_digest(query_embedding), k=k,
+                min_similarity=min_similarity, nprobe=nprobe, ef_search=ef_search, filters=filters
+            )
+            if cache_key is not None:
+                cached = self.query_cache.get(cache_key)
+                if cached is not None:
+                    self._record_searches()
+                    return copy_results(cached)
             
             # FAISS 검색
-            query_vector = query_embedding.reshape(1, -1).astype('float32')
-            similarities, indices = self.index.search(query_vector, min(k, self.index.ntotal))
+            hits = self._vector_hits(
+                snapshot, query_embedding, k, min_similarity, nprobe, ef_search, filters
+            )[0]
             
             # 결과 구성
             results = []
-            for sim, idx in zip(similarities[0], indices[0]):
-                if sim >= min_similarity and idx < len(self.metadatas):
-                    result = {
-                        'similarity': float(sim),
-                        'document': self.documents[idx],
-                        'metadata': self.metadatas[idx].copy(),
-                        'vector_id': idx
-                    }
-                    results.append(result)
+            for sim, idx in hits:
+                result = {
+                    'similarity': sim,
+                    'document': snapshot.documents[idx],
+                    'metadata': snapshot.metadatas[idx].copy(),
+                    'vector_id': idx
+                }
+                results.append(result)
             
             # 검색 통계 업데이트
-            self.search_stats['total_searches'] += 1
-            self.search_stats['last_search'] = datetime.now().isoformat()
+            self._record_searches()
+            if cache_key is not None:
+                self.query_cache.put(cache_key, copy_results(results))
             
             logger.info(f"벡터 검색 완료: {len(results)}개 결과 (임계값: {min_similarity})")
             return results
@@ -127,48 +1089,100 @@ class VectorDatabase:
             logger.error(f"벡터 검색 실패: {e}")
             return []
     
+    def search_batch(self,
+                     query_matrix: np.ndarray,
+                     k: int = 5,
+                     min_similarity: float = 0.0,
+                     nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None,
+                     filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """여러 질의를 한 번의 FAISS 호출로 검색
+        
+        Args:
+            query_matrix: (질의 수, 차원) 임베딩 행렬
+            filters: 모든 질의에 공통으로 적용할 메타데이터 필터
+        
+        Returns:
+            질의별 결과 리스트. 결과의 metadata는 복사본이 아닌 공유 객체이므로
+            호출자가 수정해서는 안 된다.
+        """
+        try:
+            snapshot = self._snapshot
+            n_queries = len(query_matrix)
+            if snapshot.num_vectors == 0 or n_queries == 0:
+                logger.warning("인덱스 또는 질의가 비어있음")
+                return [[] for _ in range(n_queries)]
+            
+            hits = self._vector_hits(
+                snapshot, query_matrix, k, min_similarity, nprobe, ef_search, filters
+            )
+            
+            batch_results = []
+            for row in hits:
+                batch_results.append([
+                    {
+                        'similarity': sim,
+                        'document': snapshot.documents[idx],
+                        'metadata': snapshot.metadatas[idx],
+                        'vector_id': idx
+                    }
+                    for sim, idx in row
+                ])
+            
+            self._record_searches(n_queries)
+            
+            logger.info(f"배치 벡터 검색 완료: {n_queries}개 질의")
+            return batch_results
+            
+        except Exception as e:
+            logger.error(f"배치 벡터 검색 실패: {e}")
+            return [[] for _ in range(len(query_matrix))]
+    
     def keyword_search(self, 
                       keywords: List[str], 
                       match_all: bool = False,
-                      k: int = 10) -> List[Dict[str, Any]]:
-        """키워드 기반 검색 (벡터 검색 보완용)"""
+                      k: int = 10,
+                      filters: Optional[Dict[str, Any]] = None,
+                      within: Optional[int] = None,
+                      fuzzy: bool = False,
+                      collapse_duplicates: bool = False,
+                      collection_stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """키워드 기반 검색 (벡터 검색 보완용, BM25F 랭킹)
+
+        match_score는 상위 결과 대비 정규화된 BM25 점수(0~1)이며,
+        원 점수는 bm25_score에 담긴다. filters는 포스팅 단계에서 적용되어
+        부분 문자열 검증과 점수 계산은 필터를 통과한 문서에 대해서만 수행된다.
+        공백을 포함한 키워드는 정확한 구문으로 매칭되며(위치 색인 병합),
+        within을 주면 모든 키워드의 시작 위치가 within 문자 이내인 문서만 반환한다.
+        fuzzy=True면 "설계 속도"/"설계속도"처럼 띄어쓰기가 다르거나 자모 1개가 틀린
+        표기도 매칭한다(오타 매칭은 tf를 낮게 반영). 근접 조건은 정확한 위치로 판단한다.
+        collapse_duplicates=True면 거의 같은 청크는 가장 높은 결과 하나만 남긴다.
+        collection_stats(keyword_collection_stats 결과의 합)를 주면 IDF와 평균 길이를
+        그 통계로 계산한다 (샤드 사이에서 bm25_score를 비교할 수 있도록).
+        """
         try:
-            results = []
+            snapshot = self._snapshot
+            cache_key = self._cache_key(
+                snapshot, 'keyword', list(keywords),
+                match_all=match_all, k=k, filters=filters, within=within, fuzzy=fuzzy,
+                collapse_duplicates=collapse_duplicates, collection_stats=collection_stats
+            )
+            if cache_key is not None:
+                cached = self.query_cache.get(cache_key)
+                if cached is not None:
+                    return copy_results(cached)
             
-            for i, (document, metadata) in enumerate(zip(self.documents, self.metadatas)):
-                doc_lower = document.lower()
-                keyword_matches = []
-                
-                for keyword in keywords:
-                    keyword_lower = keyword.lower()
-                    if keyword_lower in doc_lower:
-                        keyword_matches.append(keyword)
-                
-                # 매칭 조건 확인
-                if match_all and len(keyword_matches) == len(keywords):
-                    # 모든 키워드 매칭
-                    match_score = 1.0
-                elif not match_all and keyword_matches:
-                    # 일부 키워드 매칭
-                    match_score = len(keyword_matches) / len(keywords)
-                else:
-                    continue
-                
-                result = {
-                    'match_score': match_score,
-                    'matched_keywords': keyword_matches,
-                    'document': document,
-                    'metadata': metadata.copy(),
-                    'vector_id': i
-                }
-                results.append(result)
-            
-            # 매칭 점수로 정렬 (점수가 같을 때는 카테고리별 균등 분배를 위해 랜덤 요소 추가)
-            import random
-            results.sort(key=lambda x: (x['match_score'], random.random()), reverse=True)
-            
-            # 상위 k개 결과만 반환
-            results = results[:k]
+            if collapse_duplicates:
+                results = self._fetch_collapsed(
+                    snapshot, k,
+                    lambda n: self._keyword_results(snapshot, keywords, match_all, n,
+                                                    filters, within, fuzzy, collection_stats)
+                )
+            else:
+                results = self._keyword_results(snapshot, keywords, match_all, k,
+                                                filters, within, fuzzy, collection_stats)
+            if cache_key is not None:
+                self.query_cache.put(cache_key, copy_results(results))
             
             logger.info(f"키워드 검색 완료: {len(results)}개 결과")
             return results
@@ -177,62 +1191,83 @@ class VectorDatabase:
             logger.error(f"키워드 검색 실패: {e}")
             return []
     
+    def keyword_collection_stats(self,
+                                 keywords: List[str],
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 fuzzy: bool = False) -> Dict[str, Any]:
+        """keyword_search의 BM25 점수에 쓰이는 컬렉션 통계 (BM25Ranker.collection_stats)"""
+        snapshot = self._snapshot
+        allowed = self._filter_mask(snapshot, filters)
+        if allowed is None:
+            allowed = snapshot.all_docs()
+        index = snapshot.fuzzy_index if fuzzy else snapshot.keyword_index
+        return snapshot.bm25.collection_stats(index, keywords, snapshot.documents, allowed)
+    
+    def locate_keywords(self,
+                        text: str,
+                        keywords: List[str],
+                        fuzzy: bool = True) -> List[Tuple[int, int]]:
+        """텍스트에서 키워드가 나타나는 [시작, 끝) 문자 구간 (띄어쓰기 무시, fuzzy면 오타 허용)
+        
+        검색 결과 문서의 하이라이트/발췌 위치 계산용이다.
+        """
+        try:
+            return self._snapshot.fuzzy_index.locate(text, keywords, fuzzy)
+        except Exception as e:
+            logger.error(f"키워드 위치 계산 실패: {e}")
+            return []
+    
     def hybrid_search(self,
                      query_embedding: np.ndarray,
                      keywords: List[str],
                      k: int = 10,
-                     vector_weight: float = 0.7) -> List[Dict[str, Any]]:
-        """하이브리드 검색 (벡터 + 키워드)"""
+                     vector_weight: float = 0.7,
+                     filters: Optional[Dict[str, Any]] = None,
+                     collapse_duplicates: bool = False) -> List[Dict[str, Any]]:
+        """하이브리드 검색 (벡터 + 키워드, filters는 양쪽 검색 중에 적용)
+        
+        두 검색은 같은 스냅샷을 사용하므로 도중에 재로드되어도 결과가 섞이지 않는다.
+        collapse_duplicates=True면 추가 시 기록된 중복 그룹(SimHash LSH)으로
+        거의 같은 청크를 접고, 접힌 수를 대표 결과의 'duplicates'에 담는다.
+        """
         try:
-            # 벡터 검색
-            vector_results = self.search(query_embedding, k=k*2)  # 더 많이 가져와서 필터링
-            
-            # 키워드 검색
-            keyword_results = self.keyword_search(keywords, match_all=False)
-            
-            # 결과 통합 및 점수 조합
-            combined_results = {}
-            
-            # 벡터 검색 결과 처리
-            for result in vector_results:
-                vector_id = result['vector_id']
-                combined_results[vector_id] = {
-                    'vector_score': result['similarity'] * vector_weight,
-                    'keyword_score': 0.0,
-                    'document': result['document'],
-                    'metadata': result['metadata'],
-                    'vector_id': vector_id,
-                    'matched_keywords': []
-                }
+            snapshot = self._snapshot
+            cache_key = self._cache_key(
+                snapshot, 'hybrid', [vector_digest(query_embedding), list(keywords)],
+                k=k, vector_weight=vector_weight, filters=filters,
+                collapse_duplicates=collapse_duplicates
+            )
+            if cache_key is not None:
+                cached = self.query_cache.get(cache_key)
+                if cached is not None:
+                    self._record_searches()
+                    return copy_results(cached)
             
-            # 키워드 검색 결과 처리
-            for result in keyword_results:
-                vector_id = result['vector_id']
-                keyword_score = result['match_score'] * (1 - vector_weight)
-                
-                if vector_id in combined_results:
-                    combined_results[vector_id]['keyword_score'] = keyword_score
-                    combined_results[vector_id]['matched_keywords'] = result['matched_keywords']
-                else:
-                    combined_results[vector_id] = {
-                        'vector_score': 0.0,
-                        'keyword_score': keyword_score,
-                        'document': result['document'],
-                        'metadata': result['metadata'],
-                        'vector_id': vector_id,
-                        'matched_keywords': result['matched_keywords']
+            def candidates(n: int, top: int) -> List[Dict[str, Any]]:
+                # 벡터 검색 (더 많이 가져와서 조합)
+                vector_results = [
+                    {
+                        'similarity': sim,
+                        'document': snapshot.documents[idx],
+                        'metadata': snapshot.metadatas[idx].copy(),
+                        'vector_id': idx
                     }
+                    for sim, idx in self._vector_hits(
+                        snapshot, query_embedding, n, filters=filters
+                    )[0]
+                ]
+                
+                # 키워드 검색
+                keyword_results = self._keyword_results(snapshot, keywords, False, n, filters)
+                return self._combine_results(vector_results, keyword_results, top, vector_weight)
             
-            # 최종 점수 계산 및 정렬
-            final_results = []
-            for result in combined_results.values():
-                result['final_score'] = result['vector_score'] + result['keyword_score']
-                final_results.append(result)
-            
-            final_results.sort(key=lambda x: x['final_score'], reverse=True)
-            
-            # 상위 k개 결과만 반환
-            final_results = final_results[:k]
+            if collapse_duplicates:
+                final_results = self._fetch_collapsed(snapshot, k, lambda n: candidates(n, 2 * n))
+            else:
+                final_results = candidates(k*2, k)
+            self._record_searches()
+            if cache_key is not None:
+                self.query_cache.put(cache_key, copy_results(final_results))
             
             logger.info(f"하이브리드 검색 완료: {len(final_results)}개 결과")
             return final_results
@@ -241,34 +1276,143 @@ class VectorDatabase:
             logger.error(f"하이브리드 검색 실패: {e}")
             return []
     
+    def hybrid_search_batch(self,
+                            query_matrix: np.ndarray,
+                            keywords_list: List[List[str]],
+                            k: int = 10,
+                            vector_weight: float = 0.7,
+                            filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """여러 질의의 하이브리드 검색 (벡터 검색은 한 번의 FAISS 호출)
+        
+        Args:
+            query_matrix: (질의 수, 차원) 임베딩 행렬
+            keywords_list: 질의별 키워드 리스트
+            filters: 모든 질의에 공통으로 적용할 메타데이터 필터
+        """
+        try:
+            if len(query_matrix) != len(keywords_list):
+                raise ValueError("질의 임베딩 수와 키워드 리스트 수가 일치하지 않음")
+            
+            snapshot = self._snapshot
+            vector_hits = self._vector_hits(snapshot, query_matrix, k*2, filters=filters)
+            self._record_searches(len(keywords_list))
+            
+            batch_results = []
+            for hits, keywords in zip(vector_hits, keywords_list):
+                vector_results = [
+                    {
+                        'similarity': sim,
+                        'document': snapshot.documents[idx],
+                        'metadata': snapshot.metadatas[idx],
+                        'vector_id': idx
+                    }
+                    for sim, idx in hits
+                ]
+                keyword_results = self._keyword_results(snapshot, keywords, False, k*2, filters)
+                batch_results.append(
+                    self._combine_results(vector_results, keyword_results, k, vector_weight)
+                )
+            
+            logger.info(f"배치 하이브리드 검색 완료: {len(batch_results)}개 질의")
+            return batch_results
+            
+        except Exception as e:
+            logger.error(f"배치 하이브리드 검색 실패: {e}")
+            return [[] for _ in range(len(keywords_list))]
+    
+    def _fetch_collapsed(self,
+                         snapshot: _ReadSnapshot,
+                         k: int,
+                         fetch: Callable[[int], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """fetch(n)으로 가져온 후보에서 중복 그룹별 첫 결과만 k개까지 남김
+        
+        그룹 번호는 추가 시 LSH 테이블에서 정해지므로 여기서는 비교만 한다.
+        접은 뒤 k개가 안 되고 후보가 더 있으면 n을 늘려 다시 가져온다 (최대 k*8).
+        """
+        n = k * 2
+        while True:
+            candidates = fetch(n)
+            groups = snapshot.duplicate_index.group_of(r['vector_id'] for r in candidates)
+            results = collapse_results(candidates, groups, k)
+            if len(results) >= k or len(candidates) < n or n >= k * 8:
+                return results
+            n *= 2
+    
+    @staticmethod
+    def _combine_results(vector_results: List[Dict[str, Any]],
+                         keyword_results: List[Dict[str, Any]],
+                         k: int,
+                         vector_weight: float) -> List[Dict[str, Any]]:
+        """벡터/키워드 결과 통합 및 점수 조합
+        
+        결과에 'shard'가 있으면 (샤드, vector_id) 단위로 합친다 (샤드별 ID가 겹치므로).
+        """
+        combined_results = {}
+        
+        # 벡터 검색 결과 처리
+        for result in vector_results:
+            vector_id = int(result['vector_id'])
+            key = (result.get('shard'), vector_id)
+            combined_results[key] = {
+                'vector_score': result['similarity'] * vector_weight,
+                'keyword_score': 0.0,
+                'document': result['document'],
+                'metadata': result['metadata'],
+                'vector_id': vector_id,
+                'matched_keywords': []
+            }
+            if 'shard' in result:
+                combined_results[key]['shard'] = result['shard']
+        
+        # 키워드 검색 결과 처리
+        for result in keyword_results:
+            vector_id = result['vector_id']
+            key = (result.get('shard'), vector_id)
+            keyword_score = result['match_score'] * (1 - vector_weight)
+            
+            if key in combined_results:
+                combined_results[key]['keyword_score'] = keyword_score
+                combined_results[key]['matched_keywords'] = result['matched_keywords']
+            else:
+                combined_results[key] = {
+                    'vector_score': 0.0,
+                    'keyword_score': keyword_score,
+                    'document': result['document'],
+                    'metadata': result['metadata'],
+                    'vector_id': vector_id,
+                    'matched_keywords': result['matched_keywords']
+                }
+                if 'shard' in result:
+                    combined_results[key]['shard'] = result['shard']
+        
+        # 최종 점수 계산 및 정렬
+        final_results = []
+        for result in combined_results.values():
+            result['final_score'] = result['vector_score'] + result['keyword_score']
+            final_results.append(result)
+        
+        final_results.sort(key=lambda x: x['final_score'], reverse=True)
+        
+        # 상위 k개 결과만 반환
+        return final_results[:k]
+    
     def save_database(self, filename_prefix: str = "vector_db"):
-        """데이터베이스 저장"""
+        """데이터베이스 저장 (전체 스냅샷, 새 버전 디렉토리에 기록 후 매니페스트로 전환)
+        
+        세그먼트 로그가 같은 prefix로 열려 있으면 스냅샷에 병합된 세그먼트를 정리한다.
+        """
         try:
-            # FAISS 인덱스 저장
-            index_path = os.path.join(self.storage_dir, f"{filename_prefix}.index")
-            faiss.write_index(self.index, index_path)
-            
-            # 메타데이터와 문서 저장
-            data_path = os.path.join(self.storage_dir, f"{filename_prefix}.pkl")
-            with open(data_path, 'wb') as f:
-                pickle.dump({
-                    'metadatas': self.metadatas,
-                    'documents': self.documents,
-                    'dimension': self.dimension,
-                    'index_type': self.index_type,
-                    'search_stats': self.search_stats
-                }, f)
-            
-            # 정보 파일 저장
-            info_path = os.path.join(self.storage_dir, f"{filename_prefix}_info.json")
-            with open(info_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'total_documents': len(self.documents),
-                    'dimension': self.dimension,
-                    'index_type': self.index_type,
-                    'created_at': datetime.now().isoformat(),
-                    'search_stats': self.search_stats
-                }, f, ensure_ascii=False, indent=2)
+            with self._save_lock, self._write_lock:
+                merged_seq = self.segment_log.last_seq if (
+                    self.segment_log is not None and self.segment_prefix == filename_prefix
+                ) else self._merged_seq
+                self._write_snapshot(filename_prefix, merged_seq)
+                
+                # 스냅샷에 병합된 세그먼트 정리
+                self._merged_seq = merged_seq
+                self._merged_rows = len(self.documents)
+                if self.segment_log is not None and self.segment_prefix == filename_prefix:
+                    self.segment_log.truncate(merged_seq)
             
             logger.info(f"데이터베이스 저장 완료: {filename_prefix}")
             return True
@@ -277,45 +1421,351 @@ class VectorDatabase:
             logger.error(f"데이터베이스 저장 실패: {e}")
             return False
     
-    def load_database(self, filename_prefix: str = "vector_db") -> bool:
-        """데이터베이스 로드"""
+    @staticmethod
+    def read_manifest(storage_dir: str, filename_prefix: str) -> Optional[Dict[str, Any]]:
+        """현재 스냅샷 버전을 가리키는 매니페스트 (없으면 None, storage_dir에 바로 저장된 이전 형식)"""
+        manifest_path = os.path.join(storage_dir, f"{filename_prefix}_manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    @classmethod
+    def snapshot_dir(cls, storage_dir: str, filename_prefix: str) -> str:
+        """스냅샷 파일들이 있는 디렉토리"""
+        manifest = cls.read_manifest(storage_dir, filename_prefix)
+        if manifest is None:
+            return storage_dir
+        return os.path.join(storage_dir, manifest['directory'])
+    
+    @classmethod
+    def read_info(cls, storage_dir: str, filename_prefix: str) -> Optional[Dict[str, Any]]:
+        """저장된 스냅샷의 정보 파일 (차원, 모델, 인덱스 종류 등, 없으면 None)"""
+        info_path = os.path.join(cls.snapshot_dir(storage_dir, filename_prefix),
+                                 f"{filename_prefix}_info.json")
+        if not os.path.exists(info_path):
+            return None
+        with open(info_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _write_snapshot(self, filename_prefix: str, merged_seq: int):
+        """현재 스냅샷을 새 버전 디렉토리(<prefix>_vNNNNNN)에 기록한 뒤 매니페스트를 교체
+        
+        파일들을 모두 기록하고 fsync한 다음 매니페스트를 한 번에 교체하므로,
+        중간에 중단되어도 로드는 이전 버전을 그대로 읽는다.
+        """
+        # 학습된 인덱스는 대기 벡터를 병합하고 삭제된 행을 제거한 뒤 저장
+        self._merge_pending()
+        self._purge_deleted()
+        snapshot = self._snapshot
+        
+        manifest = self.read_manifest(self.storage_dir, filename_prefix)
+        version = manifest['version'] + 1 if manifest is not None else 1
+        directory = f"{filename_prefix}_v{version:06d}"
+        base_dir = os.path.join(self.storage_dir, directory)
+        if os.path.exists(base_dir):
+            # 매니페스트로 전환되기 전에 중단된 기록
+            shutil.rmtree(base_dir)
+        os.makedirs(base_dir)
+        
+        def path(suffix: str) -> str:
+            return os.path.join(base_dir, f"{filename_prefix}{suffix}")
+        
+        # 메타데이터와 문서 저장 (UTF-8 blob + 컬럼 파일, 삭제된 행은 비움)
+        DocumentStore.save(path("_store"), snapshot.documents, snapshot.metadatas,
+                           deleted=snapshot.deleted)
+        
+        # FAISS 인덱스 저장
+        faiss.write_index(snapshot.index, path(".index"))
+        
+        # 재순위화용 float32 원본 벡터 저장 (양자화 인덱스)
+        if snapshot.raw_vectors is not None:
+            snapshot.raw_vectors.save(path("_vectors.npy"))
+        
+        # 학습 대기 벡터 저장 (IVF 계열 학습 전 상태)
+        if snapshot.pending:
+            np.save(path("_pending.npy"), snapshot.pending_matrix())
+        
+        # 삭제 표시 저장 (행 번호는 유지되므로 마스크로 보관)
+        if snapshot.deleted is not None:
+            np.save(path("_deleted.npy"), snapshot.deleted)
+        
+        # 키워드 역색인 저장
+        snapshot.keyword_index.save(path("_keywords.npz"))
+        snapshot.fuzzy_index.save(path("_fuzzy.npz"))
+        snapshot.bm25.save(path("_bm25.npz"))
+        snapshot.duplicate_index.save(path("_duplicates.npz"))
+        
+        # 정보 파일 저장
+        with open(path("_info.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'total_documents': len(snapshot.documents),
+                'dimension': self.dimension,
+                'embedding_model': self.embedding_model,
+                'index_type': self.index_type,
+                'ann_type': self.ann_type,
+                'index_params': self.index_params,
+                'search_params': self.search_params,
+                'is_trained': bool(snapshot.index.is_trained),
+                'index_rows': snapshot.index_rows,
+                'purged_rows': self._purged_rows,
+                'segment_seq': merged_seq,
+                'created_at': datetime.now().isoformat(),
+                'search_stats': self.search_stats
+            }, f, ensure_ascii=False, indent=2)
+        
+        # 기록한 파일을 디스크에 내린 뒤 매니페스트 교체로 전환
+        _fsync_tree(base_dir)
+        manifest_path = os.path.join(self.storage_dir, f"{filename_prefix}_manifest.json")
+        with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': version,
+                'directory': directory,
+                'segment_seq': merged_seq,
+                'created_at': datetime.now().isoformat()
+            }, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        
+        self._remove_old_versions(filename_prefix, version)
+    
+    def _remove_old_versions(self, filename_prefix: str, version: int):
+        """두 버전 이전의 스냅샷 삭제
+        
+        직전 버전은 매니페스트를 막 읽은 다른 프로세스가 열 수 있도록 남긴다.
+        매니페스트 이전 형식(storage_dir에 바로 저장된 파일)은 버전 0으로 취급한다.
+        """
+        pattern = re.compile(rf"{re.escape(filename_prefix)}_v(\d+)$")
+        stale = []
+        for name in os.listdir(self.storage_dir):
+            match = pattern.match(name)
+            if match and int(match.group(1)) < version - 1:
+                stale.append(os.path.join(self.storage_dir, name))
+        if version >= 2:
+            stale.extend(os.path.join(self.storage_dir, f"{filename_prefix}{suffix}")
+                         for suffix in LEGACY_SNAPSHOT_FILES)
+        
+        for stale_path in stale:
+            try:
+                if os.path.isdir(stale_path):
+                    shutil.rmtree(stale_path)
+                elif os.path.exists(stale_path):
+                    os.remove(stale_path)
+            except OSError as e:
+                # mmap으로 열려 있어 지울 수 없는 경우 (Windows) 다음 저장 때 다시 시도
+                logger.warning(f"이전 스냅샷 삭제 실패: {stale_path} - {e}")
+    
+    def load_database(self,
+                      filename_prefix: str = "vector_db",
+                      mmap_index: Optional[bool] = None) -> bool:
+        """데이터베이스 로드
+        
+        모든 구성 요소를 새 객체로 읽은 뒤 한 번에 스냅샷을 교체하므로,
+        로드 중에도 검색은 이전 스냅샷으로 계속 처리된다.
+        단계별 소요 시간은 get_stats()의 load_timings로 확인할 수 있다.
+        
+        Args:
+            mmap_index: 인덱스를 읽기 전용 mmap으로 열지 여부 (None이면 생성 시 설정)
+        """
+        if mmap_index is not None:
+            self.mmap_index = mmap_index
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        mark = started
+        
+        def lap(name: str):
+            nonlocal mark
+            now = time.perf_counter()
+            timings[name] = round(now - mark, 4)
+            mark = now
+        
         try:
-            # FAISS 인덱스 로드
-            index_path = os.path.join(self.storage_dir, f"{filename_prefix}.index")
-            if os.path.exists(index_path):
-                self.index = faiss.read_index(index_path)
-            else:
-                logger.warning("인덱스 파일을 찾을 수 없음")
-                return False
-            
-            # 메타데이터와 문서 로드
-            data_path = os.path.join(self.storage_dir, f"{filename_prefix}.pkl")
-            if os.path.exists(data_path):
-                with open(data_path, 'rb') as f:
-                    data = pickle.load(f)
-                    
-                self.metadatas = data['metadatas']
-                self.documents = data['documents']
-                self.search_stats = data.get('search_stats', {'total_searches': 0})
-            else:
-                logger.warning("데이터 파일을 찾을 수 없음")
-                return False
+            with self._write_lock:
+                # 매니페스트가 가리키는 버전 디렉토리 (없으면 storage_dir의 이전 형식)
+                base_dir = self.snapshot_dir(self.storage_dir, filename_prefix)
+                
+                # 인덱스 종류와 파라미터 복원 (정보 파일이 없는 이전 DB는 flat)
+                info = None
+                info_path = os.path.join(base_dir, f"{filename_prefix}_info.json")
+                if os.path.exists(info_path):
+                    with open(info_path, 'r', encoding='utf-8') as f:
+                        info = json.load(f)
+                    # 다른 모델의 임베딩과 섞이지 않도록 모델 식별자 확인
+                    stored_model = info.get('embedding_model')
+                    if stored_model and self.embedding_model and stored_model != self.embedding_model:
+                        logger.error(f"임베딩 모델 불일치: DB {stored_model} != 현재 {self.embedding_model}")
+                        return False
+                    self.embedding_model = self.embedding_model or stored_model
+                    self.ann_type = info.get('ann_type', 'flat')
+                    self.index_params = {**DEFAULT_INDEX_PARAMS[self.ann_type],
+                                         **info.get('index_params', {})}
+                    self.search_params = {**DEFAULT_SEARCH_PARAMS,
+                                          **info.get('search_params', {})}
+                
+                # FAISS 인덱스 로드
+                index_path = os.path.join(base_dir, f"{filename_prefix}.index")
+                if os.path.exists(index_path):
+                    if self.mmap_index:
+                        # 페이지 캐시를 워커 프로세스끼리 공유 (복사 없이 필요한 페이지만 적재)
+                        index = faiss.read_index(index_path, MMAP_IO_FLAGS)
+                    else:
+                        index = faiss.read_index(index_path)
+                    self._apply_search_params(index)
+                    lap('index')
+                else:
+                    logger.warning("인덱스 파일을 찾을 수 없음")
+                    return False
+                
+                # 학습 대기 벡터 로드
+                pending_path = os.path.join(base_dir, f"{filename_prefix}_pending.npy")
+                pending = ()
+                if os.path.exists(pending_path):
+                    pending = (np.load(pending_path),)
+                index_rows = info.get('index_rows', index.ntotal) if info is not None else index.ntotal
+                n_vectors = index_rows + sum(len(e) for e in pending)
+                
+                # 삭제 표시 로드
+                deleted_path = os.path.join(base_dir, f"{filename_prefix}_deleted.npy")
+                deleted = np.load(deleted_path) if os.path.exists(deleted_path) else None
+                
+                # 재순위화용 원본 벡터 (mmap, 없으면 재순위화 없이 검색)
+                raw_vectors = None
+                vectors_path = os.path.join(base_dir, f"{filename_prefix}_vectors.npy")
+                if self.ann_type in QUANTIZED_TYPES and os.path.exists(vectors_path):
+                    raw_vectors = VectorColumn.open(vectors_path, self.dimension)
+                    if len(raw_vectors) != n_vectors:
+                        logger.warning("원본 벡터 수가 인덱스와 달라 재순위화 비활성화")
+                        raw_vectors = None
+                lap('vectors')
+                
+                # 메타데이터와 문서 로드 (mmap, 조회 시점에만 디코딩)
+                store_dir = os.path.join(base_dir, f"{filename_prefix}_store")
+                data_path = os.path.join(base_dir, f"{filename_prefix}.pkl")
+                search_stats = self.search_stats
+                if DocumentStore.exists(store_dir):
+                    documents, metadatas = DocumentStore.open(store_dir)
+                    if info is not None:
+                        search_stats = info.get('search_stats', search_stats)
+                elif os.path.exists(data_path):
+                    # 이전 형식 (pickle) 호환
+                    with open(data_path, 'rb') as f:
+                        data = pickle.load(f)
+                        
+                    metadatas = MetadataTable(data['metadatas'])
+                    documents = TextColumn(data['documents'])
+                    search_stats = data.get('search_stats', search_stats)
+                else:
+                    logger.warning("데이터 파일을 찾을 수 없음")
+                    return False
+                lap('documents')
+                
+                # 키워드 역색인 로드 (없으면 문서로부터 재구성)
+                keyword_path = os.path.join(base_dir, f"{filename_prefix}_keywords.npz")
+                keyword_index = KeywordIndex()
+                if (not keyword_index.load(keyword_path)
+                        or keyword_index.num_docs != len(documents)):
+                    logger.info("키워드 색인을 문서로부터 재구성")
+                    keyword_index = KeywordIndex()
+                    keyword_index.add_documents(documents)
+                lap('keyword_index')
+                
+                # 자모 n-gram 색인 로드 (없으면 문서로부터 재구성)
+                fuzzy_path = os.path.join(base_dir, f"{filename_prefix}_fuzzy.npz")
+                fuzzy_index = FuzzyIndex()
+                if not fuzzy_index.load(fuzzy_path) or fuzzy_index.num_docs != len(documents):
+                    logger.info("자모 색인을 문서로부터 재구성")
+                    fuzzy_index = FuzzyIndex()
+                    fuzzy_index.add_documents(documents)
+                lap('fuzzy_index')
+                
+                # BM25 필드 통계 로드 (없으면 재계산)
+                bm25_path = os.path.join(base_dir, f"{filename_prefix}_bm25.npz")
+                bm25 = BM25Ranker()
+                if not bm25.load(bm25_path) or bm25.num_docs != len(documents):
+                    logger.info("BM25 통계를 문서로부터 재계산")
+                    bm25 = BM25Ranker()
+                    bm25.add_documents(documents, metadatas)
+                lap('bm25')
+                
+                # 중복 청크 LSH 테이블 로드 (없으면 메타데이터의 서명으로 재구성)
+                duplicates_path = os.path.join(base_dir, f"{filename_prefix}_duplicates.npz")
+                duplicate_index = DuplicateIndex()
+                if not duplicate_index.load(duplicates_path) or len(duplicate_index) != len(documents):
+                    logger.info("중복 청크 테이블을 문서로부터 재구성")
+                    duplicate_index = DuplicateIndex()
+                    duplicate_index.add(
+                        metadata['simhash'] if 'simhash' in metadata else simhash(document)
+                        for metadata, document in zip(metadatas, documents)
+                    )
+                    if deleted is not None:
+                        duplicate_index = duplicate_index.remove_documents(deleted)
+                lap('duplicates')
+                
+                # 새 스냅샷 발행
+                self._snapshot = _ReadSnapshot(
+                    ann_type=self.ann_type,
+                    index=index,
+                    index_rows=index_rows,
+                    pending=pending,
+                    raw_vectors=raw_vectors,
+                    deleted=deleted,
+                    documents=documents,
+                    metadatas=metadatas,
+                    keyword_index=keyword_index,
+                    fuzzy_index=fuzzy_index,
+                    bm25=bm25,
+                    duplicate_index=duplicate_index,
+                    version=self._snapshot.version + 1
+                )
+                self._stats = _SearchStats(**search_stats)
+                self._purged_rows = info.get('purged_rows', 0) if info is not None else 0
+                self._mapped_index = index if self.mmap_index else None
+                
+                # 스냅샷 이후 커밋된 세그먼트 재적용
+                self._merged_seq = info.get('segment_seq', 0) if info is not None else 0
+                self._merged_rows = len(documents)
+                self._replayed_seq = self._replay_segments(filename_prefix, self._merged_seq)
+                lap('segments')
+                timings['total'] = round(time.perf_counter() - started, 4)
+                self._load_timings = timings
             
-            logger.info(f"데이터베이스 로드 완료: {len(self.documents)}개 문서")
+            logger.info(f"데이터베이스 로드 완료: {len(self.documents)}개 문서 "
+                        f"({timings['total']:.2f}초, mmap: {self.mmap_index})")
             return True
             
         except Exception as e:
             logger.error(f"데이터베이스 로드 실패: {e}")
             return False
     
+    def _code_size(self, index) -> int:
+        """인덱스에 저장되는 벡터당 바이트 수 (양자화 코드 크기)"""
+        index = self._base_index(index)
+        if hasattr(index, 'storage'):
+            # HNSW: 그래프와 별도로 보관되는 벡터 저장소
+            index = faiss.downcast_index(index.storage)
+        return int(index.code_size)
+    
     def get_stats(self) -> Dict[str, Any]:
         """데이터베이스 통계 정보"""
+        snapshot = self._snapshot
+        search_stats = self._stats.to_dict()
         return {
-            'total_documents': len(self.documents),
+            'total_documents': snapshot.size - snapshot.num_deleted(),
             'dimension': self.dimension,
+            'embedding_model': self.embedding_model,
             'index_type': self.index_type,
-            'total_searches': self.search_stats['total_searches'],
-            'last_search': self.search_stats['last_search']
+            'ann_type': snapshot.ann_type,
+            'search_params': dict(self.search_params),
+            'bytes_per_vector': self._code_size(snapshot.index),
+            'pending_vectors': snapshot.num_vectors - snapshot.index_rows,
+            'deleted_documents': snapshot.num_deleted(),
+            'near_duplicates': snapshot.duplicate_index.num_duplicates(),
+            'index_mmap': snapshot.index is self._mapped_index,
+            'load_timings': dict(self._load_timings),
+            'query_cache': self.query_cache.stats(),
+            'total_searches': search_stats['total_searches'],
+            'last_search': search_stats['last_search']
         }
 
 
@@ -358,7 +1808,7 @@ def main():
     
     print(f"\n키워드 검색 결과: {len(keyword_results)}개")
     for i, result in enumerate(keyword_results):
-        print(f"  {i+1}. 매칭점수: {result['match_score']:.2f}")
+        print(f"  {i+1}. 매칭점수: {result['match_score']:.2f} (BM25: {result['bm25_score']:.3f})")
         print(f"      키워드: {result['matched_keywords']}")
     
     # 저장/로드 테스트